@@ -1,46 +1,101 @@
 from langgraph.graph import StateGraph, END
+from langgraph.types import Send
+from langchain_core.runnables import RunnableLambda
 from agent.state import AgentState
-from agent.nodes import retrieve_node, plan_node, generate_node, validate_node
+from core.tracing import traced
+from core.checkpointer import session_checkpointer
+from agent.nodes import (
+    classify_node, retrieve_node, compress_node, plan_node, generate_node, validate_node,
+    aclassify_node, aretrieve_node, acompress_node, aplan_node, agenerate_node, avalidate_node,
+    answer_node, aanswer_node,
+    generate_language_node, agenerate_language_node, merge_languages_node,
+    requested_languages, MAX_VALIDATION_ATTEMPTS,
+)
 
 # definition
 workflow = StateGraph(AgentState)
 
+def node(name: str, func, afunc=None) -> RunnableLambda:
+    """Graph node, traced: its duration and the LLM calls / retrieval stages inside it are recorded per request."""
+    trace = traced("node", name, stage=True)
+    return RunnableLambda(trace(func), afunc=trace(afunc) if afunc else None, name=name)
+
 # Add Nodes
-workflow.add_node("retrieve", retrieve_node)
-workflow.add_node("plan", plan_node)
-workflow.add_node("generate", generate_node)
-workflow.add_node("validate", validate_node)
+# Each node has a sync implementation (invoke/stream, e.g. the CLI) and an
+# async one (ainvoke/astream, used by the API so the event loop never blocks).
+workflow.add_node("classify", node("classify", classify_node, aclassify_node))
+workflow.add_node("retrieve", node("retrieve", retrieve_node, aretrieve_node))
+workflow.add_node("compress", node("compress", compress_node, acompress_node))
+workflow.add_node("answer", node("answer", answer_node, aanswer_node))
+workflow.add_node("plan", node("plan", plan_node, aplan_node))
+workflow.add_node("generate", node("generate", generate_node, agenerate_node))
+workflow.add_node("validate", node("validate", validate_node, avalidate_node))
+# Multi-language requests: one generate/validate branch per language, run in parallel
+workflow.add_node("generate_language", node("generate_language", generate_language_node, agenerate_language_node))
+workflow.add_node("merge_languages", node("merge_languages", merge_languages_node))
 
-from typing import Literal
+from typing import List, Literal, Union
 
 # ...
 
 # Conditional Logic
-def route_after_plan(state: AgentState) -> Literal["generate", END]:
+def route_after_compress(state: AgentState) -> Literal["plan", "answer"]:
+    # Lookups/explanations skip planning and code generation
+    if state.get("intent") in ("lookup", "explain"):
+        return "answer"
+    return "plan"
+
+def route_after_plan(state: AgentState) -> Union[Literal["generate", END], List[Send]]:
     plan = state["plan"]
+    cut = state.get("cut_stages") or []
+    if "plan" in cut or "generate" in cut:
+        # Out of time: return the best plan so far
+        return END
     if "STATUS: INCOMPLETE" in plan:
         return END
+    languages = requested_languages(state["messages"][-1].content)
+    if len(languages) > 1:
+        print(f"🔀 Generating {', '.join(languages)} in parallel")
+        return [Send("generate_language", {**state, "language": language}) for language in languages]
     return "generate"
 
+def route_after_generate(state: AgentState) -> Literal["validate", END]:
+    if "generate" in (state.get("cut_stages") or []):
+        return END
+    return "validate"
+
 def route_after_validate(state: AgentState) -> Literal["generate", END]:
     feedback = state.get("feedback", "PASS")
     attempts = state.get("attempt_count", 0)
+    if "refinement" in (state.get("cut_stages") or []):
+        print("⏱️ No time left for a rewrite. Returning best effort.")
+        return END
     
     # If passed or retried too many times, stop
-    if feedback == "PASS" or attempts >= 3:
-        if attempts >= 3:
+    if feedback == "PASS" or attempts >= MAX_VALIDATION_ATTEMPTS:
+        if attempts >= MAX_VALIDATION_ATTEMPTS:
             print("⚠️ Max retries reached. Returning best effort.")
         return END
         
     return "generate"
 
 # Add Edges
-# START -> Retrieve -> Plan -> (Decision) -> Generate -> Validate -> (Loop or End)
-workflow.set_entry_point("retrieve")
-workflow.add_edge("retrieve", "plan")
+# START -> Classify -> Retrieve -> Compress -> (Intent) -> Plan -> (Decision) -> Generate -> Validate -> (Loop or End)
+#                                                    |                 \-> Generate Language (xN, parallel) -> Merge -> End
+#                                                    \-> Answer -> End (lookup / explain)
+workflow.set_entry_point("classify")
+workflow.add_edge("classify", "retrieve")
+workflow.add_edge("retrieve", "compress")
+workflow.add_conditional_edges("compress", route_after_compress)
+workflow.add_edge("answer", END)
 workflow.add_conditional_edges("plan", route_after_plan)
-workflow.add_edge("generate", "validate")
+workflow.add_conditional_edges("generate", route_after_generate)
 workflow.add_conditional_edges("validate", route_after_validate)
+workflow.add_edge("generate_language", "merge_languages")
+workflow.add_edge("merge_languages", END)
 
 # Compile
 app_graph = workflow.compile()
+# Session chats resume the stored state of their session (thread_id = session id, see core/checkpointer.py):
+# each turn only adds the new messages, and the context retrieved in earlier turns is kept.
+session_graph = workflow.compile(checkpointer=session_checkpointer)
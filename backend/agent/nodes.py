@@ -1,14 +1,31 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+import hashlib
 from langchain_core.messages import SystemMessage, HumanMessage
 # from core.vector_store import store as vector_store # Replaced by Hybrid
 from core.llm_client import LLMFactory
 from agent.state import AgentState
 from core.resilience import with_resilience
+from core.tracing import span as trace_span, record_usage, record_cache, traced
+
+# Tokens of LLM calls tagged with this are streamed to the client (see api/streaming.py)
+STREAM_TAG = "stream"
+
+def _model_name(llm) -> str:
+    llm = getattr(llm, "bound", llm) # Unwrap .with_config()
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
 
 @with_resilience(max_retries=3)
-def invoke_llm_safe(llm, messages):
+def _invoke_llm(llm, messages, span):
+    span.attrs["retries"] = span.attrs.get("retries", -1) + 1
     return llm.invoke(messages)
 
+def invoke_llm_safe(llm, messages, deadline: Optional[float] = None):
+    """LLM call with retries and circuit breaker, traced (duration, tokens, retries)."""
+    with trace_span("llm", _model_name(llm)) as span:
+        response = _invoke_llm(llm, messages, span, deadline=deadline)
+        record_usage(span, messages, response)
+        return response
+
 # --- SHIM for LangChain compatibility with recent duckduckgo-search ---
 try:
     import duckduckgo_search
@@ -24,16 +41,313 @@ from langchain_community.tools import DuckDuckGoSearchRun
 # Initialize tools
 # vector_store is imported as singleton
 web_search = DuckDuckGoSearchRun() # Web Search Tool
-reasoning_llm = LLMFactory.create_llm("reasoning")
-coding_llm = LLMFactory.create_llm("coding")
-chat_llm = LLMFactory.create_llm("chat")
+# One LLM per task, each routed to its own model tier (see core/model_router.py)
+reasoning_llm = LLMFactory.create_llm("plan")
+coding_llm = LLMFactory.create_llm("generate")
+chat_llm = LLMFactory.create_llm("answer")
+search_query_llm = LLMFactory.create_llm("search_query")
+summary_llm = LLMFactory.create_llm("summarize")
+review_llm = LLMFactory.create_llm("validate")
 
 from core.hybrid import hybrid_retriever
+from core.sessions import session_manager
 
 
 import re
+import time
+import asyncio
+import contextvars
 import requests
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from core.concurrency import run_blocking, blocking_executor
+from core.scraper import (
+    scrape_client, page_cache, normalize_url, read_page_text, aread_page_text, CachedPage,
+    SCRAPE_HEADERS, SCRAPE_TIMEOUT, SCRAPE_CHUNK_SIZE, SCRAPE_INDEX_PAGES
+)
+from core.vector_store import store as vector_store
+from core.text_splitter import APIDocSplitter
+from core.cache import web_search_cache, search_query_cache, normalize_query
+from core.context_packer import context_packer, budget_for, content_hash, dedupe_snippets, estimate_tokens
+from core.compression import compressor, CONTEXT_COMPRESSION
+from core.code_checks import code_checker, llm_review_required, validation_stats
+from core.intent_router import intent_router, INTENT_ROUTER, CODE_INTENT
+from core.followup import followup_detector, FollowUp, FOLLOWUP_REUSE
+from core.semantic_cache import semantic_llm_cache
+from core.deadline import time_for, bounded, PLAN_RESERVE_SECONDS
+from core.exceptions import DeadlineExceededError
+
+page_splitter = APIDocSplitter()
+
+@with_resilience(max_retries=3)
+async def _ainvoke_llm(llm, messages, span):
+    span.attrs["retries"] = span.attrs.get("retries", -1) + 1
+    return await llm.ainvoke(messages)
+
+async def ainvoke_llm_safe(llm, messages, deadline: Optional[float] = None):
+    """Async variant of invoke_llm_safe."""
+    with trace_span("llm", _model_name(llm)) as span:
+        response = await _ainvoke_llm(llm, messages, span, deadline=deadline)
+        record_usage(span, messages, response)
+        return response
+
+# Per-task deadlines for the concurrent retrieval fan-out (seconds)
+FALLBACK_SEARCH_TIMEOUT = 10
+LOCAL_SEARCH_TIMEOUT = 20
+
+# Ranking of context snippets for the context packer.
+# Hybrid Search results carry their fused (RRF) score, which stays well below these.
+URL_DOC_SCORE = 1.0       # Pages the user linked explicitly
+FALLBACK_DOC_SCORE = 0.5  # Web search standing in for a linked page
+WEB_DOC_SCORE = 0.01      # General web search (only used when nothing else was found)
+
+def _cut(*stages: str) -> Dict[str, Any]:
+    """State update recording the stages cut to meet the request deadline."""
+    return {"cut_stages": list(stages)} if stages else {}
+
+def _is_search_engine_url(url: str) -> bool:
+    return "google.com" in url or "bing.com" in url or "search.yahoo" in url
+
+def _usable_page_text(text: Optional[str]) -> Optional[str]:
+    """Returns the extracted page text, or None if the content is unusable."""
+    raw_text = text or ""
+    # Stricter check for SPA/Blocked content
+    is_too_short = len(raw_text) < 1000
+    has_js_warning = "enable javascript" in raw_text.lower() or "javascript is required" in raw_text.lower()
+    
+    if is_too_short or has_js_warning:
+        print(f"   ⚠️ Content unusable ({len(raw_text)} chars, JS warning={has_js_warning}). Triggering fallback.")
+        return None
+
+    print(f"   ✅ Scrape Success ({len(raw_text)} chars)")
+    return raw_text
+
+def _page_doc(url: str, text: str) -> str:
+    return f"Source URL: {url}\nContent:\n{text}"
+
+def _index_page(url: str, text: str):
+    """Chunks a scraped page into the vector store so later questions hit local retrieval."""
+    try:
+        key = normalize_url(url)
+        chunks = page_splitter.split_text(text)
+        url_hash = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        # Replace the previous version of the page
+        vector_store.delete_documents(where={"source": key})
+        vector_store.add_documents(
+            documents=chunks,
+            metadatas=[{"source": key, "type": "web"} for _ in chunks],
+            ids=[f"web-{url_hash}-{i}" for i in range(len(chunks))]
+        )
+        # Batched: a burst of scraped pages triggers one BM25 rebuild
+        hybrid_retriever.request_sync()
+    except Exception as e:
+        print(f"⚠️ Failed to index scraped page {url}: {e}")
+
+def _handle_scrape_response(url: str, status_code: int, text: Optional[str], headers, cached: Optional[CachedPage]) -> Optional[str]:
+    """Turns a (possibly conditional) response into a context document and updates the page cache."""
+    if status_code == 304 and cached:
+        print("   ✅ Not Modified (cached copy revalidated)")
+        page_cache.refresh(url, headers)
+        return _page_doc(url, cached.text)
+    if status_code != 200:
+        print(f"   ❌ Scrape Failed (Status {status_code})")
+        return None
+
+    text = _usable_page_text(text)
+    if not text:
+        return None
+    changed = page_cache.store(url, text, headers)
+    if changed and SCRAPE_INDEX_PAGES:
+        # Off the request path; the answer does not wait for embeddings
+        blocking_executor.submit(_index_page, url, text)
+    return _page_doc(url, text)
+
+def _fresh_cached_page(url: str) -> tuple:
+    """Returns (cached entry or None, document if the entry can be used without a request)."""
+    cached = page_cache.get(url)
+    fresh = bool(cached and cached.is_fresh())
+    record_cache("scrape_page", fresh)
+    if fresh:
+        print(f"   ⚡ Scrape Cache Hit: {url}")
+        return cached, _page_doc(url, cached.text)
+    return cached, None
+
+def _fallback_query(url: str) -> str:
+    # Extract keywords from URL path
+    clean_url = url.split('?')[0] # Remove query params
+    last_segment = clean_url.rstrip('/').split('/')[-1]
+    
+    # If last segment is generic (index.html), take parent
+    if len(last_segment) < 5 or "index" in last_segment.lower():
+        last_segment = clean_url.rstrip('/').split('/')[-2]
+        
+    keywords = re.sub(r'[-_.]', ' ', last_segment)
+    # MORE TECHNICAL SEARCH QUERY
+    return f"{keywords} API endpoints code example"
+
+def _scrape_url(url: str) -> Optional[str]:
+    cached, doc = _fresh_cached_page(url)
+    if doc:
+        return doc
+    try:
+        print(f"   Downloading: {url}")
+        headers = {**SCRAPE_HEADERS, **(cached.revalidation_headers() if cached else {})}
+        # Streamed: the body is abandoned once enough text was read (or at SCRAPE_MAX_BYTES)
+        resp = requests.get(url, timeout=SCRAPE_TIMEOUT, headers=headers, stream=True)
+        try:
+            text = read_page_text(resp.headers, resp.iter_content(SCRAPE_CHUNK_SIZE)) if resp.status_code == 200 else None
+        finally:
+            resp.close()
+        return _handle_scrape_response(url, resp.status_code, text, resp.headers, cached)
+    except Exception as e:
+        print(f"   ❌ Scrape Exception: {e}")
+    return None
+
+async def _ascrape_url(url: str) -> Optional[str]:
+    cached, doc = await run_blocking(_fresh_cached_page, url)
+    if doc:
+        return doc
+    try:
+        print(f"   Downloading: {url}")
+        async with scrape_client.stream(url, headers=cached.revalidation_headers() if cached else None) as resp:
+            text = await aread_page_text(resp.headers, resp.aiter_bytes(SCRAPE_CHUNK_SIZE)) if resp.status_code == 200 else None
+        # The cache is SQLite; keep it off the event loop
+        return await run_blocking(_handle_scrape_response, url, resp.status_code, text, resp.headers, cached)
+    except Exception as e:
+        print(f"   ❌ Scrape Exception: {e}")
+    return None
+
+def _fallback_search(url: str) -> str:
+    """Smart search used when a URL could not be scraped."""
+    print(f"   🔄 Triggering Fallback Search for URL: {url}")
+    search_query = _fallback_query(url)
+    print(f"   🕵️ Fallback Query: '{search_query}'")
+    
+    try:
+        search_res = _web_search(search_query)
+        print("   ✅ Fallback Search Success")
+        return f"Fallback Search Result for {url}:\nQuery: {search_query}\nResult: {search_res}"
+    except Exception as e:
+        print(f"   ❌ Fallback Search Failed: {e}")
+        # If both failed, then log the error
+        return _failed_url_doc(url)
+
+def _failed_url_doc(url: str) -> str:
+    return f"Source URL: {url}\nError: Scrape and Fallback failed."
+
+@traced("retrieval", "scrape")
+def _resolve_url(url: str) -> Tuple[str, float]:
+    """Scrape, or fall back to a smart web search if the scrape failed. Returns (document, score)."""
+    doc = _scrape_url(url)
+    return (doc, URL_DOC_SCORE) if doc else (_fallback_search(url), FALLBACK_DOC_SCORE)
+
+@traced("retrieval", "scrape")
+async def _aresolve_url(url: str, deadline: Optional[float] = None) -> Tuple[str, float]:
+    """Async _resolve_url; the scrape and the fallback each get their own deadline (within the request's)."""
+    try:
+        doc = await asyncio.wait_for(_ascrape_url(url), timeout=bounded(SCRAPE_TIMEOUT, deadline, PLAN_RESERVE_SECONDS))
+    except asyncio.TimeoutError:
+        print(f"   ⏱️ Scrape deadline exceeded: {url}")
+        doc = None
+    if doc:
+        return doc, URL_DOC_SCORE
+    try:
+        timeout = bounded(FALLBACK_SEARCH_TIMEOUT, deadline, PLAN_RESERVE_SECONDS)
+        return await asyncio.wait_for(run_blocking(_fallback_search, url), timeout=timeout), FALLBACK_DOC_SCORE
+    except asyncio.TimeoutError:
+        print(f"   ⏱️ Fallback search deadline exceeded: {url}")
+        return _failed_url_doc(url), 0.0
+
+async def _ahybrid_search(query: str, deadline: Optional[float] = None, expand: bool = True):
+    try:
+        timeout = bounded(LOCAL_SEARCH_TIMEOUT, deadline, PLAN_RESERVE_SECONDS)
+        return await asyncio.wait_for(run_blocking(hybrid_retriever.search, query, n_results=3, expand=expand), timeout=timeout)
+    except asyncio.TimeoutError:
+        print("   ⏱️ Local search deadline exceeded")
+        return None
+
+def _scrape_targets(last_message: str) -> tuple:
+    """Returns (all URLs in the message, de-duplicated URLs worth scraping)."""
+    urls = re.findall(r'https?://[^\s]+', last_message)
+    if urls:
+        print(f"🔗 Found URLs: {urls}")
+    targets = []
+    for url in dict.fromkeys(urls):
+        # Filter out Search Engine URLs
+        if _is_search_engine_url(url):
+            print(f"   ⚠️ Skipping Search Engine URL: {url}")
+            continue
+        targets.append(url)
+    return urls, targets
+
+@traced("retrieval", "web_search")
+def _web_search(query: str) -> str:
+    """DuckDuckGo with a TTL cache; concurrent identical queries share one call."""
+    return web_search_cache.get_or_compute(normalize_query(query), lambda: web_search.invoke(query))
+
+def _search_query_prompt(last_message: str) -> str:
+    return f"""
+            Task: Convert the following user request into a CONCISE, KEYWORD-FOCUSED web search query.
+            User Request: {last_message}
+            Output ONLY the search query string.
+            """
+
+def _hybrid_documents(results) -> List[Tuple[str, float]]:
+    """(document, fused retrieval score) pairs of a Hybrid Search result."""
+    scored = []
+    if results and results['documents']:
+        score_lists = results.get('scores') or []
+        for i, doc_list in enumerate(results['documents']):
+            scores = score_lists[i] if i < len(score_lists) else []
+            for j, doc in enumerate(doc_list):
+                scored.append((doc, scores[j] if j < len(scores) else 0.0))
+    return scored
+
+def _merge_context(documents: List[str], scores: Dict[str, float], new_documents: List[Tuple[str, float]]) -> Dict[str, Any]:
+    """Appends new (document, score) pairs to the given context, deduped by content hash."""
+    scores = dict(scores)
+    for doc, score in new_documents:
+        key = content_hash(doc)
+        scores[key] = max(score, scores.get(key, 0.0))
+    return {"context": dedupe_snippets(documents + [doc for doc, _ in new_documents]), "context_scores": scores}
+
+def _assess_followup(state: AgentState, query: str) -> Optional[FollowUp]:
+    """Follow-up detection for session turns (a stateless request has no earlier topic)."""
+    if not FOLLOWUP_REUSE or not state.get("session_id"):
+        return None
+    return followup_detector.assess(
+        query, state.get("topic_embeddings") or [], state.get("topic_documents") or [], ignore=LANGUAGE_NAMES
+    )
+
+def _retrieval_base(state: AgentState, followup: Optional[FollowUp]) -> Tuple[List[str], Dict[str, float]]:
+    """
+    Context to add this turn's documents to. In a session: the topic's documents for a follow-up,
+    else nothing (the state's context of an earlier turn was compressed for that turn's question).
+    """
+    if followup is None:
+        return state.get("context") or [], state.get("context_scores") or {}
+    if not followup.is_follow_up:
+        return [], {}
+    documents = state.get("topic_documents") or []
+    searching = f", searching for: {', '.join(followup.new_terms)}" if followup.new_terms else ""
+    print(f"♻️ Follow-up (similarity {followup.similarity:.2f}): reusing {len(documents)} documents{searching}")
+    return documents, state.get("topic_scores") or {}
+
+def _retrieval_result(state: AgentState, followup: Optional[FollowUp], merged: Dict[str, Any], cut: List[str]) -> Dict[str, Any]:
+    topic = {}
+    if followup is not None:
+        topic = {
+            "topic_documents": merged["context"],
+            "topic_scores": merged["context_scores"],
+            "topic_embeddings": followup_detector.topic_embeddings(followup, state.get("topic_embeddings") or []),
+        }
+    return {**merged, **topic, **_cut(*cut)}
+
+def _packed_context(state: AgentState, llm) -> Tuple[str, int]:
+    """Context section for a prompt, within the model's token budget. Returns (text, dropped tokens)."""
+    packed = context_packer.pack(state.get("context") or [], budget_for(llm), scores=state.get("context_scores"))
+    if packed.dropped_tokens:
+        print(f"📦 Context packed: {packed.used_tokens} tokens used, {packed.dropped_tokens} dropped ({packed.dropped_snippets} snippets)")
+    return packed.text, packed.dropped_tokens
 
 def retrieve_node(state: AgentState) -> Dict[str, Any]:
     """
@@ -42,191 +356,377 @@ def retrieve_node(state: AgentState) -> Dict[str, Any]:
     1. Extract & Scrape URLs from user message.
     2. Query Vector DB (ChromaDB).
     3. Fallback to Web Search (DuckDuckGo).
+    Query expansion and the web search are skipped when the request deadline is close.
+    A follow-up in a session starts from the topic's documents and only searches for what they miss.
     """
     last_message = state["messages"][-1].content
-    existing_context = state.get("context", []) or [] # Ensure it's a list
+    deadline = state.get("deadline")
     new_documents = []
+    cut = []
     
     print(f"🔍 Analyzing Request: {last_message[:50]}...")
+    followup = _assess_followup(state, last_message)
+    base_documents, base_scores = _retrieval_base(state, followup)
+    reuse = followup is not None and followup.is_follow_up
+    search = not reuse or bool(followup.new_terms)
 
-    # A. Check for URLs
-    urls = re.findall(r'https?://[^\s]+', last_message)
-    if urls:
-        print(f"🔗 Found URLs: {urls}")
-        for url in urls:
-            # 1. Filter out Search Engine URLs
-            if "google.com" in url or "bing.com" in url or "search.yahoo" in url:
-                print(f"   ⚠️ Skipping Search Engine URL: {url}")
-                continue
+    # A + B. Scrape every URL (with fallback) while querying Hybrid Search (Vector + BM25).
+    # All tasks run concurrently and share one deadline.
+    urls, targets = _scrape_targets(last_message)
+    expand = not reuse and time_for(deadline, "expansion")
+    if not reuse and not expand:
+        cut.append("expansion")
+    url_deadline = bounded(SCRAPE_TIMEOUT + FALLBACK_SEARCH_TIMEOUT, deadline, PLAN_RESERVE_SECONDS)
+    search_deadline = bounded(LOCAL_SEARCH_TIMEOUT, deadline, PLAN_RESERVE_SECONDS)
+    start = time.monotonic()
+    pool = ThreadPoolExecutor(max_workers=len(targets) + 1, thread_name_prefix="retrieve")
+    try:
+        # Each task runs in a copy of this context (request trace, current node)
+        url_futures = [pool.submit(contextvars.copy_context().run, _resolve_url, url) for url in targets]
+        search_future = pool.submit(contextvars.copy_context().run, hybrid_retriever.search, last_message, n_results=3, expand=expand) if search else None
 
-            scraped_content = ""
+        for url, future in zip(targets, url_futures):
             try:
-                print(f"   Downloading: {url}")
-                # 2. Robust Scraper (Impersonate Googlebot for better SPA access)
-                headers = {"User-Agent": "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"}
-                resp = requests.get(url, timeout=15, headers=headers)
-                
-                if resp.status_code == 200:
-                    soup = BeautifulSoup(resp.content, 'html.parser')
-                    # Remove noise
-                    for script in soup(["script", "style", "nav", "footer", "header", "iframe", "noscript"]):
-                        script.decompose()
-                    
-                    text = soup.get_text(separator=' ')
-                    # Collapse whitespace
-                    raw_text = " ".join(text.split())
-                    
-                    # Stricter check for SPA/Blocked content
-                    is_too_short = len(raw_text) < 1000
-                    has_js_warning = "enable javascript" in raw_text.lower() or "javascript is required" in raw_text.lower()
-                    
-                    if not is_too_short and not has_js_warning:
-                         scraped_content = raw_text[:15000] # Increased limit
-                         new_documents.append(f"Source URL: {url}\nContent:\n{scraped_content}")
-                         print(f"   ✅ Scrape Success ({len(scraped_content)} chars)")
-                    else:
-                        print(f"   ⚠️ Content unusable ({len(raw_text)} chars, JS warning={has_js_warning}). Triggering fallback.")
-                        scraped_content = "" # Force fallback
-                else:
-                    print(f"   ❌ Scrape Failed (Status {resp.status_code})")
-
-            except Exception as e:
-                print(f"   ❌ Scrape Exception: {e}")
-                # Don't add error to docs immediately if we plan to fallback?
-                # new_documents.append(f"Source URL: {url}\nError: {str(e)}") 
-                # Better to try fallback first.
-
-            # 3. Fallback: Smart Search if Scrape Failed (runs even if Exception occurred)
-            if not scraped_content:
-                print(f"   🔄 Triggering Fallback Search for URL: {url}")
-                
-                # Extract keywords from URL path
-                clean_url = url.split('?')[0] # Remove query params
-                last_segment = clean_url.rstrip('/').split('/')[-1]
-                
-                # If last segment is generic (index.html), take parent
-                if len(last_segment) < 5 or "index" in last_segment.lower():
-                    last_segment = clean_url.rstrip('/').split('/')[-2]
-                    
-                keywords = re.sub(r'[-_.]', ' ', last_segment)
-                # MORE TECHNICAL SEARCH QUERY
-                search_query = f"{keywords} API endpoints code example"
-                
-                print(f"   🕵️ Fallback Query: '{search_query}'")
-                
-                try:
-                    search_res = web_search.invoke(search_query)
-                    new_documents.append(f"Fallback Search Result for {url}:\nQuery: {search_query}\nResult: {search_res}")
-                    print("   ✅ Fallback Search Success")
-                except Exception as e:
-                    print(f"   ❌ Fallback Search Failed: {e}")
-                    # If both failed, then log the error
-                    new_documents.append(f"Source URL: {url}\nError: Scrape and Fallback failed.")
-
-    # B. Query Hybrid Search (Vector + BM25)
-    results = hybrid_retriever.search(last_message, n_results=3)
-    if results and results['documents']:
-        for doc_list in results['documents']:
-            new_documents.extend(doc_list)
+                new_documents.append(future.result(timeout=max(0, start + url_deadline - time.monotonic())))
+            except TimeoutError:
+                print(f"   ⏱️ Deadline exceeded: {url}")
+                new_documents.append((_failed_url_doc(url), 0.0))
+
+        results = None
+        try:
+            if search_future:
+                results = search_future.result(timeout=max(0, start + search_deadline - time.monotonic()))
+        except TimeoutError:
+            print("   ⏱️ Local search deadline exceeded")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    new_documents.extend(_hybrid_documents(results))
 
     # C. Fallback to Web Search (General)
-    if not new_documents and not urls:
+    needs_web = not new_documents and not urls and not reuse
+    if needs_web and not time_for(deadline, "web_search"):
+        cut.append("web_search")
+    elif needs_web:
         print("⚠️ No local docs or URLs. Searching the web...")
         try:
-            search_prompt = f"""
-            Task: Convert the following user request into a CONCISE, KEYWORD-FOCUSED web search query.
-            User Request: {last_message}
-            Output ONLY the search query string.
-            """
-            optimized_query = invoke_llm_safe(reasoning_llm, [HumanMessage(content=search_prompt)]).content.strip()
+            # The rewrite only depends on the message; repeated questions skip the LLM call
+            optimized_query = search_query_cache.get_or_compute(
+                normalize_query(last_message),
+                lambda: semantic_llm_cache.get_or_compute(
+                    "search_query", last_message,
+                    lambda: invoke_llm_safe(search_query_llm, [HumanMessage(content=_search_query_prompt(last_message))], deadline=deadline).content.strip()
+                )
+            )
             print(f"🕵️ Optimized Search Query: {optimized_query}")
             
-            search_result = web_search.invoke(optimized_query)
-            new_documents.append(f"Web Search Result (Query: {optimized_query}): {search_result}")
+            search_result = _web_search(optimized_query)
+            new_documents.append((f"Web Search Result (Query: {optimized_query}): {search_result}", WEB_DOC_SCORE))
         except Exception as e:
             print(f"❌ Web Search failed: {e}")
             
-    combined_docs = existing_context + new_documents
-    unique_docs = sorted(list(set(combined_docs)), key=lambda x: combined_docs.index(x))
+    return _retrieval_result(state, followup, _merge_context(base_documents, base_scores, new_documents), cut)
+
+async def aretrieve_node(state: AgentState) -> Dict[str, Any]:
+    """
+    Async variant of retrieve_node (used by app_graph.ainvoke / astream).
+    HTTP goes through the shared scrape pool; Chroma/BM25 and DuckDuckGo run on the blocking executor.
+    """
+    last_message = state["messages"][-1].content
+    deadline = state.get("deadline")
+    new_documents = []
+    cut = []
     
-    return {"context": unique_docs}
+    print(f"🔍 Analyzing Request: {last_message[:50]}...")
+    followup = await run_blocking(_assess_followup, state, last_message)
+    base_documents, base_scores = _retrieval_base(state, followup)
+    reuse = followup is not None and followup.is_follow_up
+    search = not reuse or bool(followup.new_terms)
 
-def get_smart_history(messages: list) -> str:
+    # A + B. Scrape all URLs (each with its own fallback) concurrently with Hybrid Search.
+    # Cost is the slowest task, not the sum; each task has its own deadline.
+    urls, targets = _scrape_targets(last_message)
+    expand = not reuse and time_for(deadline, "expansion")
+    if not reuse and not expand:
+        cut.append("expansion")
+    url_docs, results = await asyncio.gather(
+        asyncio.gather(*(_aresolve_url(url, deadline) for url in targets)),
+        _ahybrid_search(last_message, deadline, expand) if search else asyncio.sleep(0)
+    )
+    new_documents.extend(url_docs)
+
+    new_documents.extend(_hybrid_documents(results))
+
+    # C. Fallback to Web Search (General)
+    needs_web = not new_documents and not urls and not reuse
+    if needs_web and not time_for(deadline, "web_search"):
+        cut.append("web_search")
+    elif needs_web:
+        print("⚠️ No local docs or URLs. Searching the web...")
+        try:
+            async def rewrite() -> str:
+                response = await ainvoke_llm_safe(search_query_llm, [HumanMessage(content=_search_query_prompt(last_message))], deadline=deadline)
+                return response.content.strip()
+            # Concurrent identical questions share one rewrite
+            optimized_query = await search_query_cache.aget_or_compute(
+                normalize_query(last_message),
+                lambda: semantic_llm_cache.aget_or_compute("search_query", last_message, rewrite)
+            )
+            print(f"🕵️ Optimized Search Query: {optimized_query}")
+            
+            search_result = await run_blocking(_web_search, optimized_query)
+            new_documents.append((f"Web Search Result (Query: {optimized_query}): {search_result}", WEB_DOC_SCORE))
+        except Exception as e:
+            print(f"❌ Web Search failed: {e}")
+            
+    return _retrieval_result(state, followup, _merge_context(base_documents, base_scores, new_documents), cut)
+
+def classify_node(state: AgentState) -> Dict[str, Any]:
     """
-    Implements Adaptive History Summarization:
-    - Keeps First 3 messages (Root Context).
-    - Keeps Last 3 messages (Immediate Context).
-    - Summarizes the Middle messages to save tokens.
+    Step 0: Route.
+    Lookups and explanations are answered with one LLM call after retrieval;
+    code requests (and anything uncertain) go through plan -> generate -> validate.
     """
-    if len(messages) <= 10:
-        # Return full history if short
-        history_str = ""
-        for msg in messages:
-            role = "User" if isinstance(msg, HumanMessage) else "Assistant"
-            history_str += f"{role}: {msg.content}\n"
-        return history_str
+    if not INTENT_ROUTER:
+        return {"intent": CODE_INTENT}
+    query = state["messages"][-1].content
+    # Naming a programming language (outside links and code) is a code signal, unless the router is sure otherwise
+    intent, margin = intent_router.classify(query, code_hint=bool(requested_languages(query)))
+    print(f"🧭 Intent: {intent} (margin {margin:.3f})")
+    return {"intent": intent}
 
-    # Slice the conversation
-    head = messages[:3]
-    tail = messages[-3:]
-    middle = messages[3:-3]
+async def aclassify_node(state: AgentState) -> Dict[str, Any]:
+    """Async variant of classify_node (the query embedding runs on the blocking executor)."""
+    return await run_blocking(classify_node, state)
+
+def _answer_prompt(state: AgentState, history_str: str, context_str: str) -> str:
+    return f"""
+    You are an API Documentation Expert.
     
-    # Format middle for summarization
-    middle_str = ""
-    for msg in middle:
-        role = "User" if isinstance(msg, HumanMessage) else "Assistant"
-        middle_str += f"{role}: {msg.content}\n"
-        
-    print(f"🧹 Summarizing {len(middle)} middle messages...")
+    Chat History:
+    {history_str}
+    
+    Available API Documentation Context:
+    {context_str}
     
-    summary_prompt = f"""
-    Summarize the following conversation log into a concise paragraph. 
+    Task:
+    Answer the user's latest question ({state.get("intent", "lookup")}) using the documentation context.
+    - Be concise and specific (endpoints, parameters, auth schemes, limits).
+    - Mention the Source URL when the answer comes from a scraped page.
+    - Short inline snippets are fine, but do not write full programs.
+    - If the context does not contain the answer, say so and suggest what to look for.
+    """
+
+def answer_node(state: AgentState) -> Dict[str, Any]:
+    """
+    Step 2 (lookup/explain): answer directly from the retrieved context.
+    The answer goes in `generated_code`, which is what the chat responses return.
+    """
+    deadline = state.get("deadline")
+    history_str = get_smart_history(state["messages"], session_id=state.get("session_id"), deadline=deadline)
+    context_str, dropped = _packed_context(state, chat_llm)
+    prompt = _answer_prompt(state, history_str, context_str)
+    
+    try:
+        response = invoke_llm_safe(chat_llm.with_config(tags=[STREAM_TAG]), [HumanMessage(content=prompt)], deadline=deadline)
+    except DeadlineExceededError:
+        return {"context_dropped_tokens": dropped, **_cut("answer")}
+    return {"generated_code": response.content, "context_dropped_tokens": dropped}
+
+async def aanswer_node(state: AgentState) -> Dict[str, Any]:
+    """Async variant of answer_node."""
+    deadline = state.get("deadline")
+    history_str = await aget_smart_history(state["messages"], session_id=state.get("session_id"), deadline=deadline)
+    context_str, dropped = _packed_context(state, chat_llm)
+    prompt = _answer_prompt(state, history_str, context_str)
+    
+    try:
+        response = await ainvoke_llm_safe(chat_llm.with_config(tags=[STREAM_TAG]), [HumanMessage(content=prompt)], deadline=deadline)
+    except DeadlineExceededError:
+        return {"context_dropped_tokens": dropped, **_cut("answer")}
+    return {"generated_code": response.content, "context_dropped_tokens": dropped}
+
+def compress_node(state: AgentState) -> Dict[str, Any]:
+    """
+    Step 1b: Compress.
+    Keeps only the parts of the retrieved documents relevant to the request
+    (see core/compression.py). Scores follow their documents.
+    """
+    context = state.get("context") or []
+    if not CONTEXT_COMPRESSION or not context:
+        return {}
+    if not time_for(state.get("deadline"), "compression"):
+        return _cut("compression")
+
+    query = state["messages"][-1].content
+    scores = state.get("context_scores") or {}
+    compressed_context, compressed_scores = [], {}
+    for original, compressed in zip(context, compressor.compress(query, context)):
+        if not compressed:
+            continue # Nothing but boilerplate repeated from an earlier document
+        compressed_context.append(compressed)
+        key = content_hash(compressed)
+        compressed_scores[key] = max(scores.get(content_hash(original), 0.0), compressed_scores.get(key, 0.0))
+
+    before = sum(estimate_tokens(doc) for doc in context)
+    after = sum(estimate_tokens(doc) for doc in compressed_context)
+    print(f"🗜️ Context compressed: {before} -> {after} tokens")
+    return {"context": compressed_context, "context_scores": compressed_scores}
+
+async def acompress_node(state: AgentState) -> Dict[str, Any]:
+    """Async variant of compress_node (embedding is CPU-bound; runs on the blocking executor)."""
+    return await run_blocking(compress_node, state)
+
+def _format_messages(messages: list) -> str:
+    history_str = ""
+    for msg in messages:
+        role = "User" if isinstance(msg, HumanMessage) else "Assistant"
+        history_str += f"{role}: {msg.content}\n"
+    return history_str
+
+def _range_hashes(messages: list) -> List[str]:
+    """
+    Chained hashes of every prefix of `messages`: hashes[i] identifies messages[:i+1].
+    Computing them is cheap; it lets us find the longest prefix already summarized.
+    """
+    digest = hashlib.sha256()
+    hashes = []
+    for msg in messages:
+        role = "user" if isinstance(msg, HumanMessage) else "assistant"
+        digest.update(f"{role}\x00{msg.content}\x00".encode("utf-8"))
+        hashes.append(digest.copy().hexdigest())
+    return hashes
+
+def _lookup_summary(hashes: List[str]) -> Optional[Dict[str, Any]]:
+    try:
+        return session_manager.find_summary(hashes)
+    except Exception as e:
+        print(f"⚠️ Summary lookup failed: {e}")
+        return None
+
+def _store_summary(range_hash: str, message_count: int, summary: str, session_id: Optional[str]):
+    try:
+        session_manager.save_summary(range_hash, message_count, summary, session_id=session_id)
+    except Exception as e:
+        print(f"⚠️ Failed to store summary: {e}")
+
+def _summary_prompt(previous: str, new_messages: list) -> str:
+    return f"""
+    Update the running summary of a conversation with the new messages below.
     Focus ONLY on:
     1. Key technical decisions made.
     2. User requirements defined.
     3. Code structures established.
     Ignore chit-chat.
-    
-    Log:
-    {middle_str}
+
+    Current Summary:
+    {previous or "(none yet)"}
+
+    New Messages:
+    {_format_messages(new_messages)}
+
+    Output the updated summary as one concise paragraph.
     """
-    
+
+def _summary_scope(session_id: str, previous: str) -> str:
+    """Summaries are only reused within a session, on top of the same running summary."""
+    return f"{session_id}:{content_hash(previous)}"
+
+def summarize_middle(middle: list, session_id: Optional[str] = None, deadline: Optional[float] = None) -> str:
+    """
+    Rolling summary of the middle messages.
+    Reuses the stored summary of the longest already-summarized prefix and folds in
+    only the messages after it, so each turn costs one small LLM call (or none).
+    """
+    hashes = _range_hashes(middle)
+    stored = _lookup_summary(hashes)
+
+    covered = stored["message_count"] if stored else 0
+    previous = stored["summary"] if stored else ""
+    if covered == len(middle):
+        print(f"♻️ Reusing summary of {covered} middle messages")
+        return previous
+
+    new_messages = middle[covered:]
+    print(f"🧹 Folding {len(new_messages)} messages into summary ({covered} already summarized)...")
+
+    def summarize() -> str:
+        return invoke_llm_safe(summary_llm, [HumanMessage(content=_summary_prompt(previous, new_messages))], deadline=deadline).content
+
     try:
-        summary = invoke_llm_safe(chat_llm, [HumanMessage(content=summary_prompt)]).content
+        if session_id:
+            summary = semantic_llm_cache.get_or_compute("summarize", _format_messages(new_messages), summarize, scope=_summary_scope(session_id, previous))
+        else:
+            summary = summarize()
     except Exception as e:
         print(f"❌ Summarization failed: {e}")
-        summary = "Error generating summary."
+        return previous or "Error generating summary."
+
+    _store_summary(hashes[-1], len(middle), summary, session_id)
+    return summary
 
+async def asummarize_middle(middle: list, session_id: Optional[str] = None, deadline: Optional[float] = None) -> str:
+    """Async variant of summarize_middle."""
+    hashes = _range_hashes(middle)
+    stored = await run_blocking(_lookup_summary, hashes)
+
+    covered = stored["message_count"] if stored else 0
+    previous = stored["summary"] if stored else ""
+    if covered == len(middle):
+        print(f"♻️ Reusing summary of {covered} middle messages")
+        return previous
+
+    new_messages = middle[covered:]
+    print(f"🧹 Folding {len(new_messages)} messages into summary ({covered} already summarized)...")
+
+    async def summarize() -> str:
+        response = await ainvoke_llm_safe(summary_llm, [HumanMessage(content=_summary_prompt(previous, new_messages))], deadline=deadline)
+        return response.content
+
+    try:
+        if session_id:
+            summary = await semantic_llm_cache.aget_or_compute("summarize", _format_messages(new_messages), summarize, scope=_summary_scope(session_id, previous))
+        else:
+            summary = await summarize()
+    except Exception as e:
+        print(f"❌ Summarization failed: {e}")
+        return previous or "Error generating summary."
+
+    await run_blocking(_store_summary, hashes[-1], len(middle), summary, session_id)
+    return summary
+
+def _assemble_history(head: list, middle: list, summary: str, tail: list) -> str:
     # Reconstruct History
-    history_str = ""
-    
-    # Head
-    for msg in head:
-        role = "User" if isinstance(msg, HumanMessage) else "Assistant"
-        history_str += f"{role}: {msg.content}\n"
-        
-    # Summary
+    history_str = _format_messages(head)
     history_str += f"\n--- [Summary of Middle Conversation ({len(middle)} messages)] ---\n{summary}\n------------------------------------------------------\n\n"
-    
-    # Tail
-    for msg in tail:
-        role = "User" if isinstance(msg, HumanMessage) else "Assistant"
-        history_str += f"{role}: {msg.content}\n"
-        
+    history_str += _format_messages(tail)
     return history_str
 
-def plan_node(state: AgentState) -> Dict[str, Any]:
+def get_smart_history(messages: list, session_id: Optional[str] = None, deadline: Optional[float] = None) -> str:
     """
-    Step 2: Plan.
-    Uses the Reasoning LLM to analyze the request and retrieved docs.
-    Decides on the integration strategy, respecting user constraints (language, framework).
+    Implements Adaptive History Summarization:
+    - Keeps First 3 messages (Root Context).
+    - Keeps Last 3 messages (Immediate Context).
+    - Summarizes the Middle messages to save tokens (incrementally, see summarize_middle).
     """
-    context_str = "\n\n".join(state["context"])
-    
-    # Use Smart History Slicing
-    history_str = get_smart_history(state["messages"])
-    
-    prompt = f"""
+    if len(messages) <= 10:
+        # Return full history if short
+        return _format_messages(messages)
+
+    # Slice the conversation
+    head, middle, tail = messages[:3], messages[3:-3], messages[-3:]
+    return _assemble_history(head, middle, summarize_middle(middle, session_id=session_id, deadline=deadline), tail)
+
+async def aget_smart_history(messages: list, session_id: Optional[str] = None, deadline: Optional[float] = None) -> str:
+    """Async variant of get_smart_history."""
+    if len(messages) <= 10:
+        return _format_messages(messages)
+
+    head, middle, tail = messages[:3], messages[3:-3], messages[-3:]
+    return _assemble_history(head, middle, await asummarize_middle(middle, session_id=session_id, deadline=deadline), tail)
+
+def _plan_prompt(state: AgentState, history_str: str, context_str: str) -> str:
+    return f"""
     You are an Expert Software Architect.
     
     Chat History:
@@ -275,17 +775,45 @@ def plan_node(state: AgentState) -> Dict[str, Any]:
     QUESTION:
     [Ask 1-3 specific clarifying questions to narrow down the search. e.g. "I found multiple APIs for 'Acme'. Did you mean Acme V1 or V2?"]
     """
-    
-    response = invoke_llm_safe(reasoning_llm, [HumanMessage(content=prompt)])
-    return {"plan": response.content}
 
-def generate_node(state: AgentState) -> Dict[str, Any]:
+def _plan_result(plan: str, dropped: int, deadline: Optional[float]) -> Dict[str, Any]:
+    # Without time for code generation, the plan itself is the answer
+    cut = _cut("generate") if "STATUS: INCOMPLETE" not in plan and not time_for(deadline, "generate") else {}
+    return {"plan": plan, "context_dropped_tokens": dropped, **cut}
+
+def plan_node(state: AgentState) -> Dict[str, Any]:
     """
-    Step 3: Code.
-    Uses the Coding LLM to generate the actual implementation based on the plan.
+    Step 2: Plan.
+    Uses the Reasoning LLM to analyze the request and retrieved docs.
+    Decides on the integration strategy, respecting user constraints (language, framework).
     """
+    # Use Smart History Slicing
+    deadline = state.get("deadline")
+    history_str = get_smart_history(state["messages"], session_id=state.get("session_id"), deadline=deadline)
+    context_str, dropped = _packed_context(state, reasoning_llm)
+    prompt = _plan_prompt(state, history_str, context_str)
+    
+    try:
+        response = invoke_llm_safe(reasoning_llm.with_config(tags=[STREAM_TAG]), [HumanMessage(content=prompt)], deadline=deadline)
+    except DeadlineExceededError:
+        return {"plan": "", "context_dropped_tokens": dropped, **_cut("plan")}
+    return _plan_result(response.content, dropped, deadline)
+
+async def aplan_node(state: AgentState) -> Dict[str, Any]:
+    """Async variant of plan_node."""
+    deadline = state.get("deadline")
+    history_str = await aget_smart_history(state["messages"], session_id=state.get("session_id"), deadline=deadline)
+    context_str, dropped = _packed_context(state, reasoning_llm)
+    prompt = _plan_prompt(state, history_str, context_str)
+    
+    try:
+        response = await ainvoke_llm_safe(reasoning_llm.with_config(tags=[STREAM_TAG]), [HumanMessage(content=prompt)], deadline=deadline)
+    except DeadlineExceededError:
+        return {"plan": "", "context_dropped_tokens": dropped, **_cut("plan")}
+    return _plan_result(response.content, dropped, deadline)
+
+def _generate_prompt(state: AgentState, context_str: str, language: Optional[str] = None) -> str:
     plan = state["plan"]
-    context_str = "\n\n".join(state["context"])
     
     prompt = f"""
     You are a Senior Developer.
@@ -322,6 +850,13 @@ def generate_node(state: AgentState) -> Dict[str, Any]:
         Rewrite the code to FIX the issues mentioned above.
         """
 
+    if language:
+        # One branch of a multi-language request; the other languages are generated in parallel
+        prompt += f"""
+        TARGET LANGUAGE: {language}
+        Write the code in {language} ONLY, as a single code block. Ignore the steps for other languages.
+        """
+
     prompt += "\nOutput ONLY the code block(s)."
 
 
@@ -336,21 +871,34 @@ def generate_node(state: AgentState) -> Dict[str, Any]:
         3. Structure methods logically (e.g., `get_user`, `create_order`).
         4. Include a `config` parameter for API keys.
         """
-    
-    response = invoke_llm_safe(coding_llm, [HumanMessage(content=prompt)])
-    return {"generated_code": response.content}
+    return prompt
 
-def validate_node(state: AgentState) -> Dict[str, Any]:
+def generate_node(state: AgentState) -> Dict[str, Any]:
     """
-    Step 4: Critique (Self-Correction).
-    Reviews the generated code for logical errors, security issues, and completeness.
+    Step 3: Code.
+    Uses the Coding LLM to generate the actual implementation based on the plan.
     """
-    code = state["generated_code"]
-    attempt = state.get("attempt_count", 0)
-    
-    print(f"🕵️ Validating code (Attempt {attempt + 1})...")
-    
-    prompt = f"""
+    context_str, dropped = _packed_context(state, coding_llm)
+    prompt = _generate_prompt(state, context_str)
+    try:
+        response = invoke_llm_safe(coding_llm.with_config(tags=[STREAM_TAG]), [HumanMessage(content=prompt)], deadline=state.get("deadline"))
+    except DeadlineExceededError:
+        # A rewrite that ran out of time keeps the previous attempt
+        return {"context_dropped_tokens": dropped, **_cut("generate")}
+    return {"generated_code": response.content, "context_dropped_tokens": dropped}
+
+async def agenerate_node(state: AgentState) -> Dict[str, Any]:
+    """Async variant of generate_node."""
+    context_str, dropped = _packed_context(state, coding_llm)
+    prompt = _generate_prompt(state, context_str)
+    try:
+        response = await ainvoke_llm_safe(coding_llm.with_config(tags=[STREAM_TAG]), [HumanMessage(content=prompt)], deadline=state.get("deadline"))
+    except DeadlineExceededError:
+        return {"context_dropped_tokens": dropped, **_cut("generate")}
+    return {"generated_code": response.content, "context_dropped_tokens": dropped}
+
+def _validate_prompt(code: str) -> str:
+    return f"""
     You are a Senior Code Reviewer.
     Review the following code for:
     1. Syntax errors.
@@ -366,9 +914,8 @@ def validate_node(state: AgentState) -> Dict[str, Any]:
     - If the code looks correct and safe, output ONLY: PASS
     - If there are issues, list them clearly as bullet points.
     """
-    
-    feedback = invoke_llm_safe(coding_llm, [HumanMessage(content=prompt)]).content.strip()
-    
+
+def _validation_result(feedback: str, attempt: int) -> Dict[str, Any]:
     # Safety Check: If feedback contains "PASS", treat as pass.
     if "PASS" in feedback:
         feedback = "PASS"
@@ -376,3 +923,189 @@ def validate_node(state: AgentState) -> Dict[str, Any]:
         print(f"❌ Validation Failed: {feedback[:100]}...")
         
     return {"feedback": feedback, "attempt_count": attempt + 1}
+
+# Generate/validate rounds before the best effort is returned
+MAX_VALIDATION_ATTEMPTS = 3
+
+def _qualified(name: str) -> str:
+    """A language name that is also an ordinary word only counts next to "in/using ..." or "... code/language"."""
+    return rf"\b(?:in|using|with) {name}\b|\b{name} (?:language|code|client|sdk|script|app|example)s?\b"
+
+LANGUAGE_PATTERNS = {
+    "Python": r"\bpython\b",
+    "JavaScript": r"\bjavascript\b|\bnode\.?js\b|" + _qualified("node"),
+    "TypeScript": r"\btypescript\b",
+    "C#": r"(?<![\w#])c#|\bc\s?sharp\b|\basp\.net\b|(?<![\w.])\.net\b(?!\.\w)",
+    "Java": r"\bjava\b",
+    "Go": r"\bgolang\b|" + _qualified("go"),
+    "Ruby": r"\bruby\b",
+    "PHP": r"\bphp\b",
+    "Rust": r"\brust\b",
+    "Kotlin": r"\bkotlin\b",
+    "Swift": _qualified("swift"),
+}
+
+# Any language name (not new information in a follow-up such as "now in Go")
+LANGUAGE_NAMES = re.compile("|".join(LANGUAGE_PATTERNS.values()), re.IGNORECASE)
+# Links and quoted code name hosts and modules ("docs.python.org", "api.example.net"), not the language wanted
+NON_PROSE = re.compile(r"```.*?```|`[^`]*`|https?://\S+|\bwww\.\S+", re.DOTALL)
+
+def strip_non_prose(text: str) -> str:
+    """The request without URLs and code spans, for keyword matching."""
+    return NON_PROSE.sub(" ", text)
+
+def requested_languages(text: str) -> List[str]:
+    """Programming languages named in a request, in order of appearance."""
+    text = strip_non_prose(text)
+    found = []
+    for language, pattern in LANGUAGE_PATTERNS.items():
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            found.append((match.start(), language))
+    return [language for _, language in sorted(found)]
+
+def _local_validation(code: str, attempt: int) -> Optional[Dict[str, Any]]:
+    """
+    Runs the local checks first. Returns the validation result if they settle it,
+    or None if the LLM reviewer has to look at the code.
+    """
+    report = code_checker.check(code)
+    if not report.passed:
+        validation_stats.record("local_rejected")
+        result = _validation_result(report.feedback(), attempt)
+    elif not llm_review_required(report):
+        validation_stats.record("local_passed")
+        print("✅ Local checks passed, LLM review not required.")
+        result = _validation_result("PASS", attempt)
+    else:
+        validation_stats.record("llm_reviewed")
+        result = None
+    print(f"📉 {validation_stats.summary()}")
+    return result
+
+def _with_refinement_cut(result: Dict[str, Any], deadline: Optional[float]) -> Dict[str, Any]:
+    """A failed validation normally triggers a rewrite; without time for one, the best effort stands."""
+    retry = result["feedback"] != "PASS" and result["attempt_count"] < MAX_VALIDATION_ATTEMPTS
+    if retry and not time_for(deadline, "refinement"):
+        return {**result, **_cut("refinement")}
+    return result
+
+def validate_node(state: AgentState) -> Dict[str, Any]:
+    """
+    Step 4: Critique (Self-Correction).
+    Reviews the generated code for logical errors, security issues, and completeness.
+    Local static checks run first; the LLM reviewer only sees code they cannot settle
+    (and is skipped when the request deadline is close).
+    """
+    attempt = state.get("attempt_count", 0)
+    deadline = state.get("deadline")
+    print(f"🕵️ Validating code (Attempt {attempt + 1})...")
+
+    local_result = _local_validation(state["generated_code"], attempt)
+    if local_result:
+        return _with_refinement_cut(local_result, deadline)
+    if not time_for(deadline, "llm_review"):
+        return {**_validation_result("PASS", attempt), **_cut("llm_review")}
+    
+    prompt = _validate_prompt(state["generated_code"])
+    try:
+        feedback = invoke_llm_safe(review_llm, [HumanMessage(content=prompt)], deadline=deadline).content.strip()
+    except DeadlineExceededError:
+        return {**_validation_result("PASS", attempt), **_cut("llm_review")}
+    return _with_refinement_cut(_validation_result(feedback, attempt), deadline)
+
+async def avalidate_node(state: AgentState) -> Dict[str, Any]:
+    """Async variant of validate_node."""
+    attempt = state.get("attempt_count", 0)
+    deadline = state.get("deadline")
+    print(f"🕵️ Validating code (Attempt {attempt + 1})...")
+
+    local_result = _local_validation(state["generated_code"], attempt)
+    if local_result:
+        return _with_refinement_cut(local_result, deadline)
+    if not time_for(deadline, "llm_review"):
+        return {**_validation_result("PASS", attempt), **_cut("llm_review")}
+    
+    prompt = _validate_prompt(state["generated_code"])
+    try:
+        response = await ainvoke_llm_safe(review_llm, [HumanMessage(content=prompt)], deadline=deadline)
+    except DeadlineExceededError:
+        return {**_validation_result("PASS", attempt), **_cut("llm_review")}
+    return _with_refinement_cut(_validation_result(response.content.strip(), attempt), deadline)
+
+def _language_result(language: str, code: str, validation: Dict[str, Any], cut: List[str]) -> Dict[str, Any]:
+    return {"language_results": [{
+        "language": language,
+        "code": code,
+        "feedback": validation["feedback"],
+        "attempts": validation["attempt_count"],
+    }], **_cut(*cut)}
+
+def _branch_timeout(language: str, code: str, branch: Dict[str, Any], cut: List[str]) -> Dict[str, Any]:
+    """Result of a branch whose generate call ran out of time (keeps the previous attempt, if any)."""
+    feedback = branch["feedback"] if code else f"Ran out of time before the {language} code was generated."
+    return _language_result(language, code, {"feedback": feedback, "attempt_count": branch["attempt_count"]}, cut + ["generate"])
+
+def _branch_done(validation: Dict[str, Any]) -> bool:
+    return (
+        validation["feedback"] == "PASS"
+        or validation["attempt_count"] >= MAX_VALIDATION_ATTEMPTS
+        or "refinement" in validation.get("cut_stages", [])
+    )
+
+def generate_language_node(state: AgentState) -> Dict[str, Any]:
+    """
+    Step 3+4 for one language of a multi-language request (one parallel branch per language).
+    Runs its own generate -> validate loop, so a failing language is retried alone.
+    """
+    language = state["language"]
+    branch = {**state, "feedback": "", "attempt_count": 0}
+    context_str, _ = _packed_context(state, coding_llm)
+    code, cut = "", []
+    while True:
+        print(f"🧩 Generating {language} (Attempt {branch['attempt_count'] + 1})...")
+        prompt = _generate_prompt(branch, context_str, language=language)
+        try:
+            code = invoke_llm_safe(coding_llm.with_config(tags=[STREAM_TAG, f"language:{language}"]), [HumanMessage(content=prompt)], deadline=state.get("deadline")).content
+        except DeadlineExceededError:
+            return _branch_timeout(language, code, branch, cut)
+        validation = validate_node({**branch, "generated_code": code})
+        cut += validation.get("cut_stages", [])
+        if _branch_done(validation):
+            return _language_result(language, code, validation, cut)
+        branch.update(feedback=validation["feedback"], attempt_count=validation["attempt_count"])
+
+async def agenerate_language_node(state: AgentState) -> Dict[str, Any]:
+    """Async variant of generate_language_node."""
+    language = state["language"]
+    branch = {**state, "feedback": "", "attempt_count": 0}
+    context_str, _ = _packed_context(state, coding_llm)
+    code, cut = "", []
+    while True:
+        print(f"🧩 Generating {language} (Attempt {branch['attempt_count'] + 1})...")
+        prompt = _generate_prompt(branch, context_str, language=language)
+        try:
+            response = await ainvoke_llm_safe(coding_llm.with_config(tags=[STREAM_TAG, f"language:{language}"]), [HumanMessage(content=prompt)], deadline=state.get("deadline"))
+        except DeadlineExceededError:
+            return _branch_timeout(language, code, branch, cut)
+        code = response.content
+        validation = await avalidate_node({**branch, "generated_code": code})
+        cut += validation.get("cut_stages", [])
+        if _branch_done(validation):
+            return _language_result(language, code, validation, cut)
+        branch.update(feedback=validation["feedback"], attempt_count=validation["attempt_count"])
+
+def merge_languages_node(state: AgentState) -> Dict[str, Any]:
+    """Joins the per-language branches into one answer (in the order the languages were requested)."""
+    results = {r["language"]: r for r in state.get("language_results") or []}
+    ordered = [results[lang] for lang in requested_languages(state["messages"][-1].content) if lang in results]
+    ordered += [r for lang, r in results.items() if r not in ordered]
+
+    failed = [r for r in ordered if r["feedback"] != "PASS"]
+    feedback = "PASS" if not failed else "\n".join(f"{r['language']}:\n{r['feedback']}" for r in failed)
+    return {
+        "generated_code": "\n\n".join(f"### {r['language']}\n{r['code']}" for r in ordered if r["code"]),
+        "feedback": feedback,
+        "attempt_count": max((r["attempts"] for r in ordered), default=0),
+        "language_results": None, # Reset for the next run
+    }
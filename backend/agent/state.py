@@ -1,7 +1,13 @@
-from typing import TypedDict, Annotated, List, Dict
+from typing import TypedDict, Annotated, List, Dict, Optional, Any
 from langgraph.graph.message import add_messages
 from langchain_core.messages import BaseMessage
 
+def add_or_reset(existing: Optional[list], new: Optional[list]) -> list:
+    """Reducer: parallel branches append their results; None clears the list."""
+    if new is None:
+        return []
+    return (existing or []) + new
+
 class AgentState(TypedDict):
     """
     The shared state of the Agentic Mesh.
@@ -15,6 +21,19 @@ class AgentState(TypedDict):
     # Retrieved Documents from Vector Store
     # List of strings or dicts containing snippets
     context: List[str]
+
+    # Retrieval score per context snippet (keyed by content hash), used to rank snippets
+    # when packing them into a token budget
+    context_scores: Dict[str, float]
+
+    # Session topic: its retrieval results (before compression) and the embeddings of its recent
+    # queries. Follow-up turns start from these documents instead of searching again.
+    topic_documents: List[str]
+    topic_scores: Dict[str, float]
+    topic_embeddings: List[List[float]]
+
+    # Context tokens left out of the last prompt because of the budget
+    context_dropped_tokens: int
     
     # The final planned approach
     plan: str
@@ -25,6 +44,19 @@ class AgentState(TypedDict):
     # Error state (if compilation/validation fails)
     error: str
 
+    # Owning chat session, if any (used to store rolling history summaries)
+    session_id: Optional[str]
+
+    # Multi-language requests: the language of a generate branch, and the branch results
+    # ({"language", "code", "feedback", "attempts"}) collected for the merge step
+    language: Optional[str]
+    language_results: Annotated[List[Dict[str, Any]], add_or_reset]
+
+    # End-to-end time budget (epoch seconds, None = unlimited) and the optional stages
+    # that were cut to meet it (reported in the response)
+    deadline: Optional[float]
+    cut_stages: Annotated[List[str], add_or_reset]
+
     # Self-Correction State
     feedback: str # Critique from the validator
     attempt_count: int # Number of retries
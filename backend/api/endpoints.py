@@ -3,6 +3,15 @@ from fastapi import APIRouter, HTTPException, Depends
 from api.schemas import SearchRequest, SearchResponse, SearchResultItem
 from core.hybrid import hybrid_retriever
 from core.exceptions import AppError
+from core.intent_router import intent_router
+from core.code_checks import validation_stats
+from core.followup import followup_detector
+from core.model_router import model_router
+from core.llm_cache import llm_cache
+from core.semantic_cache import semantic_llm_cache
+from core.llm_scheduler import llm_scheduler
+from core.admission import admission_controller
+from core.tracing import trace_stats
 
 router = APIRouter(tags=["Advanced Search"])
 
@@ -76,3 +85,29 @@ async def search_documents(request: SearchRequest):
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/v1/stats")
+async def agent_stats():
+    """
+    Runtime counters of the agent pipeline:
+    - routing: intents chosen by the local router (and how often the full pipeline was skipped)
+    - validation: how often local checks settled validation without an LLM review
+    - followups: session turns that reused the topic's retrieval results (and how many still searched)
+    - llm_cache: LLM response cache hits (in-process / SQLite), misses, evictions and size
+    - semantic_llm_cache: per role, LLM calls avoided for near-duplicate inputs (and matches refused by its guards)
+    - models: current model order per task, calls/latency per task and model, rate limits and downgrades
+    - scheduler: LLM calls granted/queued/shed by the per-model rate budgets, provider 429s, budget left per model
+    - admission: running/queued agent runs, rejections and queue wait times
+    - stages: latency per graph node / LLM call / retrieval stage, LLM tokens and retries, cache hit counts
+    """
+    return {
+        "stages": trace_stats.summary(),
+        "admission": admission_controller.stats(),
+        "routing": intent_router.stats(),
+        "validation": {**validation_stats.counts, "llm_avoided_ratio": validation_stats.avoided_ratio},
+        "followups": followup_detector.stats(),
+        "models": model_router.stats(),
+        "scheduler": llm_scheduler.stats(),
+        "llm_cache": llm_cache.stats(),
+        "semantic_llm_cache": semantic_llm_cache.stats(),
+    }
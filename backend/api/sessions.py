@@ -1,18 +1,22 @@
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 import time
 
-try:
-    from backend.core.sessions import session_manager, SessionData
-    from backend.agent.graph import app_graph
-    from backend.utils.sanitization import sanitize_html
-except ImportError:
-    # Fallback for direct execution
-    from core.sessions import session_manager, SessionData
-    from agent.graph import app_graph
-    from utils.sanitization import sanitize_html
+# Same module paths as main.py: importing them as backend.* would create second copies of the
+# singletons (session manager, admission controller, graph) next to the ones the app uses
+from core.sessions import session_manager, SessionData
+from agent.graph import session_graph
+from core.checkpointer import thread_config
+from utils.sanitization import sanitize_html
+from api.streaming import stream_graph_events, SSE_HEADERS
+from core.concurrency import run_blocking
+from core.deadline import new_deadline
+from core.admission import admission_controller
+from core.tracing import request_trace
+from core.exceptions import AppError, ServiceUnavailableError
 
 from langchain_core.messages import HumanMessage, AIMessage
 
@@ -26,6 +30,7 @@ class ChatMessageData(BaseModel):
     role: str
     content: str
     timestamp: float
+    seq: int = 0
 
 class SessionResponse(BaseModel):
     id: str
@@ -39,6 +44,7 @@ class SessionChatRequest(BaseModel):
 class SessionChatResponse(BaseModel):
     response: str
     plan: Optional[str] = None
+    cut_stages: List[str] = [] # Stages skipped to meet the request deadline
 
 # --- Endpoints ---
 
@@ -53,83 +59,167 @@ async def create_new_session(req: CreateSessionRequest):
     )
 
 @router.get("/", response_model=List[SessionResponse])
-async def list_sessions(user_id: Optional[str] = None):
-    sessions = session_manager.list_sessions(user_id)
-    # Sort by created_at desc
-    sessions.sort(key=lambda x: x.created_at, reverse=True)
+async def list_sessions(
+    response: Response,
+    user_id: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None
+):
+    """
+    Newest-first page of sessions.
+    If more pages exist, the `X-Next-Cursor` header holds the cursor for the next request.
+    """
+    try:
+        sessions, next_cursor = session_manager.list_sessions_page(user_id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return [
         SessionResponse(
-            id=s.id, user_id=s.user_id, created_at=s.created_at, message_count=len(s.messages)
+            id=s.id, user_id=s.user_id, created_at=s.created_at, message_count=s.message_count
         ) for s in sessions
     ]
 
 @router.get("/{session_id}/history", response_model=List[ChatMessageData])
-async def get_session_history(session_id: str):
-    session = session_manager.get_session(session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+async def get_session_history(
+    session_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    before: Optional[int] = Query(None, ge=0, description="Only messages with seq < before")
+):
+    """
+    Chronological transcript. With `limit`, returns the latest `limit` messages;
+    page backwards by passing the first returned `seq` as `before`.
+    """
+    session = session_manager.get_session(session_id, include_messages=False)
+    if session:
+        messages = session_manager.get_messages(session_id, limit=limit, before=before)
+    else:
+        # Expired sessions stay readable from the archive
+        archived = session_manager.get_archived_session(session_id)
+        if not archived:
+            raise HTTPException(status_code=404, detail="Session not found")
+        messages = [m for m in archived.messages if before is None or m.seq < before]
+        if limit is not None:
+            messages = messages[-limit:]
     return [
-        ChatMessageData(role=m.role, content=m.content, timestamp=m.timestamp) 
-        for m in session.messages
+        ChatMessageData(role=m.role, content=m.content, timestamp=m.timestamp, seq=m.seq)
+        for m in messages
     ]
 
-@router.post("/{session_id}/chat", response_model=SessionChatResponse)
-async def chat_in_session(session_id: str, req: SessionChatRequest):
-    session = session_manager.get_session(session_id)
+def _to_langchain(messages) -> list:
+    return [
+        HumanMessage(content=sanitize_html(m.content)) if m.role == "user" else AIMessage(content=sanitize_html(m.content))
+        for m in messages
+    ]
+
+def prepare_session_chat(session_id: str, query: str, deadline: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Builds the agent inputs for the user's query in this session.
+    The graph resumes the session's checkpoint, so only the messages it has not seen yet
+    (the previous reply and the new query) are sent; the full history is only loaded for
+    sessions without a usable checkpoint (new, restored from the archive, or cleared).
+    The query is stored together with the reply (_finish_session_chat): a turn that was shed
+    and retried by the client is not stored twice.
+    """
+    session = session_manager.get_session(session_id, include_messages=False) or session_manager.restore_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-    
-    query = req.query
-    
-    # 1. Add User Msg to History
-    session_manager.add_message(session_id, "user", query)
-    
-    # 2. Build LangChain Messages from History
-    # Note: We rely on SessionManager to keep full history, 
-    # but for context window limits, we might want to slice it inside agent or here.
-    # For now, let's pass smart history or full history.
-    
-    history_msgs = []
-    for m in session.messages:
-        if m.role == "user":
-            history_msgs.append(HumanMessage(content=sanitize_html(m.content)))
-        else:
-            history_msgs.append(AIMessage(content=sanitize_html(m.content)))
-            
-    # The agent expects a list of messages. The last one should be the user's latest query
-    # But since we just added it to history_msgs, we are good.
-    # Actually Agent inputs usually distinguish 'messages' (conversation).
-    
-    inputs = {
-        "messages": history_msgs,
+
+    config = thread_config(session_id)
+    checkpointed = session_graph.get_state(config).values.get("messages") or []
+    if len(checkpointed) <= session.message_count:
+        missing = session.message_count - len(checkpointed)
+        new_messages = session_manager.get_messages(session_id, limit=missing) if missing else []
+    else:
+        # The stored history was cleared behind the checkpoint's back; start over
+        session_graph.checkpointer.delete_thread(session_id)
+        new_messages = session_manager.get_messages(session_id)
+
+    return {
+        "messages": _to_langchain(new_messages) + [HumanMessage(content=sanitize_html(query))],
         "intent": "general",
-        "context": [],
+        # "context" and the topic_* fields are not reset: follow-ups reuse the topic's retrieval results
         "plan": "",
         "generated_code": "",
-        "error": ""
+        "error": "",
+        "feedback": "",
+        "attempt_count": 0,
+        "language_results": None, # Reset
+        "context_dropped_tokens": 0,
+        "session_id": session_id,
+        "deadline": deadline if deadline is not None else new_deadline(),
+        "cut_stages": None # Reset
     }
+
+def _finish_session_chat(session_id: str, query: str, result: Dict[str, Any]) -> SessionChatResponse:
+    """Builds the reply from the agent result and stores the turn (query and assistant message)."""
+    response_content = result.get("generated_code", "")
+    plan_content = result.get("plan", "")
+    cut_stages = list(dict.fromkeys(result.get("cut_stages") or []))
     
-    try:
-        # 3. Invoke Agent
-        result = app_graph.invoke(inputs)
-        
-        response_content = result.get("generated_code", "")
-        plan_content = result.get("plan", "")
-        
-        # Fallback logic similar to main.py
-        if not response_content:
-             if "STATUS: INCOMPLETE" in plan_content:
-                 response_content = f"Clarification Needed:\n{plan_content}"
-             else:
-                 response_content = "No code generated."
-
-        # 4. Add Assistant Msg to History
-        session_manager.add_message(session_id, "assistant", response_content)
-        
-        return SessionChatResponse(response=response_content, plan=plan_content)
-        
-    except Exception as e:
-        # Log error in session? Maybe. Be careful of loops.
-        msg = f"Error: {str(e)}"
-        session_manager.add_message(session_id, "assistant", msg)
-        raise HTTPException(status_code=500, detail=str(e))
+    # Fallback logic similar to main.py
+    if not response_content:
+         if "STATUS: INCOMPLETE" in plan_content:
+             response_content = f"Clarification Needed:\n{plan_content}"
+         elif cut_stages:
+             response_content = f"Out of time (skipped: {', '.join(cut_stages)})\n{plan_content or 'No plan was ready.'}"
+         else:
+             response_content = "No code generated."
+
+    # 4. Add the turn to History
+    session_manager.add_message(session_id, "user", query)
+    session_manager.add_message(session_id, "assistant", response_content)
+    
+    return SessionChatResponse(response=response_content, plan=plan_content, cut_stages=cut_stages)
+
+def _record_session_error(session_id: str, query: str, e: Exception):
+    if isinstance(e, ServiceUnavailableError):
+        return # Shed (overload, LLM rate budget) or circuit open: nothing stored, the client retries the turn
+    # Log error in session? Maybe. Be careful of loops.
+    session_manager.add_message(session_id, "user", query)
+    session_manager.add_message(session_id, "assistant", f"Error: {str(e)}")
+
+@router.post("/{session_id}/chat", response_model=SessionChatResponse)
+async def chat_in_session(session_id: str, req: SessionChatRequest):
+    # Overloaded: reject (503 + Retry-After) right away
+    admission_controller.check()
+    deadline = new_deadline()
+
+    async with admission_controller.slot(deadline):
+        # Session store calls are blocking (SQLite); keep them off the event loop
+        inputs = await run_blocking(prepare_session_chat, session_id, req.query, deadline)
+        try:
+            # 3. Invoke Agent
+            with request_trace() as trace:
+                result = await session_graph.ainvoke(inputs, config=thread_config(session_id))
+            print(f"🧾 Trace {trace.request_id}: {trace.describe()}")
+            return await run_blocking(_finish_session_chat, session_id, req.query, result)
+            
+        except AppError as e:
+            # Mapped by main.py (e.g. 503 + Retry-After for shed LLM calls)
+            await run_blocking(_record_session_error, session_id, req.query, e)
+            raise
+        except Exception as e:
+            await run_blocking(_record_session_error, session_id, req.query, e)
+            raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{session_id}/chat/stream")
+async def chat_in_session_stream(session_id: str, req: SessionChatRequest):
+    """
+    Streaming variant of session chat (Server-Sent Events, see api/streaming.py).
+    The final `result` event carries the SessionChatResponse payload.
+    """
+    admission_controller.check()
+    inputs = await run_blocking(prepare_session_chat, session_id, req.query)
+    return StreamingResponse(
+        stream_graph_events(
+            session_graph,
+            inputs,
+            lambda result: _finish_session_chat(session_id, req.query, result).model_dump(),
+            on_error=lambda e: _record_session_error(session_id, req.query, e),
+            config=thread_config(session_id)
+        ),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
@@ -0,0 +1,98 @@
+import json
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+from core.concurrency import run_blocking
+from core.admission import admission_controller
+from core.tracing import request_trace
+from agent.nodes import STREAM_TAG # Tag of the LLM calls whose tokens are user-facing
+
+TOKEN_EVENTS = {"plan": "plan_token", "generate": "code_token", "generate_language": "code_token", "answer": "code_token"}
+# Parallel per-language branches tag their LLM calls with "language:<name>"
+LANGUAGE_TAG_PREFIX = "language:"
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no", # Disable proxy buffering (nginx)
+}
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_graph_events(
+    graph,
+    inputs: Dict[str, Any],
+    finalize: Callable[[Dict[str, Any]], Dict[str, Any]],
+    on_error: Optional[Callable[[Exception], None]] = None,
+    include_trace: bool = False,
+    config: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[str]:
+    """
+    Runs the agent graph and yields Server-Sent Events:
+    - `node`: a graph node finished ({"node", ...small status fields, e.g. context tokens dropped by the budget
+      or stages cut to meet the request deadline})
+    - `plan_token` / `code_token`: LLM tokens of the plan and the generated code
+    - `result`: the final payload, built by `finalize(final_state)` (may block; runs off the loop),
+      plus the request trace if `include_trace`
+    - `error`: the run failed ({"detail"})
+    `config` is passed to the run (e.g. the session's thread for the checkpointed graph).
+    The run holds a slot of the admission controller (waiting in its queue first if all are busy).
+    A new `code_token` sequence after a failed `validate` event is a rewrite of the code.
+    Multi-language requests stream the branches interleaved; their `code_token`s carry a "language"
+    (and "restart": true when that language is being rewritten).
+    """
+    final_state: Dict[str, Any] = {}
+    language_runs: Dict[str, str] = {}
+    try:
+        with request_trace() as trace:
+            async with admission_controller.slot(inputs.get("deadline")):
+                async for mode, payload in graph.astream(inputs, config=config, stream_mode=["updates", "messages", "values"]):
+                    if mode == "messages":
+                        chunk, metadata = payload
+                        event = TOKEN_EVENTS.get(metadata.get("langgraph_node"))
+                        token = chunk.content if isinstance(chunk.content, str) else ""
+                        tags = metadata.get("tags") or []
+                        if event and token and STREAM_TAG in tags:
+                            data = {"token": token}
+                            language = next((t[len(LANGUAGE_TAG_PREFIX):] for t in tags if t.startswith(LANGUAGE_TAG_PREFIX)), None)
+                            if language:
+                                data["language"] = language
+                                # A new LLM call in the same branch is a rewrite after failed validation
+                                if language_runs.setdefault(language, chunk.id) != chunk.id:
+                                    data["restart"] = True
+                                    language_runs[language] = chunk.id
+                            yield format_sse(event, data)
+
+                    elif mode == "updates":
+                        for node, update in payload.items():
+                            update = update or {}
+                            event = {"node": node}
+                            if node == "classify":
+                                event["intent"] = update.get("intent")
+                            elif node == "retrieve":
+                                event["documents"] = len(update.get("context", []))
+                            elif node == "validate":
+                                event["passed"] = update.get("feedback") == "PASS"
+                                event["attempt"] = update.get("attempt_count", 0)
+                            elif node == "generate_language":
+                                for result in update.get("language_results") or []:
+                                    event["language"] = result["language"]
+                                    event["passed"] = result["feedback"] == "PASS"
+                                    event["attempt"] = result["attempts"]
+                            if update.get("context_dropped_tokens"):
+                                event["context_dropped_tokens"] = update["context_dropped_tokens"]
+                            if update.get("cut_stages"):
+                                event["cut_stages"] = update["cut_stages"]
+                            yield format_sse("node", event)
+
+                    elif mode == "values":
+                        final_state = payload
+
+            print(f"🧾 Trace {trace.request_id}: {trace.describe()}")
+
+        result = await run_blocking(finalize, final_state)
+        if include_trace:
+            result = {**result, "trace": trace.to_dict()}
+        yield format_sse("result", result)
+    except Exception as e:
+        if on_error:
+            await run_blocking(on_error, e)
+        yield format_sse("error", {"detail": str(e)})
@@ -41,14 +41,28 @@ def list_sessions_cmd(user_id: str = None):
     
     print(f"Found {len(sessions)} sessions:")
     for s in sessions:
-        print(f"- {s.id} (User: {s.user_id}, Msgs: {len(s.messages)})")
+        print(f"- {s.id} (User: {s.user_id}, Msgs: {s.message_count})")
+
+@session_app.command("gc")
+def gc_sessions_cmd(
+    ttl_hours: float = typer.Option(None, help="Idle time before a session is archived (default: SESSION_TTL_SECONDS)")
+):
+    """
+    Archive idle sessions to compressed segments and compact the store.
+    """
+    ttl_seconds = ttl_hours * 3600 if ttl_hours is not None else None
+    archived = session_manager.archive_expired(ttl_seconds=ttl_seconds)
+    if archived:
+        print(colored(f"✅ Archived {archived} sessions to {session_manager.archive_dir}", "green"))
+    else:
+        print("No expired sessions.")
 
 @session_app.command("chat")
 def chat_session_cmd(session_id: str):
     """
     Interactive chat within a session.
     """
-    s = session_manager.get_session(session_id)
+    s = session_manager.get_session(session_id) or session_manager.restore_session(session_id)
     if not s:
         print(colored("❌ Session not found", "red"))
         raise typer.Exit(1)
@@ -62,45 +76,26 @@ def chat_session_cmd(session_id: str):
         print(colored(f"{m.role.title()}: {m.content}", color))
         
     # Interactive Loop
-    # Note: For CLI, we need to invoke the agent directly similar to API
-    # To keep it DRY, we might want to call the API function or duplicate the logic slightly.
-    # Calling API logic requires async context or direct agent invocation.
-    
-    # We will import agent graph (lazy load to avoid startup cost globally?)
-    try:
-        from backend.agent.graph import app_graph
-        from langchain_core.messages import HumanMessage, AIMessage
-    except ImportError:
-        from agent.graph import app_graph
-        from langchain_core.messages import HumanMessage, AIMessage
+    # Same turn preparation as the API: the checkpointed graph resumes the session's state
+    from agent.graph import session_graph
+    from api.sessions import prepare_session_chat
+    from core.checkpointer import thread_config
         
     while True:
         query = typer.prompt("You")
         if query.lower() in ["exit", "quit"]:
             break
             
-        session_manager.add_message(session_id, "user", query)
-        
-        # Build history
-        history_msgs = []
-        # Reload session to get latest msg
-        s = session_manager.get_session(session_id)
-        for m in s.messages:
-             if m.role == "user": history_msgs.append(HumanMessage(content=m.content))
-             else: history_msgs.append(AIMessage(content=m.content))
-             
-        inputs = {
-            "messages": history_msgs,
-            "intent": "general", "context": [], "plan": "", "generated_code": "", "error": ""
-        }
+        inputs = prepare_session_chat(session_id, query)
         
         print(colored("Thinking...", "magenta"))
         try:
-            result = app_graph.invoke(inputs)
+            result = session_graph.invoke(inputs, config=thread_config(session_id))
             response = result.get("generated_code", "")
             if not response: response = result.get("plan", "No response.")
             
             print(colored(f"Assistant: {response}", "cyan"))
+            session_manager.add_message(session_id, "user", query)
             session_manager.add_message(session_id, "assistant", response)
             
         except Exception as e:
@@ -0,0 +1,164 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+from core.deadline import remaining
+from core.exceptions import OverloadedError
+from core.tracing import span, Histogram
+
+# Agent runs executing at once across all clients (each run holds LLM calls and executor threads)
+MAX_CONCURRENT_RUNS = int(os.getenv("MAX_CONCURRENT_RUNS", 8))
+# Runs allowed to wait for a slot, and the longest estimated wait accepted before rejecting
+MAX_QUEUED_RUNS = int(os.getenv("MAX_QUEUED_RUNS", 32))
+MAX_QUEUE_WAIT_SECONDS = float(os.getenv("MAX_QUEUE_WAIT_SECONDS", 30))
+
+# Run duration assumed until real runs were measured, and the weight of each new measurement
+INITIAL_RUN_SECONDS = 15.0
+RUN_TIME_SMOOTHING = 0.2
+# Recent queue waits kept for the wait-time percentiles
+WAIT_SAMPLES = 1000
+
+class _Waiter:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False # Set under the lock when a finishing run hands its slot over
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+class AdmissionController:
+    """
+    Global concurrency limit with a bounded FIFO queue in front of agent runs.
+    - Up to `max_concurrent` runs execute; later ones wait in arrival order.
+    - A request is rejected up front (OverloadedError -> 503 + Retry-After) if the queue is full
+      or its estimated wait (queue position x average run time / slots) exceeds `max_wait`.
+    - A finishing run hands its slot directly to the next waiter (no thundering herd).
+    Thread-safe; waiters may come from different event loops.
+    """
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_RUNS, max_queued: int = MAX_QUEUED_RUNS, max_wait: float = MAX_QUEUE_WAIT_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        self.avg_run_seconds = INITIAL_RUN_SECONDS
+        self._lock = threading.Lock()
+        self._running = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.wait_histogram = Histogram()
+        self.admitted = 0
+        self.rejected = 0
+
+    def _estimated_wait(self, position: int) -> float:
+        if self._running < self.max_concurrent:
+            return 0.0
+        return position * self.avg_run_seconds / self.max_concurrent
+
+    def _check_locked(self):
+        if self._running < self.max_concurrent and not self._waiters:
+            return
+        wait = self._estimated_wait(len(self._waiters) + 1)
+        if len(self._waiters) >= self.max_queued or wait > self.max_wait:
+            self.rejected += 1
+            raise OverloadedError(
+                f"Server busy: {self._running} runs in progress, {len(self._waiters)} queued.",
+                details={"retry_after": max(1, math.ceil(wait)), "queued": len(self._waiters)}
+            )
+
+    def check(self):
+        """Rejects early (raises OverloadedError) if a new run would not be admitted in time."""
+        with self._lock:
+            self._check_locked()
+
+    async def acquire(self, deadline: Optional[float] = None) -> float:
+        """Waits for a run slot. Returns the time spent queued (seconds)."""
+        start = time.monotonic()
+        with self._lock:
+            if self._running < self.max_concurrent and not self._waiters:
+                self._running += 1
+                self._record_admission(0.0)
+                return 0.0
+            self._check_locked()
+            waiter = _Waiter(asyncio.get_running_loop())
+            self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(waiter.future, timeout=remaining(deadline))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if waiter.granted:
+                    self._hand_over_locked() # The slot arrived too late; pass it on
+                else:
+                    self._waiters.remove(waiter)
+                if isinstance(e, asyncio.TimeoutError):
+                    self.rejected += 1
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise OverloadedError("Request deadline passed while queued.", details={"retry_after": max(1, math.ceil(self.avg_run_seconds))})
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._record_admission(waited)
+        return waited
+
+    def release(self, run_seconds: Optional[float] = None):
+        with self._lock:
+            if run_seconds is not None:
+                self.avg_run_seconds += RUN_TIME_SMOOTHING * (run_seconds - self.avg_run_seconds)
+            self._hand_over_locked()
+
+    @asynccontextmanager
+    async def slot(self, deadline: Optional[float] = None):
+        """Holds a run slot for the duration of the block."""
+        with span("queue", "admission"):
+            waited = await self.acquire(deadline)
+        if waited:
+            print(f"🚦 Admitted after {waited:.1f}s in queue")
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def _hand_over_locked(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            try:
+                waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+            except RuntimeError:
+                continue # Its event loop is gone
+            waiter.granted = True
+            return
+        self._running -= 1
+
+    def _record_admission(self, waited: float):
+        self.admitted += 1
+        self._waits.append(waited)
+        self.wait_histogram.observe(waited)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "running": self._running,
+                "queued": len(self._waiters),
+                "max_concurrent": self.max_concurrent,
+                "max_queued": self.max_queued,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "avg_run_seconds": round(self.avg_run_seconds, 3),
+                "estimated_wait_seconds": round(self._estimated_wait(len(self._waiters) + 1), 3),
+                "wait_seconds": {
+                    "avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                    "p95": round(waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+                    "max": round(waits[-1], 3) if waits else 0.0,
+                },
+            }
+
+# Singleton
+admission_controller = AdmissionController()
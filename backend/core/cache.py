@@ -1,8 +1,19 @@
 
+import os
+import asyncio
+import threading
+from concurrent.futures import Future
 from cachetools import TTLCache
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Awaitable, Optional, Callable, Hashable, Tuple
 import numpy as np
 from core.vector_store import store as vector_store
+from core.tracing import span, record_cache
+
+WEB_SEARCH_CACHE_TTL = int(os.getenv("WEB_SEARCH_CACHE_TTL", 3600))
+
+def normalize_query(query: str) -> str:
+    """Cache key for free-text queries: case and whitespace insensitive."""
+    return " ".join(query.lower().split())
 
 class CacheManager:
     def __init__(self):
@@ -14,11 +25,19 @@ class CacheManager:
         self.semantic_cache = [] 
         self.semantic_threshold = 0.95
         self.max_semantic_size = 500
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
 
     def get(self, query: str) -> Optional[Dict[str, Any]]:
+        with span("cache", "search_results") as lookup:
+            result = self._lookup(query)
+            lookup.set(hit=result is not None)
+            return result
+
+    def _lookup(self, query: str) -> Optional[Dict[str, Any]]:
         # A. Check Exact Cache
         if query in self.exact_cache:
             print("⚡ Exact Cache Hit")
+            self.stats["exact_hits"] += 1
             return self.exact_cache[query]
             
         # B. Check Semantic Cache
@@ -35,8 +54,10 @@ class CacheManager:
         
         if best_score > self.semantic_threshold:
             print(f"🧠 Semantic Cache Hit (Score: {best_score:.4f})")
+            self.stats["semantic_hits"] += 1
             return best_result
             
+        self.stats["misses"] += 1
         return None
 
     def set(self, query: str, result: Dict[str, Any]):
@@ -54,6 +75,11 @@ class CacheManager:
             "result": result
         })
 
+    def clear(self):
+        """Drops every cached result (e.g. after the search index changed)."""
+        self.exact_cache.clear()
+        self.semantic_cache = []
+
     def _cosine_similarity(self, vec_a, vec_b):
         # Convert to numpy
         a = np.array(vec_a)
@@ -64,5 +90,109 @@ class CacheManager:
             return 0.0
         return np.dot(a, b) / (norm_a * norm_b)
 
-# Singleton
+class CoalescingTTLCache:
+    """
+    Thread-safe TTL cache for expensive external calls (web search, query rewrites).
+    Concurrent misses for the same key share one computation: the first caller runs it,
+    the others wait for its result. Failures are re-raised to every waiter and not cached.
+    """
+    def __init__(self, maxsize: int = 1000, ttl: int = WEB_SEARCH_CACHE_TTL, name: str = "ttl_cache"):
+        self.name = name # Label of its lookups in request traces
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self.hits += 1
+        record_cache(self.name, value is not None)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._cache[key] = value
+
+    def _claim(self, key: Hashable) -> Tuple[bool, Any, Optional[Future], bool]:
+        """(hit, value, in-flight future, whether the caller owns the computation)."""
+        with self._lock:
+            value = self._cache.get(key)
+            hit = value is not None
+            future, owner = None, False
+            if hit:
+                self.hits += 1
+            else:
+                future = self._inflight.get(key)
+                owner = future is None
+                if owner:
+                    self.misses += 1
+                    future = self._inflight[key] = Future()
+                else:
+                    self.coalesced += 1
+        record_cache(self.name, hit)
+        return hit, value, future, owner
+
+    def _complete(self, key: Hashable, future: Future, value: Any):
+        future.set_result(value)
+        if value is not None:
+            self.set(key, value)
+
+    def _release(self, key: Hashable):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        hit, value, future, owner = self._claim(key)
+        if hit:
+            return value
+        if not owner:
+            return future.result()
+
+        try:
+            value = compute()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            self._complete(key, future, value)
+            return value
+        finally:
+            self._release(key)
+
+    async def aget_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Async variant of get_or_compute; shares in-flight computations with sync and async callers."""
+        hit, value, future, owner = self._claim(key)
+        if hit:
+            return value
+        if not owner:
+            # Shielded: a cancelled waiter must not cancel the owner's computation
+            return await asyncio.shield(asyncio.wrap_future(future))
+
+        try:
+            value = await compute()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            future.cancel() # Owner cancelled: waiters see CancelledError, the next caller recomputes
+            raise
+        else:
+            self._complete(key, future, value)
+            return value
+        finally:
+            self._release(key)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+# Singletons
 cache_manager = CacheManager()
+# Web search results, keyed by normalized search query
+web_search_cache = CoalescingTTLCache(maxsize=1000, ttl=WEB_SEARCH_CACHE_TTL, name="web_search")
+# LLM-rewritten search queries, keyed by normalized user message
+search_query_cache = CoalescingTTLCache(maxsize=1000, ttl=WEB_SEARCH_CACHE_TTL, name="search_query")
@@ -0,0 +1,72 @@
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
+from langgraph.checkpoint.sqlite import SqliteSaver
+from core.concurrency import run_blocking
+
+# Graph state of each chat session (messages, retrieved context, ...), resumed on the next turn
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", "data/checkpoints.db")
+
+def thread_config(session_id: str) -> Dict[str, Any]:
+    """Run config that resumes (and stores) the graph state of a session."""
+    return {"configurable": {"thread_id": session_id}}
+
+class SessionCheckpointer(SqliteSaver):
+    """
+    LangGraph checkpointer for chat sessions (thread id = session id), backed by SQLite.
+    - Only the latest checkpoint of a session is kept: turns resume from the last state and
+      never time-travel, so the database grows with the number of sessions, not turns.
+    - The async methods (ainvoke/astream in the API) run the sync ones on the blocking executor.
+    """
+    def __init__(self, path: str = CHECKPOINT_DB_PATH):
+        self.path = path
+        super().__init__(self._open())
+
+    def _open(self) -> sqlite3.Connection:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        # One connection guarded by the saver's lock; WAL is enabled on setup
+        return sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+
+    def _init_db(self):
+        """(Re)opens the database at `self.path`."""
+        with self.lock:
+            self.conn.close()
+            self.conn = self._open()
+            self.is_setup = False
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        configurable = next_config["configurable"]
+        key = (configurable["thread_id"], configurable["checkpoint_ns"], configurable["checkpoint_id"])
+        with self.cursor() as cur:
+            # Checkpoint ids sort by time; the older ones (and their pending writes) are superseded
+            cur.execute("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?", key)
+            cur.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?", key)
+        return next_config
+
+    def delete_threads(self, thread_ids: Iterable[str]):
+        ids = [(str(thread_id),) for thread_id in thread_ids]
+        with self.cursor() as cur:
+            cur.executemany("DELETE FROM checkpoints WHERE thread_id = ?", ids)
+            cur.executemany("DELETE FROM writes WHERE thread_id = ?", ids)
+
+    async def aget_tuple(self, config):
+        return await run_blocking(self.get_tuple, config)
+
+    async def alist(self, config, *, filter: Optional[Dict[str, Any]] = None, before=None, limit: Optional[int] = None) -> AsyncIterator:
+        items = await run_blocking(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await run_blocking(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id: str, task_path: str = ""):
+        return await run_blocking(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str):
+        return await run_blocking(self.delete_thread, thread_id)
+
+# Singleton
+session_checkpointer = SessionCheckpointer()
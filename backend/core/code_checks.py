@@ -0,0 +1,278 @@
+import os
+import re
+import ast
+import sys
+import math
+import builtins
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel
+
+# When to still ask the LLM reviewer after the local checks passed:
+# - "always": every time (local checks only save the calls that would fail anyway)
+# - "auto": only if the code contains something the local checks cannot cover
+#           (non-Python blocks, imports of unknown packages)
+# - "never": local checks only
+VALIDATION_LLM_POLICY = os.getenv("VALIDATION_LLM_POLICY", "auto").lower()
+
+PYTHON_LANGS = {"python", "py", "python3"}
+
+# Third-party packages generated API clients commonly use
+COMMON_PACKAGES = {
+    "requests", "httpx", "aiohttp", "urllib3", "pydantic", "dotenv", "yaml", "jwt", "authlib",
+    "fastapi", "flask", "django", "starlette", "uvicorn", "boto3", "botocore", "google",
+    "stripe", "twilio", "openai", "numpy", "pandas", "dateutil", "pytz", "tenacity",
+    "websockets", "grpc", "graphql", "gql", "sqlalchemy", "redis", "pytest",
+}
+KNOWN_MODULES = set(sys.stdlib_module_names) | COMMON_PACKAGES
+
+SECRET_PATTERNS = [
+    ("AWS access key", re.compile(r"\bAKIA[0-9A-Z]{16}\b")),
+    ("Groq API key", re.compile(r"\bgsk_[A-Za-z0-9]{20,}")),
+    ("OpenAI/Stripe secret key", re.compile(r"\b(?:sk|rk)_(?:live|test)_[A-Za-z0-9]{16,}|\bsk-[A-Za-z0-9_-]{20,}")),
+    ("GitHub token", re.compile(r"\bgh[pousr]_[A-Za-z0-9]{36,}")),
+    ("Slack token", re.compile(r"\bxox[abposr]-[A-Za-z0-9-]{10,}")),
+    ("Private key", re.compile(r"-----BEGIN (?:RSA |EC |OPENSSH )?PRIVATE KEY-----")),
+]
+# Generic `api_key = "..."` assignments are flagged only if the value looks random (see looks_random)
+SECRET_ASSIGNMENT = re.compile(
+    r"""(?i)\b([\w-]*(?:api[_-]?key|secret|token|password|passwd|auth)[\w-]*)["']?\s*[:=]\s*["']([^"'\s]{12,})["']"""
+)
+# Names and values of configuration that only mention a secret (TOKEN_URL = "https://.../token")
+NON_SECRET_SUFFIXES = ("_url", "_uri", "_endpoint", "_header")
+PLACEHOLDER_HINTS = ("your", "xxx", "example", "placeholder", "changeme", "<", "${", "{{", "...")
+MIN_SECRET_ENTROPY = 3.5
+# Identifiers made of words ("BearerTokenAuthenticationV2x", "default_token_value") are not keys
+WORD_PATTERN = re.compile(r"[A-Za-z][a-z]{3,}")
+MAX_WORD_COVERAGE = 0.6
+
+FENCE = re.compile(r"```([\w+#.-]*)[^\n]*\n(.*?)```", re.DOTALL)
+OTHER_INFINITE_LOOP = re.compile(r"while\s*\(\s*(?:true|1)\s*\)|for\s*\(\s*;\s*;\s*\)|\bloop\s*\{", re.IGNORECASE)
+
+def extract_code_blocks(text: str) -> List[Tuple[str, str]]:
+    """(language, code) of each fenced block; unfenced output is one block of unknown language."""
+    blocks = [(lang.lower(), code) for lang, code in FENCE.findall(text)]
+    return blocks if blocks else [("", text)]
+
+def shannon_entropy(value: str) -> float:
+    counts = Counter(value)
+    return -sum(c / len(value) * math.log2(c / len(value)) for c in counts.values())
+
+def looks_random(value: str) -> bool:
+    """A generated key's shape: several character classes, high entropy, not mostly words."""
+    classes = sum((
+        any(c.islower() for c in value), any(c.isupper() for c in value),
+        any(c.isdigit() for c in value), any(not c.isalnum() for c in value),
+    ))
+    words = sum(len(word) for word in WORD_PATTERN.findall(value))
+    return classes >= 2 and words / len(value) <= MAX_WORD_COVERAGE and shannon_entropy(value) >= MIN_SECRET_ENTROPY
+
+class CheckReport(BaseModel):
+    issues: List[str] = []     # Defects: the code is sent back for a rewrite
+    warnings: List[str] = []   # Not provably wrong; the LLM reviewer may look at it
+    python_blocks: int = 0
+    other_blocks: int = 0
+
+    @property
+    def passed(self) -> bool:
+        return not self.issues
+
+    def feedback(self) -> str:
+        return "\n".join(f"- {issue}" for issue in self.issues)
+
+class _PythonAnalyzer(ast.NodeVisitor):
+    """Collects bound names, used module-like names and suspicious loops of one module."""
+    def __init__(self):
+        self.bound = set(dir(builtins))
+        self.imported = []
+        self.used = {}
+        self.module_uses = set() # Names whose attributes are accessed (`json.dumps`)
+        self.infinite_loops = []
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.imported.append(alias.name.split(".")[0])
+            self.bound.add(alias.asname or alias.name.split(".")[0])
+
+    def visit_ImportFrom(self, node):
+        if node.module and node.level == 0:
+            self.imported.append(node.module.split(".")[0])
+        for alias in node.names:
+            self.bound.add(alias.asname or alias.name)
+
+    def _bind_args(self, args: ast.arguments):
+        for arg in args.posonlyargs + args.args + args.kwonlyargs + [args.vararg, args.kwarg]:
+            if arg:
+                self.bound.add(arg.arg)
+
+    def visit_FunctionDef(self, node):
+        self.bound.add(node.name)
+        self._bind_args(node.args)
+        self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node):
+        self._bind_args(node.args)
+        self.generic_visit(node)
+
+    def visit_ClassDef(self, node):
+        self.bound.add(node.name)
+        self.generic_visit(node)
+
+    def visit_ExceptHandler(self, node):
+        if node.name:
+            self.bound.add(node.name)
+        self.generic_visit(node)
+
+    def visit_Global(self, node):
+        self.bound.update(node.names)
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, (ast.Store, ast.Del)):
+            self.bound.add(node.id)
+        else:
+            self.used.setdefault(node.id, node.lineno)
+
+    def visit_Attribute(self, node):
+        if isinstance(node.value, ast.Name) and isinstance(node.value.ctx, ast.Load):
+            self.module_uses.add(node.value.id)
+        self.generic_visit(node)
+
+    def visit_MatchAs(self, node):
+        if node.name:
+            self.bound.add(node.name)
+        self.generic_visit(node)
+
+    def visit_While(self, node):
+        if isinstance(node.test, ast.Constant) and node.test.value and not self._exits(node.body):
+            self.infinite_loops.append(node.lineno)
+        self.generic_visit(node)
+
+    def _exits(self, body) -> bool:
+        """
+        True if the loop body can leave the loop (break/return/raise/exit) or hand control back
+        (yield/await: generators and consumers), ignoring nested scopes and loops.
+        """
+        stack = list(body)
+        while stack:
+            node = stack.pop()
+            if isinstance(node, (ast.Break, ast.Return, ast.Raise, ast.Yield, ast.YieldFrom, ast.Await)):
+                return True
+            if isinstance(node, ast.Call) and isinstance(node.func, (ast.Name, ast.Attribute)):
+                name = node.func.id if isinstance(node.func, ast.Name) else node.func.attr
+                if name in ("exit", "_exit", "quit"):
+                    return True
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef, ast.While, ast.For, ast.AsyncFor)):
+                continue # A break in there leaves a different loop
+            stack.extend(ast.iter_child_nodes(node))
+        return False
+
+class CodeChecker:
+    """
+    Millisecond checks for the defects the LLM reviewer is asked about:
+    syntax errors, missing imports and hardcoded secrets (suspected infinite loops are left to the reviewer).
+    Python blocks are analyzed with `ast`; secrets are scanned in every block.
+    """
+    def check(self, generated: str) -> CheckReport:
+        report = CheckReport()
+        analyzed: List[Tuple[str, _PythonAnalyzer]] = []
+        for number, (lang, code) in enumerate(extract_code_blocks(generated), start=1):
+            label = f"block {number}" + (f" ({lang})" if lang else "")
+            self._check_secrets(code, label, report)
+            if lang in PYTHON_LANGS:
+                report.python_blocks += 1
+                analyzer = self._check_python(code, label, report)
+                if analyzer:
+                    analyzed.append((label, analyzer))
+            else:
+                report.other_blocks += 1
+                if OTHER_INFINITE_LOOP.search(code) and not re.search(r"\b(break|return|throw|exit|yield|await)\b", code):
+                    report.warnings.append(f"Possible infinite loop in {label}: loop without break/return.")
+        self._check_imports(analyzed, report)
+        return report
+
+    def _check_secrets(self, code: str, label: str, report: CheckReport):
+        for name, pattern in SECRET_PATTERNS:
+            if pattern.search(code):
+                report.issues.append(f"Hardcoded secret in {label}: {name}. Load it from an environment variable instead.")
+        for match in SECRET_ASSIGNMENT.finditer(code):
+            name, value = match.group(1).lower().replace("-", "_"), match.group(2)
+            if any(hint in value.lower() for hint in PLACEHOLDER_HINTS):
+                continue
+            if "://" in value or value.startswith("/") or name.endswith(NON_SECRET_SUFFIXES):
+                continue
+            if looks_random(value):
+                line = code.count("\n", 0, match.start()) + 1
+                report.issues.append(f"Hardcoded secret in {label}, line {line}. Load it from an environment variable instead.")
+
+    def _check_python(self, code: str, label: str, report: CheckReport) -> Optional[_PythonAnalyzer]:
+        try:
+            tree = ast.parse(code)
+        except SyntaxError as e:
+            report.issues.append(f"Syntax error in {label}, line {e.lineno}: {e.msg}")
+            return None
+
+        analyzer = _PythonAnalyzer()
+        analyzer.visit(tree)
+
+        # Loops stopped by a signal or KeyboardInterrupt are legitimate: the LLM reviewer decides
+        for line in analyzer.infinite_loops:
+            report.warnings.append(f"Possible infinite loop in {label}, line {line}: `while True` without break/return/raise/yield/await.")
+        for module in dict.fromkeys(analyzer.imported):
+            if module not in KNOWN_MODULES:
+                report.warnings.append(f"Unknown package `{module}` in {label}.")
+        return analyzer
+
+    def _check_imports(self, analyzed: List[Tuple[str, "_PythonAnalyzer"]], report: CheckReport):
+        """
+        Module names used without an import. Blocks of one response build on each other (a usage
+        block calls what an earlier block defined), so names bound in any block count. Only a name
+        used as a module (`json.dumps`) is a defect; a bare `token` or `queue` is likely a variable.
+        """
+        bound = set().union(*(analyzer.bound for _, analyzer in analyzed))
+        for label, analyzer in analyzed:
+            for name, line in sorted(analyzer.used.items(), key=lambda item: item[1]):
+                if name in bound or name not in KNOWN_MODULES:
+                    continue
+                if name in analyzer.module_uses:
+                    report.issues.append(f"Missing import in {label}, line {line}: `{name}` is used but never imported.")
+                else:
+                    report.warnings.append(f"Possibly missing import in {label}, line {line}: `{name}` is never imported or assigned.")
+
+def llm_review_required(report: CheckReport, policy: str = None) -> bool:
+    """Whether the LLM reviewer still has to look at code that passed the local checks."""
+    policy = policy or VALIDATION_LLM_POLICY
+    if policy == "never":
+        return False
+    if policy == "always":
+        return True
+    return bool(report.other_blocks or report.warnings)
+
+class ValidationStats:
+    """Counts validations by outcome to report how many LLM reviews the local checks avoided."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {"local_rejected": 0, "local_passed": 0, "llm_reviewed": 0}
+
+    def record(self, outcome: str):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    @property
+    def avoided_ratio(self) -> float:
+        total = self.total
+        return (total - self.counts["llm_reviewed"]) / total if total else 0.0
+
+    def summary(self) -> str:
+        total = self.total
+        return f"LLM validation avoided: {self.avoided_ratio:.0%} ({total - self.counts['llm_reviewed']}/{total})"
+
+# Singletons
+code_checker = CodeChecker()
+validation_stats = ValidationStats()
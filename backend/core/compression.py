@@ -0,0 +1,111 @@
+import os
+import re
+import math
+from typing import List
+import numpy as np
+from core.vector_store import store as vector_store
+
+# Query-focused extractive compression of retrieved documents
+CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "true").lower() == "true"
+COMPRESSION_KEEP_RATIO = float(os.getenv("COMPRESSION_KEEP_RATIO", 0.5))
+
+# Documents shorter than this are only deduplicated, not compressed
+MIN_COMPRESS_CHARS = 400
+MIN_UNITS_PER_DOC = 3
+MAX_UNITS_PER_DOC = 40
+MAX_CHARS_PER_DOC = 4000
+MAX_UNIT_CHARS = 400
+# Lines that identify a document are always kept
+HEADER_PATTERN = re.compile(r"^(Source URL|API|Endpoint|Fallback Search Result|Web Search Result)\b")
+# Shorter lines are too generic to count as repeated boilerplate
+MIN_BOILERPLATE_CHARS = 20
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+def _split_line(line: str) -> List[str]:
+    """Long lines (e.g. whitespace-collapsed scraped pages) become sentences of bounded size."""
+    if len(line) <= MAX_UNIT_CHARS:
+        return [line]
+    units = []
+    for sentence in SENTENCE_SPLIT.split(line):
+        while len(sentence) > MAX_UNIT_CHARS * 2:
+            cut = sentence.rfind(" ", 0, MAX_UNIT_CHARS)
+            cut = cut if cut > 0 else MAX_UNIT_CHARS
+            units.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if sentence:
+            units.append(sentence)
+    return units
+
+class ContextCompressor:
+    """
+    Keeps the lines/sentences of each document that are most similar to the query.
+    - Lines repeated across documents (e.g. the OpenAPI `global_context` in every chunk)
+      are kept only in the first document.
+    - Identifying header lines are always kept; original order is preserved.
+    - Per document: top `keep_ratio` of the units, at most MAX_UNITS_PER_DOC / MAX_CHARS_PER_DOC.
+    All units of all documents are embedded in one batch and scored with a single
+    matrix product against the query embedding.
+    """
+    def __init__(self, keep_ratio: float = COMPRESSION_KEEP_RATIO):
+        self.keep_ratio = keep_ratio
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(vector_store.embedding_fn(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def compress(self, query: str, documents: List[str]) -> List[str]:
+        # 1. Split into units: [(doc index, line index, text, is header)]
+        seen_lines = set()
+        units = []
+        for d, doc in enumerate(documents):
+            for l, line in enumerate(doc.split("\n")):
+                line = line.strip()
+                if not line:
+                    continue
+                header = bool(HEADER_PATTERN.match(line))
+                if not header and len(line) >= MIN_BOILERPLATE_CHARS:
+                    if line in seen_lines:
+                        continue
+                    seen_lines.add(line)
+                for piece in _split_line(line):
+                    units.append((d, l, piece, header))
+
+        # 2. Score the units of long documents against the query (one batch)
+        long_docs = {d for d, doc in enumerate(documents) if len(doc) >= MIN_COMPRESS_CHARS}
+        scored = [i for i, (d, _, _, header) in enumerate(units) if d in long_docs and not header]
+        similarity = {}
+        if scored:
+            try:
+                vectors = self._embed([query] + [units[i][2] for i in scored])
+                scores = vectors[1:] @ vectors[0]
+                similarity = dict(zip(scored, scores.tolist()))
+            except Exception as e:
+                print(f"⚠️ Context compression skipped (embedding failed): {e}")
+                long_docs = set()
+
+        # 3. Select per document, then rebuild in original order
+        by_doc = {}
+        for i in scored:
+            by_doc.setdefault(units[i][0], []).append(i)
+        keep = {i for i, (d, _, _, header) in enumerate(units) if d not in long_docs or header}
+        for d in long_docs:
+            candidates = sorted(by_doc.get(d, []), key=lambda i: -similarity[i])
+            budget_units = min(MAX_UNITS_PER_DOC, max(MIN_UNITS_PER_DOC, math.ceil(self.keep_ratio * len(candidates))))
+            budget_chars = MAX_CHARS_PER_DOC
+            for i in candidates[:budget_units]:
+                if len(units[i][2]) > budget_chars:
+                    continue
+                keep.add(i)
+                budget_chars -= len(units[i][2])
+
+        lines = [{} for _ in documents]
+        for i in sorted(keep):
+            d, l, text, _ = units[i]
+            lines[d].setdefault(l, []).append(text)
+        return ["\n".join(" ".join(parts) for parts in doc_lines.values()) for doc_lines in lines]
+
+# Singleton
+compressor = ContextCompressor()
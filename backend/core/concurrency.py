@@ -0,0 +1,21 @@
+import os
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+# Bounded pool for blocking-only dependencies (Chroma, BM25, DuckDuckGo, SQLite, HTML parsing)
+# so they never run on the event loop.
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", 16))
+
+blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Runs a blocking call on the bounded executor and awaits its result.
+    The caller's context (e.g. LangChain run config) is carried into the worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(blocking_executor, call)
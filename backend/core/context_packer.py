@@ -0,0 +1,94 @@
+import os
+import hashlib
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+
+# Tokens of retrieved context allowed in a single prompt, per model (prompt size drives latency and cost)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 6000))
+MODEL_CONTEXT_BUDGETS = {
+    "llama-3.1-8b-instant": CONTEXT_TOKEN_BUDGET,
+    "llama-3.3-70b-versatile": CONTEXT_TOKEN_BUDGET,
+    "llama3.2:3b": min(CONTEXT_TOKEN_BUDGET, 3000), # Small local context window
+}
+# A partially fitting snippet is cut down only if at least this much of it fits
+MIN_SNIPPET_TOKENS = 100
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English/code)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def content_hash(text: str) -> str:
+    """Identity of a snippet, insensitive to whitespace differences."""
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+def dedupe_snippets(snippets: List[str]) -> List[str]:
+    """Drops repeated snippets (same content hash), keeping the first occurrence. O(n)."""
+    seen = set()
+    unique = []
+    for snippet in snippets:
+        key = content_hash(snippet)
+        if key not in seen:
+            seen.add(key)
+            unique.append(snippet)
+    return unique
+
+def budget_for(llm) -> int:
+    """Context budget of a chat model (ChatGroq exposes `model_name`, ChatOllama `model`)."""
+    models = getattr(llm, "model_names", None)
+    if isinstance(models, list) and models:
+        # Routed LLM: the prompt must also fit the models it may fall back to
+        return min(MODEL_CONTEXT_BUDGETS.get(model, CONTEXT_TOKEN_BUDGET) for model in models)
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", None)
+    return MODEL_CONTEXT_BUDGETS.get(model, CONTEXT_TOKEN_BUDGET)
+
+class PackedContext(BaseModel):
+    text: str
+    snippets: List[str]
+    used_tokens: int
+    dropped_tokens: int
+    dropped_snippets: int
+
+class ContextPacker:
+    """
+    Builds the context section of a prompt:
+    1. Dedupe by content hash.
+    2. Rank by retrieval score (unknown scores rank last, original order breaks ties).
+    3. Greedily fill the token budget; the first snippet that does not fit is truncated
+       if enough room is left, the rest are dropped.
+    """
+    def __init__(self, separator: str = "\n\n"):
+        self.separator = separator
+
+    def pack(self, snippets: List[str], budget_tokens: int, scores: Optional[Dict[str, float]] = None) -> PackedContext:
+        scores = scores or {}
+        unique = dedupe_snippets(snippets)
+        ranked = sorted(unique, key=lambda s: -scores.get(content_hash(s), 0.0))
+
+        separator_tokens = estimate_tokens(self.separator)
+        packed: List[str] = []
+        used = dropped = dropped_snippets = 0
+        for snippet in ranked:
+            tokens = estimate_tokens(snippet)
+            remaining = budget_tokens - used - (separator_tokens if packed else 0)
+            if tokens <= remaining:
+                packed.append(snippet)
+                used += tokens + (separator_tokens if len(packed) > 1 else 0)
+            elif remaining >= MIN_SNIPPET_TOKENS:
+                packed.append(snippet[:remaining * CHARS_PER_TOKEN])
+                used += remaining + (separator_tokens if len(packed) > 1 else 0)
+                dropped += tokens - remaining
+            else:
+                dropped += tokens
+                dropped_snippets += 1
+
+        return PackedContext(
+            text=self.separator.join(packed),
+            snippets=packed,
+            used_tokens=used,
+            dropped_tokens=dropped,
+            dropped_snippets=dropped_snippets
+        )
+
+# Singleton
+context_packer = ContextPacker()
@@ -0,0 +1,41 @@
+import os
+import time
+from typing import Optional
+
+# Overall time budget of one chat request in seconds (0 disables the deadline)
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", 90))
+
+# Time left that an optional stage needs to be started; below it the stage is cut
+# and the request degrades instead of running past its deadline.
+STAGE_MIN_SECONDS = {
+    "expansion": 45,   # LLM query variations before Hybrid Search
+    "web_search": 20,  # Query rewrite + DuckDuckGo when nothing else was found
+    "compression": 20, # Embedding the retrieved documents
+    "generate": 15,    # Code generation after the plan
+    "llm_review": 10,  # LLM code review after the local checks
+    "refinement": 30,  # Another generate + validate round after a failed validation
+}
+# Kept free for the plan while retrieving
+PLAN_RESERVE_SECONDS = 10
+
+def new_deadline(seconds: Optional[float] = None) -> Optional[float]:
+    """Absolute deadline (epoch seconds, so it stays valid in serialized state) or None."""
+    seconds = REQUEST_DEADLINE_SECONDS if seconds is None else seconds
+    return time.time() + seconds if seconds > 0 else None
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Seconds left before the deadline (never negative), or None without a deadline."""
+    return None if deadline is None else max(0.0, deadline - time.time())
+
+def time_for(deadline: Optional[float], stage: str) -> bool:
+    """Whether there is enough time left to start an optional stage."""
+    left = remaining(deadline)
+    if left is None or left >= STAGE_MIN_SECONDS[stage]:
+        return True
+    print(f"✂️ Skipping {stage} ({left:.1f}s left)")
+    return False
+
+def bounded(timeout: float, deadline: Optional[float], reserve: float = 0.0) -> float:
+    """A stage timeout shortened to fit the time left (minus `reserve` kept for later stages)."""
+    left = remaining(deadline)
+    return timeout if left is None else max(0.0, min(timeout, left - reserve))
@@ -17,3 +17,15 @@ class RetrievalError(AppError):
 class ServiceUnavailableError(AppError):
     """Raised when a circuit breaker is open or dependent service is down."""
     pass
+
+class DeadlineExceededError(AppError):
+    """Raised when a request runs out of its end-to-end time budget."""
+    pass
+
+class OverloadedError(ServiceUnavailableError):
+    """Raised when admission control rejects a run (details carry `retry_after` seconds)."""
+    pass
+
+class LLMOverloadedError(OverloadedError):
+    """Raised when an LLM call is shed because its model's rate budget would not free up in time (details carry `retry_after` seconds)."""
+    pass
@@ -2,10 +2,12 @@
 from typing import List
 from langchain_core.messages import HumanMessage
 from core.llm_client import LLMFactory
+from core.tracing import span, record_usage
+from core.semantic_cache import semantic_llm_cache
 
 class QueryExpander:
     def __init__(self):
-        self.llm = LLMFactory.create_llm("reasoning")
+        self.llm = LLMFactory.create_llm("expansion")
         
     def expand(self, original_query: str) -> List[str]:
         """
@@ -22,10 +24,19 @@ class QueryExpander:
         Output format: A simple list separated by newlines. NO numbering. NO explanations.
         """
         
+        def generate() -> str:
+            messages = [HumanMessage(content=prompt)]
+            with span("llm", "expansion") as llm_span:
+                response = self.llm.invoke(messages)
+                record_usage(llm_span, messages, response)
+            return response.content
+
         try:
-            response = self.llm.invoke([HumanMessage(content=prompt)])
+            # Near-duplicate queries ("auth error" / "authentication error") reuse earlier expansions
+            with span("retrieval", "expansion"):
+                content = semantic_llm_cache.get_or_compute("expansion", original_query, generate)
             # Split lines and clean
-            variations = [line.strip().strip('- ') for line in response.content.split('\n') if line.strip()]
+            variations = [line.strip().strip('- ') for line in content.split('\n') if line.strip()]
             # Limit to top 2 + original
             final_queries = [original_query] + variations[:2]
             # Dedupe
@@ -0,0 +1,133 @@
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from pydantic import BaseModel
+from core.vector_store import store as vector_store
+
+# Reuse the previous turn's retrieval results for follow-ups in a session
+FOLLOWUP_REUSE = os.getenv("FOLLOWUP_REUSE", "true").lower() == "true"
+# Similarity to an earlier query of the topic that makes a message a follow-up by itself...
+FOLLOWUP_MIN_SIMILARITY = float(os.getenv("FOLLOWUP_MIN_SIMILARITY", 0.6))
+# ...and the lower similarity that is enough when the message also refers back ("do it in Go", "that endpoint")
+FOLLOWUP_REFERENCE_SIMILARITY = float(os.getenv("FOLLOWUP_REFERENCE_SIMILARITY", 0.35))
+
+# Query embeddings kept per topic (the topic drifts as the conversation goes on)
+MAX_TOPIC_QUERIES = 5
+MIN_TERM_CHARS = 3
+
+# Explicit references to the previous answer; a pronoun alone ("what is it", "how does this work") is not one
+REFERENCE_PATTERN = re.compile(
+    r"\b(same|instead|again|above|previous|earlier|rewrite|convert|translate|port)\b"
+    r"|\b(do|redo|change|fix|update|extend|run) (it|that|this|them)\b"
+    r"|\b(that|this|these|those|your) (code|snippet|script|function|endpoint|example|answer|version|request|call)s?\b",
+    re.IGNORECASE
+)
+TERM_PATTERN = re.compile(r"[a-z0-9_./{}-]+")
+TERM_PART_PATTERN = re.compile(r"[a-z0-9_]+")
+STOPWORDS = {
+    "the", "and", "for", "with", "from", "into", "what", "which", "how", "does", "can", "could", "would",
+    "should", "please", "you", "your", "our", "are", "was", "were", "will", "use", "using", "make", "give",
+    "show", "write", "code", "example", "version", "one", "all", "any", "but", "not", "just", "like", "then",
+    "there", "here", "about", "want", "need", "let", "lets", "now", "also", "too", "instead", "again", "same",
+    "that", "this", "these", "those", "them", "its", "way", "language", "rewrite", "convert", "translate",
+    "port",
+}
+
+class FollowUp(BaseModel):
+    is_follow_up: bool
+    similarity: float
+    embedding: Optional[List[float]] = None # Of this message (None if embedding failed)
+    new_terms: List[str] = []                # Content words not covered by the topic's documents
+
+def _terms(text: str) -> List[str]:
+    return [t.strip(".-") for t in TERM_PATTERN.findall(text.lower())]
+
+def _stem(term: str) -> str:
+    """Drops a plural 's' so "list" matches "lists"."""
+    return term[:-1] if len(term) > MIN_TERM_CHARS and term.endswith("s") and not term.endswith("ss") else term
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class FollowUpDetector:
+    """
+    Decides whether a session message continues the current topic, so retrieval can start
+    from the topic's documents instead of searching again:
+    - cosine similarity of the message to the topic's recent queries (same embedding model as the vector store)
+    - referential phrasing ("now do it in Go") lowers the similarity required
+    Only words of the message the topic's documents do not cover are searched for.
+    """
+    def __init__(self, min_similarity: float = FOLLOWUP_MIN_SIMILARITY, reference_similarity: float = FOLLOWUP_REFERENCE_SIMILARITY):
+        self.min_similarity = min_similarity
+        self.reference_similarity = reference_similarity
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {"follow_up": 0, "new_topic": 0, "searched": 0}
+
+    def embed(self, text: str) -> Optional[List[float]]:
+        try:
+            return _normalize(vector_store.embedding_fn([text])[0]).tolist()
+        except Exception as e:
+            print(f"⚠️ Follow-up detection unavailable: {e}")
+            return None
+
+    def new_terms(self, query: str, documents: List[str], ignore: Optional[re.Pattern] = None) -> List[str]:
+        """
+        Content words of the query the documents do not contain as whole words (`ignore` removes e.g. language
+        names first). Paths count word by word too: "/pets/{id}" covers "pets".
+        """
+        if ignore is not None:
+            query = ignore.sub(" ", query)
+        covered = set()
+        for term in _terms("\n".join(documents)):
+            covered.add(_stem(term))
+            covered.update(_stem(part) for part in TERM_PART_PATTERN.findall(term))
+        return list(dict.fromkeys(
+            t for t in _terms(query) if len(t) >= MIN_TERM_CHARS and t not in STOPWORDS and _stem(t) not in covered
+        ))
+
+    def assess(self, query: str, topic_embeddings: List[List[float]], topic_documents: List[str], ignore: Optional[re.Pattern] = None) -> FollowUp:
+        embedding = self.embed(query)
+        if embedding is None or not topic_embeddings or not topic_documents:
+            return self._record(FollowUp(is_follow_up=False, similarity=0.0, embedding=embedding))
+
+        similarity = float(max(np.asarray(topic_embeddings, dtype=np.float32) @ np.asarray(embedding, dtype=np.float32)))
+        required = self.reference_similarity if REFERENCE_PATTERN.search(query) else self.min_similarity
+        if similarity < required:
+            return self._record(FollowUp(is_follow_up=False, similarity=similarity, embedding=embedding))
+        return self._record(FollowUp(
+            is_follow_up=True, similarity=similarity, embedding=embedding,
+            new_terms=self.new_terms(query, topic_documents, ignore)
+        ))
+
+    def topic_embeddings(self, followup: FollowUp, previous: List[List[float]]) -> List[List[float]]:
+        """Query embeddings of the topic after this message."""
+        kept = list(previous) if followup.is_follow_up else []
+        if followup.embedding is not None:
+            kept.append(followup.embedding)
+        return kept[-MAX_TOPIC_QUERIES:]
+
+    def _record(self, followup: FollowUp) -> FollowUp:
+        with self._lock:
+            if followup.is_follow_up:
+                self.counts["follow_up"] += 1
+                if followup.new_terms:
+                    self.counts["searched"] += 1
+            else:
+                self.counts["new_topic"] += 1
+        return followup
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            counts = dict(self.counts)
+        follow_ups = counts["follow_up"]
+        return {
+            **counts,
+            "retrieval_skipped_ratio": (follow_ups - counts["searched"]) / follow_ups if follow_ups else 0.0,
+        }
+
+# Singleton
+followup_detector = FollowUpDetector()
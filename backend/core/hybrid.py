@@ -3,13 +3,26 @@ from rank_bm25 import BM25Okapi
 from core.vector_store import store as vector_store
 from typing import List, Dict, Any
 import numpy as np
+import os
 import re
+import time
+import threading
+from core.tracing import traced
+
+# Rebuilds requested by newly indexed pages are batched: at most one per interval (seconds)
+INDEX_SYNC_INTERVAL = float(os.getenv("INDEX_SYNC_INTERVAL", 10))
 
 class HybridRetriever:
-    def __init__(self):
+    def __init__(self, sync_interval: float = INDEX_SYNC_INTERVAL):
         self.bm25 = None
         self.doc_registry = {} # Map index -> (id, content, metadata)
         self.corpus = []
+        self.generation = 0 # Incremented on every index rebuild
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()       # Swapping / reading the index structures together
+        self._sync_lock = threading.Lock()  # One rebuild at a time
+        self._sync_pending = False
+        self._last_sync = 0.0
         
         # Initial Sync
         self.sync_index()
@@ -18,37 +31,69 @@ class HybridRetriever:
         """
         Fetches all docs from Vector Store and builds BM25 index.
         Should be called on startup and after uploads.
+        The new index is built aside and swapped in at once; searches never see a half-built one.
         """
-        print("🔄 Syncing BM25 Index...")
-        data = vector_store.get_all_documents()
-        
-        if not data or not data.get("documents"):
-            print("⚠️ No documents found in Vector Store to sync.")
-            self.bm25 = None
-            return
-
-        documents = data["documents"]
-        ids = data["ids"]
-        metadatas = data["metadatas"]
-        
-        self.corpus = documents
-        self.doc_registry = {i: {"id": ids[i], "content": doc, "metadata": metadatas[i] if metadatas else {}} 
-                             for i, doc in enumerate(documents)}
-        
-        # Tokenize
-        tokenized_corpus = [self._tokenize(doc) for doc in documents]
-        self.bm25 = BM25Okapi(tokenized_corpus)
-        print(f"✅ BM25 Index Built with {len(documents)} documents.")
+        with self._sync_lock:
+            print("🔄 Syncing BM25 Index...")
+            data = vector_store.get_all_documents()
+
+            bm25, corpus, doc_registry = None, [], {}
+            if data and data.get("documents"):
+                documents = data["documents"]
+                ids = data["ids"]
+                metadatas = data["metadatas"]
+                corpus = documents
+                doc_registry = {i: {"id": ids[i], "content": doc, "metadata": metadatas[i] if metadatas else {}}
+                                for i, doc in enumerate(documents)}
+                # Tokenize
+                bm25 = BM25Okapi([self._tokenize(doc) for doc in documents])
+
+            with self._lock:
+                self.bm25, self.corpus, self.doc_registry = bm25, corpus, doc_registry
+                self.generation += 1
+                self._last_sync = time.monotonic()
+
+            # Cached results may predate the new documents
+            from core.cache import cache_manager
+            cache_manager.clear()
+            if bm25 is None:
+                print("⚠️ No documents found in Vector Store to sync.")
+            else:
+                print(f"✅ BM25 Index Built with {len(corpus)} documents.")
+
+    def request_sync(self):
+        """
+        Schedules a rebuild for documents added in the background (e.g. scraped pages).
+        Requests arriving while one is pending share it; rebuilds start at most every `sync_interval` seconds.
+        """
+        with self._lock:
+            if self._sync_pending:
+                return
+            self._sync_pending = True
+            delay = max(0.0, self._last_sync + self.sync_interval - time.monotonic())
+        timer = threading.Timer(delay, self._run_pending_sync)
+        timer.daemon = True
+        timer.start()
+
+    def _run_pending_sync(self):
+        with self._lock:
+            # Documents added from now on need another rebuild
+            self._sync_pending = False
+        try:
+            self.sync_index()
+        except Exception as e:
+            print(f"⚠️ BM25 index sync failed: {e}")
 
     def _tokenize(self, text: str) -> List[str]:
         # Simple whitespace + alphanumeric tokenizer
         # "Hello, world!" -> ["hello", "world"]
         return re.findall(r'\w+', text.lower())
 
-    def search(self, query: str, n_results: int = 3, fusion_weight: float = 0.5, filters: Dict[str, str] = None) -> Dict[str, Any]:
+    @traced("retrieval", "hybrid_search")
+    def search(self, query: str, n_results: int = 3, fusion_weight: float = 0.5, filters: Dict[str, str] = None, expand: bool = True) -> Dict[str, Any]:
         """
         Performs Hybrid Search using Reciprocal Rank Fusion (RRF).
-        Enriched with Caching and Query Expansion.
+        Enriched with Caching and Query Expansion (`expand=False` skips the expansion LLM call).
         """
         from core.cache import cache_manager
         from core.expansion import expander
@@ -76,16 +121,19 @@ class HybridRetriever:
         
         # 1. Check Cache
         # Cache key should include filters to avoid incorrect hits
-        cache_key = f"{query}::{sorted(filters.items()) if filters else ''}"
+        cache_key = f"{query}::{sorted(filters.items()) if filters else ''}" + ("" if expand else "::noexpand")
         cached_result = cache_manager.get(cache_key)
         if cached_result:
             return cached_result
 
         # 2. Expand Query
-        expanded_queries = expander.expand(query)
+        expanded_queries = expander.expand(query) if expand else [query]
         
         all_vector_results = []
         all_bm25_hits = []
+        # One consistent snapshot of the index for the whole search
+        with self._lock:
+            bm25, doc_registry = self.bm25, self.doc_registry
         
         # 3. Search for ALL variations
         
@@ -97,16 +145,16 @@ class HybridRetriever:
                 all_vector_results.extend(zip(v_res['ids'][0], range(len(v_res['ids'][0]))))
 
             # B. Keyword Search (BM25)
-            if self.bm25:
+            if bm25:
                 tokenized_q = self._tokenize(q)
-                scores = self.bm25.get_scores(tokenized_q)
+                scores = bm25.get_scores(tokenized_q)
                 top_n_indices = np.argsort(scores)[::-1][:n_results * 4] # Fetch more to allow for filtering
                 
                 for idx in top_n_indices:
                     # POST-FILTERING for BM25
                     if filters:
                         # Check metadata
-                        doc_meta = self.doc_registry[idx]["metadata"]
+                        doc_meta = doc_registry[idx]["metadata"]
                         match = True
                         for k, v in filters.items():
                             if str(doc_meta.get(k, "")).lower() != str(v).lower():
@@ -117,7 +165,7 @@ class HybridRetriever:
 
                     if scores[idx] > 0:
                         all_bm25_hits.append({
-                            "id": self.doc_registry[idx]["id"],
+                            "id": doc_registry[idx]["id"],
                             "score": scores[idx]
                         })
 
@@ -152,7 +200,7 @@ class HybridRetriever:
         for cid in candidate_ids:
             # Find metadata/content
             found = None
-            for item in self.doc_registry.values():
+            for item in doc_registry.values():
                 if item["id"] == cid:
                     found = item
                     break
@@ -191,7 +239,7 @@ class HybridRetriever:
                     if cid in id_to_emb:
                         # Find content in registry
                         content = ""
-                        for item in self.doc_registry.values():
+                        for item in doc_registry.values():
                             if item["id"] == cid:
                                 content = item["content"]
                                 break
@@ -212,8 +260,9 @@ class HybridRetriever:
         
         final_docs = [d["content"] for d in final_docs_dicts]
         sorted_ids = [d["id"] for d in final_docs_dicts]
+        final_scores = [fused_scores.get(doc_id, 0.0) for doc_id in sorted_ids]
             
-        result = {"documents": [final_docs], "ids": [sorted_ids]}
+        result = {"documents": [final_docs], "ids": [sorted_ids], "scores": [final_scores]}
         
         # 6. Set Cache
         cache_manager.set(cache_key, result)
@@ -0,0 +1,129 @@
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from core.vector_store import store as vector_store
+
+# Route lookups/explanations to a single retrieve + answer call instead of plan/generate/validate
+INTENT_ROUTER = os.getenv("INTENT_ROUTER", "true").lower() == "true"
+# Below this similarity margin between the two closest intents, play safe and run the full pipeline
+INTENT_MIN_MARGIN = float(os.getenv("INTENT_MIN_MARGIN", 0.02))
+# A query naming a programming language only skips the code pipeline above this margin
+INTENT_CODE_HINT_MARGIN = float(os.getenv("INTENT_CODE_HINT_MARGIN", 0.1))
+
+CODE_INTENT = "code"
+
+# Labeled examples; each intent is represented by the centroid of its example embeddings
+INTENT_EXAMPLES: Dict[str, List[str]] = {
+    "code": [
+        "Write python code to list all pets",
+        "Generate a client for the Stripe charges API",
+        "Create a script that uploads a file to S3",
+        "Implement pagination for the /orders endpoint",
+        "Give me a C# example that calls the login endpoint",
+        "Build an SDK for this API",
+        "Write a function that retries failed requests",
+        "Translate this code to JavaScript",
+        "Fix the bug in the code you generated",
+        "Show me a curl command and a Node.js snippet to create a user",
+    ],
+    "lookup": [
+        "What auth does the petstore API use?",
+        "What is the base URL of the API?",
+        "Which endpoint returns a list of orders?",
+        "What parameters does GET /pets accept?",
+        "Is there a rate limit?",
+        "What fields are in the User object?",
+        "Which HTTP method deletes a pet?",
+        "What status codes can the login endpoint return?",
+        "Does the API support webhooks?",
+        "What is the maximum page size?",
+    ],
+    "explain": [
+        "Explain how OAuth2 client credentials work in this API",
+        "How does pagination work here?",
+        "What is the difference between PUT and PATCH on /pets?",
+        "Why does the API return 401 for my request?",
+        "Explain the code you wrote above",
+        "Describe the authentication flow",
+        "What does the idempotency key do?",
+        "How are webhooks signed and verified?",
+        "Summarize what this API is for",
+        "When should I use the bulk endpoint instead of the single one?",
+    ],
+}
+
+class IntentRouter:
+    """
+    Nearest-centroid intent classifier over the query embedding (same model as the vector store).
+    Centroids are computed once, lazily; classifying costs one embedding and a dot product.
+    Anything uncertain (small margin, embedding failure) is routed to the full code pipeline.
+    """
+    def __init__(self, examples: Dict[str, List[str]] = INTENT_EXAMPLES, min_margin: float = INTENT_MIN_MARGIN,
+                 code_hint_margin: float = INTENT_CODE_HINT_MARGIN):
+        self.examples = examples
+        self.min_margin = min_margin
+        self.code_hint_margin = code_hint_margin
+        self._labels: List[str] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {intent: 0 for intent in examples}
+        self.fallbacks = 0
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(vector_store.embedding_fn(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _fit(self):
+        with self._lock:
+            if self._centroids is not None:
+                return
+            labels, centroids = [], []
+            for intent, texts in self.examples.items():
+                centroid = self._embed(texts).mean(axis=0)
+                labels.append(intent)
+                centroids.append(centroid / (np.linalg.norm(centroid) or 1.0))
+            self._labels, self._centroids = labels, np.stack(centroids)
+
+    def classify(self, query: str, code_hint: bool = False) -> Tuple[str, float]:
+        """
+        Returns (intent, margin over the runner-up). Falls back to the code intent when unsure.
+        With `code_hint` (the query names a programming language), other intents need `code_hint_margin`.
+        """
+        try:
+            self._fit()
+            scores = self._centroids @ self._embed([query])[0]
+        except Exception as e:
+            print(f"⚠️ Intent routing unavailable: {e}")
+            return self.record(CODE_INTENT, 0.0, fallback=True)
+
+        order = np.argsort(scores)[::-1]
+        best = self._labels[order[0]]
+        margin = float(scores[order[0]] - scores[order[1]]) if len(order) > 1 else 1.0
+        if margin < self.min_margin:
+            return self.record(CODE_INTENT, margin, fallback=True)
+        if code_hint and best != CODE_INTENT and margin < self.code_hint_margin:
+            return self.record(CODE_INTENT, margin)
+        return self.record(best, margin)
+
+    def record(self, intent: str, margin: float, fallback: bool = False) -> Tuple[str, float]:
+        with self._lock:
+            self.counts[intent] = self.counts.get(intent, 0) + 1
+            if fallback:
+                self.fallbacks += 1
+        return intent, margin
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            total = sum(self.counts.values())
+            return {
+                "total": total,
+                "by_intent": dict(self.counts),
+                "fallbacks": self.fallbacks,
+                "full_pipeline_skipped_ratio": (total - self.counts.get(CODE_INTENT, 0)) / total if total else 0.0,
+            }
+
+# Singleton
+intent_router = IntentRouter()
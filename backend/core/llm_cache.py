@@ -0,0 +1,234 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+from cachetools import TTLCache
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+from core.tracing import record_cache
+
+# LLM responses keyed by (model, generation parameters, prompt), shared by all workers
+LLM_CACHE = os.getenv("LLM_CACHE", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/llm_cache.db")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))
+# Least recently used responses are evicted above this size
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", 256))
+# In-process LRU in front of SQLite (entries, 0 disables)
+LLM_CACHE_L1_SIZE = int(os.getenv("LLM_CACHE_L1_SIZE", 512))
+
+# Writes between size checks (per process), and the size eviction shrinks the cache to
+EVICTION_INTERVAL = 100
+EVICTION_TARGET = 0.9
+# A hit refreshes the entry's LRU position at most this often (hits stay read-only otherwise)
+TOUCH_INTERVAL = 60
+
+# Client settings in LangChain's llm_string that do not change the response
+CLIENT_PARAMS = {
+    "groq_api_key", "groq_api_base", "groq_proxy", "api_key", "base_url", "max_retries",
+    "request_timeout", "timeout", "streaming", "service_tier", "default_headers",
+}
+OLLAMA_MODEL = re.compile(r"\('model', '([^']+)'\)")
+
+def normalize_llm_string(llm_string: str) -> Tuple[str, str]:
+    """
+    (model id, generation parameters) of LangChain's llm_string.
+    The model id is "<class>/<model>" in lowercase; client settings (keys, retries, timeouts) are dropped,
+    so changing them does not invalidate the cache.
+    """
+    serialized, _, call_params = llm_string.partition("---")
+    try:
+        model = json.loads(serialized)
+        kwargs = {k: v for k, v in model.get("kwargs", {}).items() if k not in CLIENT_PARAMS and v is not None}
+        name = kwargs.get("model_name") or kwargs.get("model") or ""
+        model_id = f"{model.get('id', [''])[-1]}/{name}".lower()
+        return model_id, json.dumps(kwargs, sort_keys=True) + call_params
+    except (ValueError, AttributeError):
+        # Models without a serializable config (e.g. ChatOllama) give a repr of their parameters
+        match = OLLAMA_MODEL.search(llm_string)
+        return (match.group(1).lower() if match else "unknown"), llm_string
+
+def cache_key(prompt: str, llm_string: str) -> Tuple[str, str]:
+    """(key, model id): the key hashes the normalized model, its parameters and the prompt."""
+    model_id, params = normalize_llm_string(llm_string)
+    digest = hashlib.sha256(f"{model_id}\n{params}\n{prompt}".encode("utf-8")).hexdigest()
+    return f"{model_id}:{digest}", model_id
+
+class LLMResponseCache(BaseCache):
+    """
+    LangChain LLM cache (set as the global llm_cache) backed by SQLite:
+    - WAL mode, so workers read concurrently while one writes.
+    - Entries expire after `ttl_seconds`; every EVICTION_INTERVAL writes, expired entries are dropped
+      and the least recently used ones are evicted until the database is under `max_bytes`.
+    - An optional in-process LRU (`l1_size` serialized entries) answers repeated prompts without SQLite.
+    Failures are logged and treated as misses: the cache never fails an LLM call.
+    """
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: float = LLM_CACHE_TTL,
+                 max_bytes: int = int(LLM_CACHE_MAX_MB * 1024 * 1024), l1_size: int = LLM_CACHE_L1_SIZE):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.l1_size = l1_size
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {"l1_hits": 0, "hits": 0, "misses": 0, "writes": 0, "evicted": 0, "errors": 0}
+        self._init_db()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        """(Re)opens the database at `self.path` and empties the in-process cache."""
+        with self._lock:
+            self._l1 = TTLCache(maxsize=self.l1_size, ttl=self.ttl_seconds) if self.l1_size > 0 else None
+            self._writes = 0
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            # auto_vacuum only applies to a new database: freed pages are returned to the OS after eviction
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.evict()
+
+    def _count(self, name: str, hit: Optional[bool] = None):
+        with self._lock:
+            self.counts[name] += 1
+        if hit is not None:
+            record_cache("llm", hit)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key, _ = cache_key(prompt, llm_string)
+        if self._l1 is not None:
+            with self._lock:
+                cached = self._l1.get(key)
+            if cached is not None and time.time() - cached[1] < self.ttl_seconds:
+                self._count("l1_hits", hit=True)
+                return self._decode(cached[0])
+
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT response, created_at, accessed_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row and now - row[1] < self.ttl_seconds and now - row[2] > TOUCH_INTERVAL:
+                    conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            if row is None or now - row[1] >= self.ttl_seconds:
+                self._count("misses", hit=False)
+                return None
+            generations = self._decode(row[0])
+        except Exception as e:
+            print(f"⚠️ LLM cache read failed: {e}")
+            self._count("errors")
+            self._count("misses", hit=False)
+            return None
+
+        self._remember(key, row[0], row[1])
+        self._count("hits", hit=True)
+        return generations
+
+    @staticmethod
+    def _decode(response: str) -> RETURN_VAL_TYPE:
+        # Fresh objects per hit: callers may modify the generations they get
+        return [loads(generation) for generation in json.loads(response)]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key, model_id = cache_key(prompt, llm_string)
+        response = json.dumps([dumps(generation) for generation in return_val])
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model_id, response, len(response) + len(key), now, now)
+                )
+        except Exception as e:
+            print(f"⚠️ LLM cache write failed: {e}")
+            self._count("errors")
+            return
+        self._remember(key, response, now)
+        with self._lock:
+            self.counts["writes"] += 1
+            self._writes += 1
+            due = self._writes % EVICTION_INTERVAL == 0
+        if due:
+            self.evict()
+
+    def _remember(self, key: str, response: str, created_at: float):
+        if self._l1 is not None:
+            with self._lock:
+                self._l1[key] = (response, created_at)
+
+    def evict(self, now: Optional[float] = None) -> int:
+        """Drops expired entries, then the least recently used ones above `max_bytes`. Returns the number removed."""
+        now = time.time() if now is None else now
+        try:
+            with self._connect() as conn:
+                removed = conn.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl_seconds,)).rowcount
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_bytes:
+                    # Keep the most recently used entries that fit in the target size
+                    removed += conn.execute("""
+                        DELETE FROM responses WHERE key IN (
+                            SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS kept FROM responses)
+                            WHERE kept > ?
+                        )
+                    """, (int(self.max_bytes * EVICTION_TARGET),)).rowcount
+                if removed:
+                    conn.execute("PRAGMA incremental_vacuum")
+        except Exception as e:
+            print(f"⚠️ LLM cache eviction failed: {e}")
+            self._count("errors")
+            return 0
+        with self._lock:
+            self.counts["evicted"] += removed
+        return removed
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            if self._l1 is not None:
+                self._l1.clear()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def size(self) -> Tuple[int, int]:
+        """(entries, bytes) in the database."""
+        try:
+            with self._connect() as conn:
+                return tuple(conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone())
+        except Exception as e:
+            print(f"⚠️ LLM cache size failed: {e}")
+            return 0, 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+        lookups = counts["l1_hits"] + counts["hits"] + counts["misses"]
+        entries, size = self.size()
+        return {
+            **counts,
+            "hit_ratio": (counts["l1_hits"] + counts["hits"]) / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+# Singleton
+llm_cache = LLMResponseCache()
@@ -1,46 +1,71 @@
+import groq
 from langchain_groq import ChatGroq
 from langchain_community.chat_models import ChatOllama
 import os
+import threading
+from typing import Any, Dict
+from core.model_router import model_router, ModelChoice, RoutedLLM
+from core.llm_scheduler import llm_scheduler, scheduler_rate_limiter
 
-from langchain_community.cache import SQLiteCache
-from langchain_community.cache import SQLiteCache
-import langchain
-import os
+from langchain_core.globals import set_llm_cache
+from core.llm_cache import llm_cache, LLM_CACHE
 
-# Enable Local Caching (Semantic Cache)
-cache_db_path = os.path.join(os.path.dirname(__file__), "..", ".langchain.db")
-langchain.llm_cache = SQLiteCache(database_path=cache_db_path)
+# Cache LLM responses (bounded SQLite + in-process LRU, see core/llm_cache.py)
+if LLM_CACHE:
+    set_llm_cache(llm_cache)
 
 class LLMFactory:
+    # One client per (provider, model, temperature), shared by all tasks routed to it
+    _models: Dict[str, Any] = {}
+    _lock = threading.Lock()
+
     @staticmethod
-    def create_llm(model_type: str = "reasoning"):
+    def create_llm(model_type: str = "reasoning") -> RoutedLLM:
         """
-        Creates an LLM instance based on the .env config and the requested type.
-        types: 'reasoning' (DeepSeek/R1), 'coding' (Qwen), 'chat' (Fast)
+        Creates the LLM for a task, routed by the table in core/model_router.py (LLM_PROVIDER, LLM_ROUTES).
+        tasks: 'expansion', 'search_query', 'summarize', 'answer', 'plan', 'generate', 'validate'
+        (legacy types: 'reasoning' -> plan, 'coding' -> generate, 'chat' -> answer)
         """
-        provider = os.getenv("LLM_PROVIDER", "groq").lower()
-        
-        if provider == "ollama":
-            # FASTEST CONFIGURATION for 16GB RAM (Prevents Timeout)
-            # Using 3B model for everything until performance is validated
-            return ChatOllama(model="llama3.2:3b", temperature=0.7)
-                
-        else:
-            # Default to Groq (Cloud)
+        llm = RoutedLLM(model_type, model_router, LLMFactory.build)
+        # Fail at startup, not on the first call, if a routed provider is not configured
+        for choice in model_router.route(model_type).candidates:
+            LLMFactory.build(choice)
+        return llm
+
+    @staticmethod
+    def build(choice: ModelChoice):
+        """Chat model client for one routing table entry."""
+        key = f"{choice.key}@{choice.temperature}"
+        with LLMFactory._lock:
+            llm = LLMFactory._models.get(key)
+            if llm is None:
+                llm = LLMFactory._models[key] = LLMFactory._client(choice)
+            return llm
+
+    @staticmethod
+    def _client(choice: ModelChoice):
+        if choice.provider == "ollama":
+            return ChatOllama(model=choice.model, temperature=choice.temperature, rate_limiter=scheduler_rate_limiter)
+        if choice.provider == "groq":
             api_key = os.getenv("GROQ_API_KEY")
             if not api_key:
                 print("❌ Error: GROQ_API_KEY is missing in .env")
                 raise ValueError("GROQ_API_KEY not set in .env. Please add it to use Cloud Models.")
-                
-            if model_type == "coding":
-                # Fallback to Llama 3.1 8B (Mixtral decommissioned, 70B rate limited)
-                return ChatGroq(model="llama-3.1-8b-instant", api_key=api_key, temperature=0.1)
-            elif model_type == "reasoning":
-                # Fallback to Llama 3.1 8B
-                return ChatGroq(model="llama-3.1-8b-instant", api_key=api_key, temperature=0.6)
-            else:
-                # Fast model for routine tasks
-                return ChatGroq(model="llama-3.1-8b-instant", api_key=api_key, temperature=0.5)
+            # The scheduler learns the model's budget from its rate-limit headers. 429s are not retried by the SDK:
+            # the router moves on to another model and the scheduler holds this one until the limit resets.
+            def observe(response):
+                llm_scheduler.observe(choice.key, response.headers, response.status_code)
+
+            async def aobserve(response):
+                observe(response)
+
+            return ChatGroq(
+                model=choice.model, api_key=api_key, temperature=choice.temperature, max_retries=0,
+                rate_limiter=scheduler_rate_limiter, # Takes the scheduler's budget after the LLM cache lookup
+                http_client=groq.DefaultHttpxClient(event_hooks={"response": [observe]}),
+                http_async_client=groq.DefaultAsyncHttpxClient(event_hooks={"response": [aobserve]}),
+            )
+        raise ValueError(f"Unknown LLM provider '{choice.provider}'.")
 
 # Singleton instance access pattern if needed
 llm_factory = LLMFactory()
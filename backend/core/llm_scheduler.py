@@ -0,0 +1,293 @@
+import os
+import re
+import json
+import math
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Mapping, Optional
+from pydantic import BaseModel
+from langchain_core.rate_limiters import BaseRateLimiter
+from core.exceptions import LLMOverloadedError
+
+# Per-model request/token budgets (per minute), e.g. the provider plan's limits.
+# Models without a budget are not scheduled until the provider reports one in its rate-limit headers.
+DEFAULT_RATE_LIMITS = {
+    "groq/llama-3.1-8b-instant": {"rpm": 30, "tpm": 6000},
+    "groq/llama-3.3-70b-versatile": {"rpm": 30, "tpm": 12000},
+}
+LLM_RATE_LIMITS = {**DEFAULT_RATE_LIMITS, **json.loads(os.getenv("LLM_RATE_LIMITS", "") or "{}")}
+# Longest a call waits for budget before it is shed (LLMOverloadedError -> next model or 503)
+LLM_QUEUE_MAX_WAIT = float(os.getenv("LLM_QUEUE_MAX_WAIT", 20))
+# Completion tokens assumed before the response reports the real usage
+COMPLETION_TOKEN_ESTIMATE = int(os.getenv("COMPLETION_TOKEN_ESTIMATE", 500))
+
+CHARS_PER_TOKEN = 4
+# Request budget of a model whose limits were only learned from its token headers
+UNLIMITED = 1e9
+# Lower is served first; lower priorities also leave a share of each budget to the higher ones
+TASK_PRIORITIES = {"plan": 0, "answer": 0, "generate": 1, "validate": 1, "search_query": 1, "expansion": 2, "summarize": 3}
+PRIORITY_RESERVES = {0: 0.0, 1: 0.1, 2: 0.2, 3: 0.3}
+# Waiting callers re-check the budget at least this often
+POLL_SECONDS = 0.25
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Rate-limit reset durations: "7.66s", "2m59.56s", "1h2m", "120ms" or plain seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+def estimate_prompt_tokens(messages) -> int:
+    chars = sum(len(m.content) for m in messages if isinstance(getattr(m, "content", None), str))
+    return -(-chars // CHARS_PER_TOKEN)
+
+class TokenBucket:
+    """`capacity` units, refilled continuously at `capacity` per `period` seconds. Not thread-safe (the scheduler locks)."""
+    def __init__(self, capacity: float, period: float = 60.0, now: float = 0.0):
+        self.capacity = capacity
+        self.period = period
+        self.level = capacity
+        self.updated = now
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / self.period)
+        self.updated = now
+
+    def wait_for(self, amount: float, floor: float = 0.0) -> float:
+        """Seconds until `amount` can be taken while leaving `floor` in the bucket."""
+        missing = amount + floor - self.level
+        return 0.0 if missing <= 0 else missing * self.period / self.capacity
+
+class ModelBudget:
+    def __init__(self, rpm: float, tpm: float, now: float):
+        self.requests = TokenBucket(rpm, now=now)
+        self.tokens = TokenBucket(tpm, now=now)
+        self.blocked_until = 0.0             # Retry-After of a provider 429
+        self.waiting: Dict[int, int] = {}    # priority -> callers waiting
+
+    def refill(self, now: float):
+        self.requests.refill(now)
+        self.tokens.refill(now)
+
+    def wait_for(self, tokens: int, priority: int, now: float) -> float:
+        reserve = PRIORITY_RESERVES.get(priority, 0.0)
+        return max(
+            self.blocked_until - now,
+            self.requests.wait_for(1, reserve * self.requests.capacity),
+            self.tokens.wait_for(min(tokens, self.tokens.capacity), reserve * self.tokens.capacity),
+        )
+
+    def higher_waiting(self, priority: int) -> bool:
+        return any(count for p, count in self.waiting.items() if p < priority)
+
+class Ticket(BaseModel):
+    """Budget taken by one call, settled against the provider's reported usage afterwards."""
+    model: str
+    tokens: int
+    waited: float = 0.0
+
+class LLMScheduler:
+    """
+    Client-side rate limiting shared by every LLM call, per model:
+    - Token buckets for requests and tokens per minute; a call takes one request and its estimated
+      tokens (prompt + COMPLETION_TOKEN_ESTIMATE) before it is sent, corrected by the reported usage after.
+    - Calls wait for budget instead of hitting the provider's limit; a call that would wait longer than
+      `max_wait` is shed right away (LLMOverloadedError), so the router can use another model.
+    - Priority by task: lower-priority calls (summarization, expansion) leave part of the budget to
+      higher ones (planning, answers) and yield while any of them waits.
+    - Rate-limit response headers (remaining/limit/reset, Retry-After) correct the buckets to the provider's view.
+    Thread-safe; sync callers sleep, async callers await.
+    """
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None, max_wait: float = LLM_QUEUE_MAX_WAIT, clock=time.time):
+        self.limits = limits if limits is not None else LLM_RATE_LIMITS
+        self.max_wait = max_wait
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._budgets: Dict[str, ModelBudget] = {}
+        self.counts: Dict[str, int] = {"granted": 0, "queued": 0, "shed": 0, "throttled_by_provider": 0}
+        self.wait_seconds = 0.0
+
+    def _budget(self, model: str) -> Optional[ModelBudget]:
+        budget = self._budgets.get(model)
+        if budget is None and model in self.limits:
+            limit = self.limits[model]
+            budget = self._budgets[model] = ModelBudget(limit["rpm"], limit["tpm"], self.clock())
+        return budget
+
+    def _try(self, model: str, tokens: int, priority: int, waited: float, queued: bool) -> Optional[float]:
+        """Takes the budget and returns None, or returns the time to wait (registering the caller as waiting)."""
+        with self._lock:
+            budget = self._budget(model)
+            if budget is None:
+                return None
+            now = self.clock()
+            budget.refill(now)
+            wait = budget.wait_for(tokens, priority, now)
+            if wait <= 0 and not budget.higher_waiting(priority):
+                budget.requests.level -= 1
+                budget.tokens.level -= tokens
+                if queued:
+                    budget.waiting[priority] -= 1
+                self.counts["granted"] += 1
+                self.wait_seconds += waited
+                return None
+            if waited + wait > self.max_wait:
+                if queued:
+                    budget.waiting[priority] -= 1
+                self.counts["shed"] += 1
+                retry_after = math.ceil(wait)
+                raise LLMOverloadedError(f"{model} rate budget exhausted; retry in {retry_after}s.", {"retry_after": retry_after, "model": model})
+            if not queued:
+                budget.waiting[priority] = budget.waiting.get(priority, 0) + 1
+                self.counts["queued"] += 1
+            return max(wait, 0.01)
+
+    def acquire(self, model: str, messages, task: str) -> Ticket:
+        tokens = estimate_prompt_tokens(messages) + COMPLETION_TOKEN_ESTIMATE
+        priority = TASK_PRIORITIES.get(task, 1)
+        start = time.monotonic()
+        queued = False
+        while (wait := self._try(model, tokens, priority, time.monotonic() - start, queued)) is not None:
+            queued = True
+            time.sleep(min(wait, POLL_SECONDS))
+        return Ticket(model=model, tokens=tokens, waited=time.monotonic() - start)
+
+    async def aacquire(self, model: str, messages, task: str) -> Ticket:
+        """Async variant of acquire."""
+        tokens = estimate_prompt_tokens(messages) + COMPLETION_TOKEN_ESTIMATE
+        priority = TASK_PRIORITIES.get(task, 1)
+        start = time.monotonic()
+        queued = False
+        try:
+            while (wait := self._try(model, tokens, priority, time.monotonic() - start, queued)) is not None:
+                queued = True
+                await asyncio.sleep(min(wait, POLL_SECONDS))
+        except asyncio.CancelledError:
+            if queued:
+                self._leave(model, priority)
+            raise
+        return Ticket(model=model, tokens=tokens, waited=time.monotonic() - start)
+
+    def _leave(self, model: str, priority: int):
+        with self._lock:
+            budget = self._budgets.get(model)
+            if budget is not None and budget.waiting.get(priority):
+                budget.waiting[priority] -= 1
+
+    def settle(self, ticket: Ticket, response: Any):
+        """Replaces the estimate with the tokens the provider reported for the call."""
+        usage = getattr(response, "usage_metadata", None) or {}
+        total = usage.get("total_tokens")
+        if total is None:
+            return
+        with self._lock:
+            budget = self._budgets.get(ticket.model)
+            if budget is not None:
+                budget.tokens.level += ticket.tokens - total
+
+    def observe(self, model: str, headers: Mapping[str, str], status: int = 200):
+        """Rate-limit headers of a provider response (x-ratelimit-*, retry-after)."""
+        limit_tokens = headers.get("x-ratelimit-limit-tokens")
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        retry_after = parse_duration(headers.get("retry-after"))
+        if status != 429 and limit_tokens is None and remaining_tokens is None and remaining_requests is None:
+            return
+        with self._lock:
+            budget = self._budget(model)
+            now = self.clock()
+            if budget is None:
+                if limit_tokens is None:
+                    return
+                # First sight of a model without a configured budget: learn its token limit
+                tpm = float(limit_tokens)
+                budget = self._budgets[model] = ModelBudget(UNLIMITED, tpm, now)
+            budget.refill(now)
+            try:
+                if limit_tokens is not None:
+                    budget.tokens.capacity = float(limit_tokens)
+                if remaining_tokens is not None:
+                    budget.tokens.level = min(budget.tokens.level, float(remaining_tokens))
+                if remaining_requests is not None:
+                    budget.requests.level = min(budget.requests.level, float(remaining_requests))
+            except ValueError:
+                pass
+            if status == 429:
+                self.counts["throttled_by_provider"] += 1
+                reset = retry_after or parse_duration(headers.get("x-ratelimit-reset-tokens")) or parse_duration(headers.get("x-ratelimit-reset-requests"))
+                budget.blocked_until = max(budget.blocked_until, now + (reset or 1.0))
+
+    def stats(self) -> Dict[str, Any]:
+        now = self.clock()
+        with self._lock:
+            for budget in self._budgets.values():
+                budget.refill(now)
+            models = {
+                model: {
+                    "requests_left": round(budget.requests.level, 1),
+                    "tokens_left": round(budget.tokens.level),
+                    "waiting": sum(budget.waiting.values()),
+                    "blocked_for": round(max(0.0, budget.blocked_until - now), 1),
+                }
+                for model, budget in self._budgets.items()
+            }
+            counts, wait_seconds = dict(self.counts), self.wait_seconds
+        return {**counts, "avg_wait_seconds": wait_seconds / counts["granted"] if counts["granted"] else 0.0, "models": models}
+
+class ScheduledCall:
+    """The LLM call in progress (see scheduled_call); `ticket` is set once it took budget."""
+    def __init__(self, scheduler: LLMScheduler, model: str, messages, task: str):
+        self.scheduler = scheduler
+        self.model = model
+        self.messages = messages
+        self.task = task
+        self.ticket: Optional[Ticket] = None
+
+_current_call: contextvars.ContextVar[Optional[ScheduledCall]] = contextvars.ContextVar("llm_scheduled_call", default=None)
+
+@contextmanager
+def scheduled_call(scheduler: LLMScheduler, model: str, messages, task: str) -> Iterator[ScheduledCall]:
+    """Makes the call's model, prompt and task known to SchedulerRateLimiter during the block."""
+    call = ScheduledCall(scheduler, model, messages, task)
+    token = _current_call.set(call)
+    try:
+        yield call
+    finally:
+        _current_call.reset(token)
+
+class SchedulerRateLimiter(BaseRateLimiter):
+    """
+    LangChain rate limiter hook of the chat model clients. LangChain applies it after the LLM cache
+    lookup, so only calls that reach the provider wait for (or are shed by) the scheduler's budget.
+    """
+    def acquire(self, *, blocking: bool = True) -> bool:
+        call = _current_call.get()
+        if call is not None and call.ticket is None:
+            call.ticket = call.scheduler.acquire(call.model, call.messages, call.task)
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        call = _current_call.get()
+        if call is not None and call.ticket is None:
+            call.ticket = await call.scheduler.aacquire(call.model, call.messages, call.task)
+        return True
+
+def uses_rate_limiter(model) -> bool:
+    """Whether `model` (a chat model client) takes its budget through SchedulerRateLimiter."""
+    return isinstance(getattr(model, "rate_limiter", None), SchedulerRateLimiter)
+
+# Singletons
+llm_scheduler = LLMScheduler()
+scheduler_rate_limiter = SchedulerRateLimiter()
@@ -0,0 +1,214 @@
+import math
+import threading
+from typing import Dict, List, Tuple
+from core.tracing import Histogram, trace_stats
+from core.resilience import global_circuit_breaker
+from core.cache import cache_manager, web_search_cache, search_query_cache
+from core.admission import admission_controller
+from core.intent_router import intent_router
+from core.code_checks import validation_stats
+from core.followup import followup_detector
+from core.model_router import model_router
+from core.llm_scheduler import llm_scheduler
+from core.llm_cache import llm_cache
+from core.semantic_cache import semantic_llm_cache
+from core.hybrid import hybrid_retriever
+from core.vector_store import store as vector_store
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+CIRCUIT_STATES = ("CLOSED", "HALF-OPEN", "OPEN")
+
+class HttpMetrics:
+    """Request latency per route (the route template, not the raw path, to bound cardinality) and status counts."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.responses: Dict[Tuple[str, str, int], int] = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float):
+        key = (method, route)
+        histogram = self.latency.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.latency.setdefault(key, Histogram())
+        histogram.observe(seconds)
+        with self._lock:
+            self.responses[(method, route, status)] = self.responses.get((method, route, status), 0) + 1
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(labels: Dict[str, object]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsWriter:
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def header(self, name: str, kind: str, description: str):
+        self.lines.append(f"# HELP {name} {description}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value: float, /, **labels):
+        self.lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    def histogram(self, name: str, histogram: Histogram, /, **labels):
+        cumulative, total, count = histogram.snapshot()
+        for bound, seen in zip(histogram.buckets + (math.inf,), cumulative):
+            self.sample(f"{name}_bucket", seen, **labels, le=_number(bound))
+        self.sample(f"{name}_sum", total, **labels)
+        self.sample(f"{name}_count", count, **labels)
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+def _write_http(writer: MetricsWriter):
+    with http_metrics._lock:
+        latency = sorted(http_metrics.latency.items())
+        responses = sorted(http_metrics.responses.items())
+    writer.header("http_request_duration_seconds", "histogram", "HTTP request latency by route (streams: until the response starts).")
+    for (method, route), histogram in latency:
+        writer.histogram("http_request_duration_seconds", histogram, method=method, route=route)
+    writer.header("http_responses_total", "counter", "HTTP responses by route and status code.")
+    for (method, route, status), count in responses:
+        writer.sample("http_responses_total", count, method=method, route=route, status=status)
+
+def _write_stages(writer: MetricsWriter):
+    with trace_stats._lock:
+        latency = sorted(trace_stats.latency.items())
+        tokens = sorted((name, dict(counts)) for name, counts in trace_stats.tokens.items())
+        retries = sorted(trace_stats.retries.items())
+        cache = sorted((name, dict(counts)) for name, counts in trace_stats.cache.items())
+    writer.header("agent_stage_duration_seconds", "histogram", "Duration of graph nodes, LLM calls (per node), retrieval stages and session store operations.")
+    for (kind, name), histogram in latency:
+        writer.histogram("agent_stage_duration_seconds", histogram, kind=kind, name=name)
+    writer.header("llm_tokens_total", "counter", "LLM tokens per graph node.")
+    for name, counts in tokens:
+        writer.sample("llm_tokens_total", counts["prompt"], node=name, type="prompt")
+        writer.sample("llm_tokens_total", counts["completion"], node=name, type="completion")
+    writer.header("llm_retries_total", "counter", "LLM call retries per graph node.")
+    for name, count in retries:
+        writer.sample("llm_retries_total", count, node=name)
+    writer.header("cache_lookups_total", "counter", "Cache lookups by cache and result.")
+    for name, counts in cache:
+        writer.sample("cache_lookups_total", counts["hits"], cache=name, result="hit")
+        writer.sample("cache_lookups_total", counts["misses"], cache=name, result="miss")
+
+def _write_caches(writer: MetricsWriter):
+    stats = dict(cache_manager.stats)
+    writer.header("search_cache_lookups_total", "counter", "Hybrid search result cache (CacheManager) lookups by result.")
+    writer.sample("search_cache_lookups_total", stats["exact_hits"], result="exact_hit")
+    writer.sample("search_cache_lookups_total", stats["semantic_hits"], result="semantic_hit")
+    writer.sample("search_cache_lookups_total", stats["misses"], result="miss")
+    total = sum(stats.values())
+    writer.header("search_cache_hit_ratio", "gauge", "Share of hybrid search lookups served from the cache.")
+    writer.sample("search_cache_hit_ratio", (stats["exact_hits"] + stats["semantic_hits"]) / total if total else 0.0)
+    writer.header("coalescing_cache_coalesced_total", "counter", "Cache misses that waited for an identical in-flight call.")
+    for name, cache in (("web_search", web_search_cache), ("search_query", search_query_cache)):
+        writer.sample("coalescing_cache_coalesced_total", cache.coalesced, cache=name)
+    stats = llm_cache.stats()
+    writer.header("llm_cache_lookups_total", "counter", "LLM response cache lookups by result (l1_hit: served in-process).")
+    for result, count in (("l1_hit", "l1_hits"), ("hit", "hits"), ("miss", "misses")):
+        writer.sample("llm_cache_lookups_total", stats[count], result=result)
+    writer.header("llm_cache_evicted_total", "counter", "LLM cache entries removed (expired or least recently used).")
+    writer.sample("llm_cache_evicted_total", stats["evicted"])
+    writer.header("llm_cache_bytes", "gauge", "Size of the cached LLM responses.")
+    writer.sample("llm_cache_bytes", stats["bytes"])
+    writer.header("llm_cache_entries", "gauge", "Cached LLM responses.")
+    writer.sample("llm_cache_entries", stats["entries"])
+    writer.header("llm_semantic_cache_lookups_total", "counter", "Semantic LLM cache lookups per role by result (guarded: similar input rejected by a correctness guard).")
+    for role, counts in sorted(semantic_llm_cache.stats().items()):
+        writer.sample("llm_semantic_cache_lookups_total", counts["hits"], role=role, result="hit")
+        writer.sample("llm_semantic_cache_lookups_total", counts["misses"] - counts["guarded"], role=role, result="miss")
+        writer.sample("llm_semantic_cache_lookups_total", counts["guarded"], role=role, result="guarded")
+
+def _write_resilience(writer: MetricsWriter):
+    writer.header("circuit_breaker_state", "gauge", "LLM circuit breaker state (1 for the current state).")
+    for state in CIRCUIT_STATES:
+        writer.sample("circuit_breaker_state", int(global_circuit_breaker.state == state), state=state)
+    writer.header("circuit_breaker_failures", "gauge", "Consecutive LLM failures counted by the circuit breaker.")
+    writer.sample("circuit_breaker_failures", global_circuit_breaker.failures)
+
+def _write_models(writer: MetricsWriter):
+    counters = model_router.counters()
+    writer.header("llm_calls_total", "counter", "LLM calls served per task and routed model.")
+    for (task, model), count in sorted(counters["calls"].items()):
+        writer.sample("llm_calls_total", count, task=task, model=model)
+    writer.header("llm_latency_seconds", "gauge", "Moving average LLM call latency per task and model (drives routing).")
+    for (task, model), seconds in sorted(counters["latency"].items()):
+        writer.sample("llm_latency_seconds", seconds, task=task, model=model)
+    writer.header("llm_rate_limited_total", "counter", "Rate-limit responses per model.")
+    for model, count in sorted(counters["rate_limited"].items()):
+        writer.sample("llm_rate_limited_total", count, model=model)
+    writer.header("llm_downgrades_total", "counter", "LLM calls served by a fallback model of the task.")
+    for task, count in sorted(counters["downgrades"].items()):
+        writer.sample("llm_downgrades_total", count, task=task)
+
+def _write_scheduler(writer: MetricsWriter):
+    stats = llm_scheduler.stats()
+    writer.header("llm_scheduler_calls_total", "counter", "LLM calls by scheduling outcome (granted, queued for budget, shed).")
+    for result in ("granted", "queued", "shed"):
+        writer.sample("llm_scheduler_calls_total", stats[result], result=result)
+    writer.header("llm_scheduler_throttled_total", "counter", "Rate-limit responses that still reached the provider.")
+    writer.sample("llm_scheduler_throttled_total", stats["throttled_by_provider"])
+    writer.header("llm_budget_requests_left", "gauge", "Requests left in each model's per-minute budget.")
+    for model, budget in sorted(stats["models"].items()):
+        writer.sample("llm_budget_requests_left", budget["requests_left"], model=model)
+    writer.header("llm_budget_tokens_left", "gauge", "Tokens left in each model's per-minute budget.")
+    for model, budget in sorted(stats["models"].items()):
+        writer.sample("llm_budget_tokens_left", budget["tokens_left"], model=model)
+
+def _write_admission(writer: MetricsWriter):
+    stats = admission_controller.stats()
+    writer.header("agent_runs_running", "gauge", "Agent runs executing.")
+    writer.sample("agent_runs_running", stats["running"])
+    writer.header("agent_runs_queued", "gauge", "Agent runs waiting for a slot.")
+    writer.sample("agent_runs_queued", stats["queued"])
+    writer.header("agent_runs_admitted_total", "counter", "Agent runs admitted.")
+    writer.sample("agent_runs_admitted_total", stats["admitted"])
+    writer.header("agent_runs_rejected_total", "counter", "Agent runs rejected with 503 (queue full, wait too long, deadline while queued).")
+    writer.sample("agent_runs_rejected_total", stats["rejected"])
+    writer.header("agent_queue_wait_seconds", "histogram", "Time agent runs waited for a slot.")
+    writer.histogram("agent_queue_wait_seconds", admission_controller.wait_histogram)
+
+def _write_agent(writer: MetricsWriter):
+    routing = intent_router.stats()
+    writer.header("intent_routes_total", "counter", "Requests per routed intent.")
+    for intent, count in sorted(routing["by_intent"].items()):
+        writer.sample("intent_routes_total", count, intent=intent)
+    followups = followup_detector.stats()
+    writer.header("session_turns_total", "counter", "Session turns by retrieval: new topic, or follow-up reusing the topic's documents.")
+    writer.sample("session_turns_total", followups["new_topic"], retrieval="new_topic")
+    writer.sample("session_turns_total", followups["follow_up"] - followups["searched"], retrieval="reused")
+    writer.sample("session_turns_total", followups["searched"], retrieval="reused_and_searched")
+    writer.header("validations_total", "counter", "Code validations by outcome.")
+    for outcome, count in sorted(validation_stats.counts.items()):
+        writer.sample("validations_total", count, outcome=outcome)
+
+def _write_index(writer: MetricsWriter):
+    writer.header("index_documents", "gauge", "Documents in the search indexes.")
+    writer.sample("index_documents", len(hybrid_retriever.corpus), index="bm25")
+    try:
+        writer.sample("index_documents", vector_store.count(), index="vector")
+    except Exception as e:
+        print(f"⚠️ Vector store count failed: {e}")
+    writer.header("index_generation", "gauge", "BM25 index rebuilds since startup.")
+    writer.sample("index_generation", hybrid_retriever.generation)
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text format. Reads counters only; nothing is computed per request."""
+    writer = MetricsWriter()
+    for write in (_write_http, _write_stages, _write_caches, _write_resilience, _write_models, _write_scheduler, _write_admission, _write_agent, _write_index):
+        write(writer)
+    return writer.text()
+
+# Singleton
+http_metrics = HttpMetrics()
@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from core.exceptions import LLMOverloadedError
+from core.llm_scheduler import llm_scheduler, LLMScheduler, ScheduledCall, scheduled_call, uses_rate_limiter
+
+# Default routing table: LLM_PROVIDER picks the provider column, LLM_ROUTES (JSON) overrides tasks, e.g.
+# {"plan": ["groq/llama-3.3-70b-versatile", "ollama/llama3.2:3b"], "expansion": {"models": ["groq/llama-3.1-8b-instant"], "max_latency": 2}}
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq").lower()
+LLM_ROUTES = os.getenv("LLM_ROUTES", "")
+# A rate-limited model gets no calls for this long (or the provider's Retry-After)
+RATE_LIMIT_COOLDOWN_SECONDS = float(os.getenv("RATE_LIMIT_COOLDOWN_SECONDS", 30))
+
+# Weight of each new latency measurement, and the age after which a slow model is tried again
+LATENCY_SMOOTHING = 0.3
+LATENCY_STALE_SECONDS = 300
+
+# Legacy role names of LLMFactory.create_llm
+TASK_ALIASES = {"reasoning": "plan", "coding": "generate", "chat": "answer"}
+TASK_TEMPERATURES = {
+    "expansion": 0.6,
+    "search_query": 0.6,
+    "summarize": 0.5,
+    "answer": 0.5,
+    "plan": 0.6,
+    "generate": 0.1,
+    "validate": 0.1,
+}
+
+GROQ_FAST = "groq/llama-3.1-8b-instant"
+GROQ_LARGE = "groq/llama-3.3-70b-versatile"
+OLLAMA_SMALL = "ollama/llama3.2:3b"
+
+# task -> (models, cheapest/fastest adequate first; latency target in seconds or None)
+DEFAULT_ROUTES: Dict[str, Dict[str, Tuple[List[str], Optional[float]]]] = {
+    "groq": {
+        "expansion": ([GROQ_FAST], None),
+        "search_query": ([GROQ_FAST], None),
+        "summarize": ([GROQ_FAST], None),
+        "answer": ([GROQ_FAST, GROQ_LARGE], None),
+        "plan": ([GROQ_LARGE, GROQ_FAST], 10.0),
+        "generate": ([GROQ_LARGE, GROQ_FAST], 20.0),
+        "validate": ([GROQ_FAST, GROQ_LARGE], None),
+    },
+    # Using 3B model for everything until performance is validated (16GB RAM)
+    "ollama": {task: ([OLLAMA_SMALL], None) for task in TASK_TEMPERATURES},
+}
+
+class ModelChoice(BaseModel):
+    provider: str
+    model: str
+    temperature: float
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider}/{self.model}"
+
+class TaskRoute(BaseModel):
+    task: str
+    candidates: List[ModelChoice]         # In order of preference
+    max_latency: Optional[float] = None   # Typical latency above which a faster candidate is preferred
+
+def task_name(name: str) -> str:
+    return TASK_ALIASES.get(name, name)
+
+def _choice(spec: str, temperature: float) -> ModelChoice:
+    provider, sep, model = spec.partition("/")
+    if not sep or not model:
+        raise ValueError(f"Invalid model '{spec}' in LLM routes (expected provider/model).")
+    return ModelChoice(provider=provider.lower(), model=model, temperature=temperature)
+
+def build_routes(provider: str = LLM_PROVIDER, overrides: str = LLM_ROUTES) -> Dict[str, TaskRoute]:
+    """Routing table of all tasks: the provider's defaults, then the JSON overrides."""
+    table = dict(DEFAULT_ROUTES.get(provider, DEFAULT_ROUTES["groq"]))
+    for task, entry in (json.loads(overrides) if overrides else {}).items():
+        task = task_name(task)
+        if task not in TASK_TEMPERATURES:
+            raise ValueError(f"Unknown task '{task}' in LLM routes.")
+        if isinstance(entry, dict):
+            table[task] = (entry["models"], entry.get("max_latency"))
+        else:
+            table[task] = (entry, None)
+    routes = {}
+    for task, (models, max_latency) in table.items():
+        if not models:
+            raise ValueError(f"No models routed for task '{task}'.")
+        temperature = TASK_TEMPERATURES[task]
+        routes[task] = TaskRoute(task=task, candidates=[_choice(m, temperature) for m in models], max_latency=max_latency)
+    return routes
+
+def is_rate_limit(error: Exception) -> bool:
+    """HTTP 429 from the provider SDK (status on the error or its response), or a rate-limit message."""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    message = str(error).lower()
+    return status == 429 or "rate limit" in message or "rate_limit" in message
+
+def retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class ModelRouter:
+    """
+    Picks the model for each LLM call from the routing table:
+    - Candidates are tried in table order (cheap tiers for cheap tasks, larger models where quality matters).
+    - A rate-limited model is skipped until its cooldown ends, so calls downgrade to the next candidate.
+    - With a latency target, candidates whose observed latency (moving average per task and model) exceeds it
+      go after the ones meeting it; measurements older than LATENCY_STALE_SECONDS are dropped so a slow
+      model is tried again.
+    Thread-safe.
+    """
+    def __init__(self, routes: Optional[Dict[str, TaskRoute]] = None, cooldown: float = RATE_LIMIT_COOLDOWN_SECONDS, clock: Callable[[], float] = time.time):
+        self.routes = routes if routes is not None else build_routes()
+        self.cooldown = cooldown
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._latency: Dict[Tuple[str, str], Tuple[float, float]] = {} # (task, model) -> (average, measured at)
+        self._limited_until: Dict[str, float] = {}
+        self.calls: Dict[Tuple[str, str], int] = {}
+        self.rate_limited: Dict[str, int] = {}
+        self.downgrades: Dict[str, int] = {}
+
+    def route(self, task: str) -> TaskRoute:
+        task = task_name(task)
+        if task not in self.routes:
+            raise ValueError(f"No LLM route for task '{task}'.")
+        return self.routes[task]
+
+    def latency(self, task: str, model: str) -> Optional[float]:
+        with self._lock:
+            measured = self._latency.get((task, model))
+        if measured is None or self.clock() - measured[1] > LATENCY_STALE_SECONDS:
+            return None
+        return measured[0]
+
+    def order(self, task: str) -> List[ModelChoice]:
+        """Candidates of a task in the order to try them now."""
+        route = self.route(task)
+        now = self.clock()
+        with self._lock:
+            limited_until = dict(self._limited_until)
+        available = [c for c in route.candidates if limited_until.get(c.key, 0) <= now]
+        limited = sorted((c for c in route.candidates if limited_until.get(c.key, 0) > now), key=lambda c: limited_until[c.key])
+        if route.max_latency is not None:
+            latencies = {c.key: self.latency(route.task, c.key) for c in available}
+            fast = [c for c in available if latencies[c.key] is None or latencies[c.key] <= route.max_latency]
+            slow = sorted((c for c in available if c not in fast), key=lambda c: latencies[c.key])
+            available = fast + slow
+        return available + limited
+
+    def record_success(self, task: str, choice: ModelChoice, seconds: float):
+        route = self.route(task)
+        key = (route.task, choice.key)
+        with self._lock:
+            previous = self._latency.get(key)
+            average = seconds if previous is None else previous[0] + LATENCY_SMOOTHING * (seconds - previous[0])
+            self._latency[key] = (average, self.clock())
+            self.calls[key] = self.calls.get(key, 0) + 1
+            if choice != route.candidates[0]:
+                self.downgrades[route.task] = self.downgrades.get(route.task, 0) + 1
+
+    def record_rate_limit(self, choice: ModelChoice, wait: Optional[float] = None):
+        with self._lock:
+            self._limited_until[choice.key] = self.clock() + (wait if wait is not None else self.cooldown)
+            self.rate_limited[choice.key] = self.rate_limited.get(choice.key, 0) + 1
+        print(f"🚦 {choice.key} rate limited; routing around it for {wait if wait is not None else self.cooldown:.0f}s")
+
+    def counters(self) -> Dict[str, Dict]:
+        """Calls and average latency per (task, model), rate limits per model, downgrades per task."""
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "latency": {key: average for key, (average, _) in self._latency.items()},
+                "rate_limited": dict(self.rate_limited),
+                "downgrades": dict(self.downgrades),
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        now = self.clock()
+        counters = self.counters()
+        with self._lock:
+            limited = {model: round(until - now, 1) for model, until in self._limited_until.items() if until > now}
+        return {
+            "routes": {task: [c.key for c in self.order(task)] for task in self.routes},
+            "calls": {f"{task}:{model}": count for (task, model), count in sorted(counters["calls"].items())},
+            "latency_seconds": {f"{task}:{model}": round(avg, 3) for (task, model), avg in sorted(counters["latency"].items())},
+            "rate_limited": counters["rate_limited"],
+            "cooling_down": limited,
+            "downgrades": counters["downgrades"],
+        }
+
+class RoutedLLM:
+    """
+    Chat model for one task. Each call goes to the model the router picks, after the scheduler granted
+    that model's rate budget (in the client's rate limiter hook, so LLM cache hits take none). It moves on
+    to the next candidate when the budget is exhausted or the provider rate-limits the model; other errors
+    are raised (with_resilience retries them).
+    """
+    def __init__(self, task: str, router: ModelRouter, build: Callable[[ModelChoice], Any], config: Optional[Dict[str, Any]] = None, scheduler: Optional[LLMScheduler] = None):
+        self.task = task_name(task)
+        self.router = router
+        self.build = build
+        self.config = config or {}
+        self.scheduler = scheduler or llm_scheduler
+
+    def with_config(self, **kwargs) -> "RoutedLLM":
+        return RoutedLLM(self.task, self.router, self.build, {**self.config, **kwargs}, self.scheduler)
+
+    @property
+    def model_name(self) -> str:
+        """The model the next call goes to (for spans and context budgets)."""
+        return self.router.order(self.task)[0].model
+
+    @property
+    def model_names(self) -> List[str]:
+        return [c.model for c in self.router.route(self.task).candidates]
+
+    def _model(self, choice: ModelChoice):
+        llm = self.build(choice)
+        return llm.with_config(**self.config) if self.config else llm
+
+    def _rate_limited(self, choice: ModelChoice, e: Exception) -> bool:
+        """Whether to move on to the next candidate after `e`."""
+        if isinstance(e, LLMOverloadedError):
+            return True # Our own budget: the model is fine, just busy
+        if is_rate_limit(e):
+            self.router.record_rate_limit(choice, retry_after(e))
+            return True
+        return False
+
+    def invoke(self, messages):
+        error = None
+        for choice in self.router.order(self.task):
+            start = time.perf_counter()
+            try:
+                with scheduled_call(self.scheduler, choice.key, messages, self.task) as call:
+                    if not uses_rate_limiter(self.build(choice)):
+                        call.ticket = self.scheduler.acquire(choice.key, messages, self.task)
+                    response = self._model(choice).invoke(messages)
+            except Exception as e:
+                if not self._rate_limited(choice, e):
+                    raise
+                error = e
+                continue
+            self._settle(choice, call, response, start)
+            return response
+        raise error
+
+    async def ainvoke(self, messages):
+        error = None
+        for choice in self.router.order(self.task):
+            start = time.perf_counter()
+            try:
+                with scheduled_call(self.scheduler, choice.key, messages, self.task) as call:
+                    if not uses_rate_limiter(self.build(choice)):
+                        call.ticket = await self.scheduler.aacquire(choice.key, messages, self.task)
+                    response = await self._model(choice).ainvoke(messages)
+            except Exception as e:
+                if not self._rate_limited(choice, e):
+                    raise
+                error = e
+                continue
+            self._settle(choice, call, response, start)
+            return response
+        raise error
+
+    def _settle(self, choice: ModelChoice, call: ScheduledCall, response, start: float):
+        waited = 0.0
+        if call.ticket is not None: # None: served by the LLM cache
+            self.scheduler.settle(call.ticket, response)
+            waited = call.ticket.waited
+        self.router.record_success(self.task, choice, time.perf_counter() - start - waited)
+
+# Singleton
+model_router = ModelRouter()
@@ -1,7 +1,10 @@
 
 import time
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from .exceptions import LLMError, ServiceUnavailableError, AppError
+import asyncio
+import inspect
+import functools
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type, retry_if_not_exception_type
+from .exceptions import LLMError, ServiceUnavailableError, AppError, DeadlineExceededError, OverloadedError
 
 class CircuitBreaker:
     def __init__(self, failure_threshold=3, recovery_timeout=60):
@@ -35,29 +38,82 @@ class CircuitBreaker:
 # Singleton
 global_circuit_breaker = CircuitBreaker()
 
+def _check_deadline(deadline):
+    if deadline is not None and time.time() >= deadline:
+        raise DeadlineExceededError("Request deadline exceeded.")
+
 def with_resilience(max_retries=3):
     """
     Decorator that adds:
     1. Circuit Breaker Check
     2. Retries with Exponential Backoff
+    3. An optional `deadline=` keyword (epoch seconds): no attempt or backoff starts past it,
+       and async attempts are cancelled when it is reached (DeadlineExceededError, also raised
+       when a failed attempt leaves no time for a retry).
+    Works on both sync and async (coroutine) functions.
     """
     def decorator(func):
-        @retry(
-            stop=stop_after_attempt(max_retries),
-            wait=wait_exponential(multiplier=1, min=2, max=10),
-            reraise=True
+        backoff = wait_exponential(multiplier=1, min=2, max=10)
+
+        def stop_at_deadline(retry_state):
+            # Give up if the backoff alone would run past the deadline
+            deadline = retry_state.kwargs.get("deadline")
+            return deadline is not None and time.time() + backoff(retry_state) >= deadline
+
+        def give_up(retry_state):
+            # Out of time for another attempt: the caller degrades on DeadlineExceededError, not on the provider error
+            error = retry_state.outcome.exception()
+            if stop_at_deadline(retry_state):
+                raise DeadlineExceededError("Request deadline exceeded.") from error
+            raise error
+
+        retrying = retry(
+            stop=stop_after_attempt(max_retries) | stop_at_deadline,
+            wait=backoff,
+            # A shed call already waited as long as allowed for its rate budget
+            retry=retry_if_not_exception_type((DeadlineExceededError, OverloadedError)),
+            retry_error_callback=give_up
         )
-        def wrapper(*args, **kwargs):
+
+        def on_failure(e):
+            # If we are in HALF-OPEN and fail, go back to OPEN immediately?
+            # For now, just record failure
+            if not isinstance(e, (ServiceUnavailableError, DeadlineExceededError)):
+                global_circuit_breaker.record_failure()
+
+        if inspect.iscoroutinefunction(func):
+            @retrying
+            @functools.wraps(func)
+            async def async_wrapper(*args, deadline=None, **kwargs):
+                global_circuit_breaker.check()
+                try:
+                    _check_deadline(deadline)
+                    if deadline is None:
+                        result = await func(*args, **kwargs)
+                    else:
+                        try:
+                            result = await asyncio.wait_for(func(*args, **kwargs), timeout=deadline - time.time())
+                        except asyncio.TimeoutError:
+                            raise DeadlineExceededError("Request deadline exceeded.")
+                    global_circuit_breaker.record_success()
+                    return result
+                except Exception as e:
+                    on_failure(e)
+                    raise e
+            return async_wrapper
+
+        @retrying
+        @functools.wraps(func)
+        def wrapper(*args, deadline=None, **kwargs):
             global_circuit_breaker.check()
             try:
+                # A running sync call cannot be interrupted; the deadline bounds retries only
+                _check_deadline(deadline)
                 result = func(*args, **kwargs)
                 global_circuit_breaker.record_success()
                 return result
             except Exception as e:
-                # If we are in HALF-OPEN and fail, go back to OPEN immediately?
-                # For now, just record failure
-                if not isinstance(e, ServiceUnavailableError):
-                    global_circuit_breaker.record_failure()
+                on_failure(e)
                 raise e
         return wrapper
     return decorator
@@ -0,0 +1,333 @@
+import os
+import re
+import time
+import codecs
+import asyncio
+import hashlib
+import sqlite3
+from contextlib import contextmanager, asynccontextmanager
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import httpx
+from pydantic import BaseModel
+from core.concurrency import run_blocking
+
+# Impersonate Googlebot for better SPA access
+SCRAPE_HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"}
+SCRAPE_TIMEOUT = float(os.getenv("SCRAPE_TIMEOUT", 15))
+SCRAPE_MAX_CONNECTIONS = int(os.getenv("SCRAPE_MAX_CONNECTIONS", 20))
+SCRAPE_MAX_PER_HOST = int(os.getenv("SCRAPE_MAX_PER_HOST", 4))
+
+# Download limits: bodies are streamed and abandoned once enough text has been read
+SCRAPE_MAX_BYTES = int(os.getenv("SCRAPE_MAX_BYTES", 2 * 1024 * 1024))
+SCRAPE_MAX_CHARS = int(os.getenv("SCRAPE_MAX_CHARS", 15000))
+SCRAPE_CHUNK_SIZE = 64 * 1024
+TEXT_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+
+# Scraped pages are reused until they expire, then revalidated with a conditional request
+SCRAPE_CACHE_PATH = os.getenv("SCRAPE_CACHE_PATH", "data/scrape_cache.db")
+SCRAPE_CACHE_TTL = float(os.getenv("SCRAPE_CACHE_TTL", 24 * 3600))
+# Also chunk successfully scraped pages into the vector store
+SCRAPE_INDEX_PAGES = os.getenv("SCRAPE_INDEX_PAGES", "false").lower() == "true"
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+def normalize_url(url: str) -> str:
+    """
+    Cache key for a URL: lowercase scheme/host, no default port, no fragment,
+    sorted query parameters. "https://Docs.X.com:443/a?b=2&a=1#s" -> "https://docs.x.com/a?a=1&b=2"
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+def is_text_content_type(content_type: Optional[str]) -> bool:
+    """Servers that send no Content-Type get the benefit of the doubt."""
+    if not content_type:
+        return True
+    return content_type.split(";")[0].strip().lower() in TEXT_CONTENT_TYPES
+
+def charset_of(content_type: Optional[str]) -> str:
+    match = re.search(r"charset=[\"']?([\w.:-]+)", content_type or "", re.IGNORECASE)
+    if match:
+        try:
+            return codecs.lookup(match.group(1)).name
+        except LookupError:
+            pass
+    return "utf-8"
+
+class PageTextExtractor(HTMLParser):
+    """
+    Incremental HTML -> text extraction.
+    Unlike a full soup tree, nothing is kept but the collected text, chunks can be fed
+    as they arrive, and `done` turns True as soon as `max_chars` characters were collected.
+    Text is whitespace-collapsed; scripts, styles and page chrome are skipped.
+    """
+    SKIP_TAGS = {"script", "style", "nav", "footer", "header", "iframe", "noscript"}
+
+    def __init__(self, charset: str = "utf-8", max_chars: int = SCRAPE_MAX_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self._decoder = codecs.getincrementaldecoder(charset)(errors="replace")
+        self._skip_depth = 0
+        self._parts: List[str] = []
+        self._length = 0
+
+    @property
+    def done(self) -> bool:
+        return self._length >= self.max_chars
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth or self.done:
+            return
+        words = data.split()
+        if words:
+            part = " ".join(words)
+            self._parts.append(part)
+            self._length += len(part) + 1
+
+    def feed_bytes(self, chunk: bytes):
+        self.feed(self._decoder.decode(chunk))
+
+    def close(self):
+        self.feed(self._decoder.decode(b"", final=True))
+        super().close()
+
+    def text(self) -> str:
+        return " ".join(self._parts)[:self.max_chars]
+
+def _new_extractor(headers, max_chars: int) -> Optional[PageTextExtractor]:
+    content_type = headers.get("content-type")
+    if not is_text_content_type(content_type):
+        print(f"   ⚠️ Unsupported content type: {content_type}")
+        return None
+    return PageTextExtractor(charset=charset_of(content_type), max_chars=max_chars)
+
+def read_page_text(headers, chunks: Iterable[bytes], max_bytes: int = SCRAPE_MAX_BYTES, max_chars: int = SCRAPE_MAX_CHARS) -> Optional[str]:
+    """
+    Extracts text from a streamed body. Stops reading at `max_bytes` or once
+    `max_chars` of text were collected. None if the content type is not text.
+    """
+    extractor = _new_extractor(headers, max_chars)
+    if extractor is None:
+        return None
+    read = 0
+    for chunk in chunks:
+        read += len(chunk)
+        if read > max_bytes:
+            chunk = chunk[:max(0, len(chunk) - (read - max_bytes))]
+        extractor.feed_bytes(chunk)
+        if extractor.done or read >= max_bytes:
+            break
+    extractor.close()
+    return extractor.text()
+
+async def aread_page_text(headers, chunks: AsyncIterator[bytes], max_bytes: int = SCRAPE_MAX_BYTES, max_chars: int = SCRAPE_MAX_CHARS) -> Optional[str]:
+    """Async read_page_text; parsing runs on the blocking executor, chunk by chunk."""
+    extractor = _new_extractor(headers, max_chars)
+    if extractor is None:
+        return None
+    read = 0
+    async for chunk in chunks:
+        read += len(chunk)
+        if read > max_bytes:
+            chunk = chunk[:max(0, len(chunk) - (read - max_bytes))]
+        await run_blocking(extractor.feed_bytes, chunk)
+        if extractor.done or read >= max_bytes:
+            break
+    extractor.close()
+    return extractor.text()
+
+class ScrapeClient:
+    """
+    Shared async HTTP pool for documentation scraping.
+    - Keep-alive connections are reused across chats.
+    - At most `max_per_host` requests hit the same host at once (politeness + fairness).
+    httpx clients and asyncio semaphores are bound to an event loop, so the pool
+    is (re)created lazily for the running loop.
+    """
+    def __init__(self, max_connections: int = SCRAPE_MAX_CONNECTIONS, max_per_host: int = SCRAPE_MAX_PER_HOST, timeout: float = SCRAPE_TIMEOUT):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or loop is not self._loop:
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                headers=SCRAPE_HEADERS,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            )
+            self._host_slots = {}
+        return self._client
+
+    def _host_slot(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.max_per_host)
+        return slot
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        client = self._get_client()
+        async with self._host_slot(url):
+            return await client.get(url, headers=headers)
+
+    @asynccontextmanager
+    async def stream(self, url: str, headers: Optional[Dict[str, str]] = None):
+        """Streams a GET; the host slot is held until the body is closed."""
+        client = self._get_client()
+        async with self._host_slot(url):
+            async with client.stream("GET", url, headers=headers) as response:
+                yield response
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+class CachedPage(BaseModel):
+    url: str
+    text: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: float
+    expires_at: float
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        return (now or time.time()) < self.expires_at
+
+    def revalidation_headers(self) -> Dict[str, str]:
+        """Conditional request headers; the server answers 304 if the page is unchanged."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+class PageCache:
+    """
+    Persistent cache of extracted page text, keyed by normalized URL.
+    Freshness follows Cache-Control max-age (default: ttl_seconds); `no-store` pages are not kept.
+    Expired entries keep their ETag / Last-Modified so they can be revalidated cheaply.
+    """
+    def __init__(self, path: str = SCRAPE_CACHE_PATH, ttl_seconds: float = SCRAPE_CACHE_TTL):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._init_db()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+
+    def _expires_at(self, headers, now: float) -> Optional[float]:
+        """None means the response must not be cached."""
+        cache_control = (headers.get("cache-control") or "").lower()
+        if "no-store" in cache_control:
+            return None
+        max_age = re.search(r"max-age=(\d+)", cache_control)
+        return now + (int(max_age.group(1)) if max_age else self.ttl_seconds)
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT url, text, etag, last_modified, fetched_at, expires_at FROM pages WHERE url = ?",
+                    (normalize_url(url),)
+                ).fetchone()
+            return CachedPage(**dict(row)) if row else None
+        except Exception as e:
+            print(f"⚠️ Scrape cache read failed: {e}")
+            return None
+
+    def store(self, url: str, text: str, headers) -> bool:
+        """Caches a freshly downloaded page. Returns True if the text is new or changed."""
+        now = time.time()
+        expires_at = self._expires_at(headers, now)
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        key = normalize_url(url)
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT text_hash FROM pages WHERE url = ?", (key,)).fetchone()
+                changed = row is None or row["text_hash"] != text_hash
+                if expires_at is None:
+                    conn.execute("DELETE FROM pages WHERE url = ?", (key,))
+                else:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO pages (url, text, text_hash, etag, last_modified, fetched_at, expires_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (key, text, text_hash, headers.get("etag"), headers.get("last-modified"), now, expires_at)
+                    )
+            return changed
+        except Exception as e:
+            print(f"⚠️ Scrape cache write failed: {e}")
+            return True
+
+    def refresh(self, url: str, headers):
+        """The server confirmed our copy (304): extend its lifetime, keep the text."""
+        now = time.time()
+        expires_at = self._expires_at(headers, now)
+        key = normalize_url(url)
+        try:
+            with self._connect() as conn:
+                if expires_at is None:
+                    conn.execute("DELETE FROM pages WHERE url = ?", (key,))
+                    return
+                # A 304 may carry updated validators
+                conn.execute(
+                    "UPDATE pages SET fetched_at = ?, expires_at = ?, "
+                    "etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                    (now, expires_at, headers.get("etag"), headers.get("last-modified"), key)
+                )
+        except Exception as e:
+            print(f"⚠️ Scrape cache write failed: {e}")
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM pages")
+
+# Singletons
+scrape_client = ScrapeClient()
+page_cache = PageCache()
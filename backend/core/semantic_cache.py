@@ -0,0 +1,184 @@
+import os
+import re
+import time
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, FrozenSet, List, Optional, Tuple
+import numpy as np
+from pydantic import BaseModel, ConfigDict
+from core.vector_store import store as vector_store
+from core.cache import normalize_query
+from core.concurrency import run_blocking
+from core.tracing import record_cache
+
+# Roles whose LLM responses are reused for near-duplicate inputs, with the similarity each requires ("role:threshold,...").
+# Only roles whose answer depends on the gist of a short input belong here; summarization ("summarize:0.97") is opt-in.
+SEMANTIC_LLM_CACHE_ROLES = os.getenv("SEMANTIC_LLM_CACHE_ROLES", "expansion:0.9,search_query:0.92")
+SEMANTIC_LLM_CACHE_TTL = int(os.getenv("SEMANTIC_LLM_CACHE_TTL", 86400))
+SEMANTIC_LLM_CACHE_SIZE = int(os.getenv("SEMANTIC_LLM_CACHE_SIZE", 1000)) # Entries per role
+
+# Nearest entries checked against the guards before giving up
+MAX_CANDIDATES = 3
+# Inputs whose lengths (in words) differ more than this are never the same request
+MAX_LENGTH_RATIO = 2.0
+
+# Terms that change the answer although they barely move the embedding ("401" vs "403", "GET" vs "POST",
+# "/pets" vs "/users", "python" vs "go"): both inputs must contain the same ones.
+KEY_TERM_PATTERN = re.compile(
+    r"\b\d+(?:\.\d+)*\b"                                    # numbers, status codes, versions
+    r"|https?://\S+|(?<![\w])/[\w{}./-]+"                   # URLs and paths
+    r"|\b(?:get|post|put|patch|delete|head|options)\b"      # HTTP methods
+    r"|\b\w+[._]\w[\w.]*\b"                                 # identifiers (snake_case, dotted)
+    r"|\"[^\"]+\"|'[^']+'|`[^`]+`"                          # quoted strings
+    r"|\b(?:python|javascript|typescript|node(?:\.?js)?|java|golang|go|ruby|php|rust|kotlin|swift|curl|csharp)\b|c#|c\+\+",
+    re.IGNORECASE
+)
+CAMEL_CASE_PATTERN = re.compile(r"\b[a-z]+[A-Z]\w*\b")
+NEGATION_PATTERN = re.compile(r"\b(?:not|no|never|without|except|excluding|don't|doesn't|isn't|can't|cannot|won't)\b")
+
+def parse_roles(spec: str) -> Dict[str, float]:
+    """'expansion:0.9,search_query:0.92' -> {"expansion": 0.9, "search_query": 0.92}"""
+    roles = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        role, _, threshold = item.partition(":")
+        roles[role.strip()] = float(threshold) if threshold else 0.95
+    return roles
+
+def key_terms(text: str) -> FrozenSet[str]:
+    terms = KEY_TERM_PATTERN.findall(text) + CAMEL_CASE_PATTERN.findall(text)
+    return frozenset(term.lower() for term in terms)
+
+def negations(text: str) -> FrozenSet[str]:
+    return frozenset(NEGATION_PATTERN.findall(text.lower()))
+
+class SemanticProbe(BaseModel):
+    """A normalized task input, embedded once for the lookup and reused to store the response."""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    role: str
+    text: str
+    scope: str
+    embedding: np.ndarray
+    terms: FrozenSet[str]
+    negations: FrozenSet[str]
+    words: int
+
+class _Entry(BaseModel):
+    probe: SemanticProbe
+    value: str
+    created_at: float
+
+class SemanticLLMCache:
+    """
+    Reuses LLM responses of selected roles for near-duplicate inputs (e.g. query expansions of
+    "auth error" for "authentication error"), where the exact LLM cache only matches identical prompts.
+    - Matches the embedding of the normalized task input (not the whole prompt) against earlier inputs of
+      the same role, above the role's threshold.
+    - Correctness guards: same scope (e.g. a session), same key terms (numbers, paths, HTTP methods,
+      identifiers, quoted strings, languages), same negations, comparable length.
+    - Per role: up to `max_entries` inputs (oldest evicted first), each served for `ttl_seconds`.
+    Embedding failures are misses. Thread-safe.
+    """
+    def __init__(self, roles: Optional[Dict[str, float]] = None, max_entries: int = SEMANTIC_LLM_CACHE_SIZE, ttl_seconds: float = SEMANTIC_LLM_CACHE_TTL):
+        self.roles = roles if roles is not None else parse_roles(SEMANTIC_LLM_CACHE_ROLES)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Deque[_Entry]] = {role: deque(maxlen=max_entries) for role in self.roles}
+        self.counts: Dict[str, Dict[str, int]] = {role: {"hits": 0, "misses": 0, "guarded": 0} for role in self.roles}
+
+    def enabled(self, role: str) -> bool:
+        return role in self.roles
+
+    def probe(self, role: str, text: str, scope: str = "") -> Optional[SemanticProbe]:
+        normalized = normalize_query(text)
+        try:
+            vector = np.asarray(vector_store.embedding_fn([normalized])[0], dtype=np.float32)
+        except Exception as e:
+            print(f"⚠️ Semantic cache unavailable: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return SemanticProbe(
+            role=role, text=normalized, scope=scope, embedding=vector / norm if norm else vector,
+            terms=key_terms(text), negations=negations(text), words=len(normalized.split())
+        )
+
+    def _compatible(self, probe: SemanticProbe, other: SemanticProbe) -> bool:
+        longer, shorter = max(probe.words, other.words), max(1, min(probe.words, other.words))
+        return (
+            probe.scope == other.scope
+            and probe.terms == other.terms
+            and probe.negations == other.negations
+            and longer / shorter <= MAX_LENGTH_RATIO
+        )
+
+    def lookup(self, role: str, text: str, scope: str = "") -> Tuple[Optional[str], Optional[SemanticProbe]]:
+        """(cached response or None, probe to `store` the computed response with). Disabled roles: (None, None)."""
+        if not self.enabled(role):
+            return None, None
+        probe = self.probe(role, text, scope)
+        if probe is None:
+            return None, None
+
+        now = time.time()
+        with self._lock:
+            entries: List[_Entry] = [e for e in self._entries[role] if now - e.created_at < self.ttl_seconds]
+        value, guarded = None, False
+        if entries:
+            similarities = np.stack([e.probe.embedding for e in entries]) @ probe.embedding
+            for i in np.argsort(-similarities)[:MAX_CANDIDATES]:
+                if similarities[i] < self.roles[role]:
+                    break
+                if self._compatible(probe, entries[i].probe):
+                    value = entries[i].value
+                    print(f"🧠 Semantic LLM cache hit ({role}, similarity {similarities[i]:.3f})")
+                    break
+                guarded = True
+
+        with self._lock:
+            counts = self.counts[role]
+            counts["hits" if value is not None else "misses"] += 1
+            if guarded and value is None:
+                counts["guarded"] += 1
+        record_cache(f"semantic_{role}", value is not None)
+        return value, probe
+
+    def store(self, probe: Optional[SemanticProbe], value: Optional[str]):
+        if probe is None or not value:
+            return
+        with self._lock:
+            self._entries[probe.role].append(_Entry(probe=probe, value=value, created_at=time.time()))
+
+    def get_or_compute(self, role: str, text: str, compute: Callable[[], str], scope: str = "") -> str:
+        value, probe = self.lookup(role, text, scope)
+        if value is not None:
+            return value
+        value = compute()
+        self.store(probe, value)
+        return value
+
+    async def aget_or_compute(self, role: str, text: str, compute: Callable[[], Awaitable[str]], scope: str = "") -> str:
+        """Async variant of get_or_compute (the embedding runs on the blocking executor)."""
+        if not self.enabled(role):
+            return await compute()
+        value, probe = await run_blocking(self.lookup, role, text, scope)
+        if value is not None:
+            return value
+        value = await compute()
+        self.store(probe, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            for entries in self._entries.values():
+                entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {role: {**counts, "entries": len(self._entries[role])} for role, counts in self.counts.items()}
+        for counts in stats.values():
+            lookups = counts["hits"] + counts["misses"]
+            counts["hit_ratio"] = counts["hits"] / lookups if lookups else 0.0
+        return stats
+
+# Singleton
+semantic_llm_cache = SemanticLLMCache()
@@ -1,107 +1,464 @@
-
+import os
 import uuid
 import time
-from typing import Dict, List, Optional
+import json
+import gzip
+import base64
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel
+from core.tracing import traced
+from core.checkpointer import session_checkpointer
 
 class SessionMessage(BaseModel):
     role: str
     content: str
     timestamp: float = 0.0
+    seq: int = 0
 
 class SessionData(BaseModel):
     id: str
     user_id: str
     created_at: float
+    message_count: int = 0
     messages: List[SessionMessage] = []
-    
+
+def encode_cursor(created_at: float, session_id: str) -> str:
+    raw = json.dumps([created_at, session_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """Raises ValueError on a malformed cursor."""
+    try:
+        created_at, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(created_at), str(session_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+# Idle sessions older than this are moved to the archive (0 disables expiry)
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", 30 * 24 * 3600))
+SESSION_GC_INTERVAL_SECONDS = float(os.getenv("SESSION_GC_INTERVAL_SECONDS", 3600))
+
 class SessionManager:
     """
     Manages chat sessions and history.
-    Currently In-Memory. In production, swap with Redis/Postgres.
+    Backed by SQLite so that the API and CLI processes share one store:
+    - Each message is a single row insert; writes only touch the session they belong to.
+    - An in-process lock per session serializes writers of the same session,
+      while SQLite's write lock (BEGIN IMMEDIATE) covers other processes.
+    - Sessions idle for longer than the TTL are moved to gzip archive segments
+      next to the database, keeping the live tables small.
     """
-    def __init__(self, persistence_file: str = "data/sessions.json"):
+    def __init__(self, persistence_file: str = "data/sessions.db", ttl_seconds: float = SESSION_TTL_SECONDS):
         self.persistence_file = persistence_file
-        self._ensure_data_dir()
-        self._sessions: Dict[str, SessionData] = self._load_sessions()
+        self.ttl_seconds = ttl_seconds
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._sweeper: Optional[threading.Thread] = None
+        self._sweeper_stop = threading.Event()
+        self._init_db()
+
+    @property
+    def archive_dir(self) -> Path:
+        return Path(self.persistence_file).parent / "session_archive"
 
     def _ensure_data_dir(self):
-        import os
-        from pathlib import Path
         path = Path(self.persistence_file)
         if not path.parent.exists():
             path.parent.mkdir(parents=True, exist_ok=True)
 
-    def _load_sessions(self) -> Dict[str, SessionData]:
-        import json
-        from pathlib import Path
-        path = Path(self.persistence_file)
-        if not path.exists():
-            return {}
+    @contextmanager
+    def _connect(self):
+        # Short-lived connection per operation: safe across threads and processes.
+        conn = sqlite3.connect(self.persistence_file, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
         try:
-            data = json.loads(path.read_text(encoding="utf-8"))
-            return {
-                sid: SessionData(**s_data) 
-                for sid, s_data in data.items()
-            }
-        except Exception as e:
-            print(f"⚠️ Error loading sessions: {e}")
-            return {}
+            yield conn
+        finally:
+            conn.close()
 
-    def _save_sessions(self):
-        import json
-        from pathlib import Path
+    @contextmanager
+    def _write(self):
+        """Opens a write transaction holding SQLite's inter-process write lock."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _lock_for(self, session_id: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(session_id)
+            if lock is None:
+                lock = self._locks[session_id] = threading.Lock()
+            return lock
+
+    def _init_db(self):
+        self._ensure_data_dir()
+        with self._connect() as conn:
+            # WAL lets readers proceed while a writer holds the lock
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    message_count INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    timestamp REAL NOT NULL,
+                    PRIMARY KEY (session_id, seq)
+                );
+                -- Keyset pagination for listings (newest first)
+                CREATE INDEX IF NOT EXISTS idx_sessions_user_created ON sessions (user_id, created_at);
+                CREATE INDEX IF NOT EXISTS idx_sessions_created ON sessions (created_at);
+                CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at);
+                -- Rolling conversation summaries, keyed by the hash of the summarized message range
+                CREATE TABLE IF NOT EXISTS history_summaries (
+                    range_hash TEXT PRIMARY KEY,
+                    session_id TEXT,
+                    message_count INTEGER NOT NULL,
+                    summary TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_summaries_session ON history_summaries (session_id);
+                -- Where each archived session lives
+                CREATE TABLE IF NOT EXISTS archived_sessions (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    archived_at REAL NOT NULL,
+                    segment TEXT NOT NULL
+                );
+            """)
+        self._import_legacy_json()
+
+    def _import_legacy_json(self):
+        """One-off migration of the old single-file JSON store (data/sessions.json)."""
+        legacy = Path(self.persistence_file).with_suffix(".json")
+        if not legacy.exists():
+            return
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM sessions LIMIT 1").fetchone():
+                return
         try:
-            path = Path(self.persistence_file)
-            data = {sid: s.model_dump() for sid, s in self._sessions.items()}
-            path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+            data = json.loads(legacy.read_text(encoding="utf-8"))
+            sessions = [SessionData(**s_data) for s_data in data.values()]
         except Exception as e:
-            print(f"⚠️ Error saving sessions: {e}")
+            print(f"⚠️ Error loading legacy sessions: {e}")
+            return
+
+        with self._write() as conn:
+            for s in sessions:
+                updated_at = s.messages[-1].timestamp if s.messages else s.created_at
+                conn.execute(
+                    "INSERT OR IGNORE INTO sessions (id, user_id, created_at, updated_at, message_count) VALUES (?, ?, ?, ?, ?)",
+                    (s.id, s.user_id, s.created_at, updated_at, len(s.messages))
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO messages (session_id, seq, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                    [(s.id, i, m.role, m.content, m.timestamp) for i, m in enumerate(s.messages)]
+                )
+        print(f"✅ Imported {len(sessions)} sessions from {legacy}")
+
+    def _load_messages(self, conn, session_id: str, limit: Optional[int] = None, before: Optional[int] = None) -> List[SessionMessage]:
+        """Loads messages in chronological order; with limit/before, only the latest `limit` with seq < before."""
+        query = "SELECT seq, role, content, timestamp FROM messages WHERE session_id = ?"
+        params: list = [session_id]
+        if before is not None:
+            query += " AND seq < ?"
+            params.append(before)
+        query += " ORDER BY seq DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = conn.execute(query, params).fetchall()
+        return [
+            SessionMessage(seq=r["seq"], role=r["role"], content=r["content"], timestamp=r["timestamp"])
+            for r in reversed(rows)
+        ]
 
+    def _row_to_session(self, row, messages: Optional[List[SessionMessage]] = None) -> SessionData:
+        return SessionData(
+            id=row["id"],
+            user_id=row["user_id"],
+            created_at=row["created_at"],
+            message_count=row["message_count"],
+            messages=messages or []
+        )
+
+    @traced("session_store")
     def create_session(self, user_id: str = "default_user") -> SessionData:
-        session_id = str(uuid.uuid4())
         session = SessionData(
-            id=session_id,
+            id=str(uuid.uuid4()),
             user_id=user_id,
             created_at=time.time(),
             messages=[]
         )
-        self._sessions[session_id] = session
-        self._save_sessions()
+        with self._write() as conn:
+            conn.execute(
+                "INSERT INTO sessions (id, user_id, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (session.id, session.user_id, session.created_at, session.created_at)
+            )
         return session
 
-    def get_session(self, session_id: str) -> Optional[SessionData]:
-        # Always reload to sync across processes (CLI vs API)
-        self._sessions = self._load_sessions()
-        return self._sessions.get(session_id)
+    @traced("session_store")
+    def get_session(self, session_id: str, include_messages: bool = True) -> Optional[SessionData]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, user_id, created_at, message_count FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if not row:
+                return None
+            messages = self._load_messages(conn, session_id) if include_messages else []
+            return self._row_to_session(row, messages)
 
-    def list_sessions(self, user_id: Optional[str] = None) -> List[SessionData]:
-        self._sessions = self._load_sessions()
+    @traced("session_store")
+    def get_messages(self, session_id: str, limit: Optional[int] = None, before: Optional[int] = None) -> List[SessionMessage]:
+        with self._connect() as conn:
+            return self._load_messages(conn, session_id, limit=limit, before=before)
+
+    @traced("session_store")
+    def list_sessions_page(
+        self,
+        user_id: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[SessionData], Optional[str]]:
+        """
+        Newest-first page of sessions (message counts only, no bodies).
+        Returns (sessions, next_cursor); next_cursor is None on the last page.
+        """
+        query = "SELECT id, user_id, created_at, message_count FROM sessions"
+        clauses, params = [], []
         if user_id:
-             return [s for s in self._sessions.values() if s.user_id == user_id]
-        return list(self._sessions.values())
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if cursor:
+            created_at, session_id = decode_cursor(cursor)
+            clauses.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([created_at, created_at, session_id])
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        page = [self._row_to_session(r) for r in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = page[-1]
+            next_cursor = encode_cursor(last.created_at, last.id)
+        return page, next_cursor
+
+    def list_sessions(self, user_id: Optional[str] = None) -> List[SessionData]:
+        """All sessions, newest first, without message bodies."""
+        sessions, cursor = [], None
+        while True:
+            page, cursor = self.list_sessions_page(user_id, limit=500, cursor=cursor)
+            sessions.extend(page)
+            if not cursor:
+                return sessions
 
+    @traced("session_store")
     def add_message(self, session_id: str, role: str, content: str):
-        self._sessions = self._load_sessions()
-        session = self.get_session(session_id) # Reloaded
-        if session:
-            msg = SessionMessage(role=role, content=content, timestamp=time.time())
-            session.messages.append(msg)
-            self._save_sessions()
+        now = time.time()
+        with self._lock_for(session_id):
+            with self._write() as conn:
+                row = conn.execute(
+                    "SELECT message_count FROM sessions WHERE id = ?", (session_id,)
+                ).fetchone()
+                if not row:
+                    return
+                conn.execute(
+                    "INSERT INTO messages (session_id, seq, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                    (session_id, row["message_count"], role, content, now)
+                )
+                conn.execute(
+                    "UPDATE sessions SET message_count = message_count + 1, updated_at = ? WHERE id = ?",
+                    (now, session_id)
+                )
 
     def get_history(self, session_id: str) -> List[Dict[str, str]]:
         session = self.get_session(session_id)
         if not session:
             return []
-        
+
         # Convert to format expected by Agent (or similar)
         return [{"role": m.role, "content": m.content} for m in session.messages]
 
+    @traced("session_store")
     def clear_session(self, session_id: str):
-         self._sessions = self._load_sessions()
-         if session_id in self._sessions:
-             self._sessions[session_id].messages = []
-             self._save_sessions()
+        with self._lock_for(session_id):
+            with self._write() as conn:
+                conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                conn.execute(
+                    "UPDATE sessions SET message_count = 0, updated_at = ? WHERE id = ?",
+                    (time.time(), session_id)
+                )
+            session_checkpointer.delete_thread(session_id)
+
+    # --- Rolling Summaries ---
+
+    @traced("session_store")
+    def find_summary(self, range_hashes: List[str]) -> Optional[Dict]:
+        """
+        Returns the stored summary covering the longest of the given ranges, as
+        {"range_hash", "message_count", "summary"}, or None if none is stored.
+        """
+        if not range_hashes:
+            return None
+        placeholders = ",".join("?" * len(range_hashes))
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT range_hash, message_count, summary FROM history_summaries "
+                f"WHERE range_hash IN ({placeholders}) ORDER BY message_count DESC LIMIT 1",
+                range_hashes
+            ).fetchone()
+        return dict(row) if row else None
+
+    @traced("session_store")
+    def save_summary(self, range_hash: str, message_count: int, summary: str, session_id: Optional[str] = None):
+        with self._write() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO history_summaries (range_hash, session_id, message_count, summary, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (range_hash, session_id, message_count, summary, time.time())
+            )
+            if session_id:
+                # Only the newest summary of a session is ever extended
+                conn.execute(
+                    "DELETE FROM history_summaries WHERE session_id = ? AND message_count < ?",
+                    (session_id, message_count)
+                )
+
+    # --- Expiry & Archival ---
+
+    @traced("session_store")
+    def archive_expired(self, ttl_seconds: Optional[float] = None, now: Optional[float] = None) -> int:
+        """
+        Moves sessions idle for longer than the TTL into a new gzip JSONL archive segment,
+        then compacts the database. Returns the number of archived sessions.
+        """
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0:
+            return 0
+        now = time.time() if now is None else now
+        cutoff = now - ttl
+
+        with self._write() as conn:
+            # Summaries of stateless /chat histories have no session to expire with
+            conn.execute("DELETE FROM history_summaries WHERE session_id IS NULL AND updated_at < ?", (cutoff,))
+            rows = conn.execute(
+                "SELECT id, user_id, created_at, message_count FROM sessions WHERE updated_at < ?", (cutoff,)
+            ).fetchall()
+            if not rows:
+                return 0
+
+            self.archive_dir.mkdir(parents=True, exist_ok=True)
+            segment = self.archive_dir / f"sessions-{int(now)}-{uuid.uuid4().hex[:8]}.jsonl.gz"
+            with gzip.open(segment, "wt", encoding="utf-8") as f:
+                for row in rows:
+                    session = self._row_to_session(row, self._load_messages(conn, row["id"]))
+                    f.write(session.model_dump_json() + "\n")
+
+            ids = [row["id"] for row in rows]
+            conn.executemany(
+                "INSERT OR REPLACE INTO archived_sessions (id, user_id, created_at, archived_at, segment) VALUES (?, ?, ?, ?, ?)",
+                [(r["id"], r["user_id"], r["created_at"], now, segment.name) for r in rows]
+            )
+            conn.executemany("DELETE FROM messages WHERE session_id = ?", [(sid,) for sid in ids])
+            conn.executemany("DELETE FROM sessions WHERE id = ?", [(sid,) for sid in ids])
+            conn.executemany("DELETE FROM history_summaries WHERE session_id = ?", [(sid,) for sid in ids])
+
+        # The graph state is rebuilt from the messages if the session is restored
+        session_checkpointer.delete_threads(ids)
+        with self._locks_guard:
+            for sid in ids:
+                self._locks.pop(sid, None)
+
+        self._compact()
+        print(f"🗄️ Archived {len(ids)} idle sessions to {segment.name}")
+        return len(ids)
+
+    def _compact(self):
+        try:
+            with self._connect() as conn:
+                conn.execute("VACUUM")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.OperationalError as e:
+            # Another connection is busy; space is reclaimed on the next sweep
+            print(f"⚠️ Session store compaction skipped: {e}")
+
+    def get_archived_session(self, session_id: str) -> Optional[SessionData]:
+        """Reads a session (with messages) back from its archive segment."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT segment FROM archived_sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if not row:
+            return None
+        segment = self.archive_dir / row["segment"]
+        try:
+            with gzip.open(segment, "rt", encoding="utf-8") as f:
+                for line in f:
+                    data = json.loads(line)
+                    if data["id"] == session_id:
+                        return SessionData(**data)
+        except Exception as e:
+            print(f"⚠️ Error reading archive segment {segment}: {e}")
+        return None
+
+    @traced("session_store")
+    def restore_session(self, session_id: str) -> Optional[SessionData]:
+        """Moves an archived session back into the live store (e.g. when the user resumes it)."""
+        session = self.get_archived_session(session_id)
+        if not session:
+            return None
+        now = time.time()
+        with self._lock_for(session_id):
+            with self._write() as conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO sessions (id, user_id, created_at, updated_at, message_count) VALUES (?, ?, ?, ?, ?)",
+                    (session.id, session.user_id, session.created_at, now, len(session.messages))
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO messages (session_id, seq, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                    [(session.id, m.seq, m.role, m.content, m.timestamp) for m in session.messages]
+                )
+                conn.execute("DELETE FROM archived_sessions WHERE id = ?", (session_id,))
+        return session
+
+    def start_sweeper(self, interval_seconds: float = SESSION_GC_INTERVAL_SECONDS):
+        """Starts a daemon thread that archives expired sessions every `interval_seconds`."""
+        if self.ttl_seconds <= 0 or (self._sweeper and self._sweeper.is_alive()):
+            return
+        self._sweeper_stop.clear()
+
+        def sweep():
+            while not self._sweeper_stop.wait(interval_seconds):
+                try:
+                    self.archive_expired()
+                except Exception as e:
+                    print(f"⚠️ Session sweeper failed: {e}")
+
+        self._sweeper = threading.Thread(target=sweep, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._sweeper_stop.set()
 
 # Singleton
 session_manager = SessionManager()
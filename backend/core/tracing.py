@@ -0,0 +1,260 @@
+import time
+import uuid
+import inspect
+import bisect
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+# Upper bounds (seconds) of the aggregated latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CHARS_PER_TOKEN = 4
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("request_trace", default=None)
+# Graph node the current code runs in (LLM calls and retrieval stages are attributed to it)
+_current_stage: contextvars.ContextVar = contextvars.ContextVar("trace_stage", default=None)
+
+class Span:
+    """One timed operation: a graph node, an LLM call, a retrieval stage or a cache lookup."""
+    __slots__ = ("kind", "name", "stage", "start", "duration", "attrs")
+
+    def __init__(self, kind: str, name: str, stage: Optional[str], attrs: Dict[str, Any]):
+        self.kind = kind
+        self.name = name
+        self.stage = stage
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            "stage": self.stage,
+            "start_ms": round((self.start - origin) * 1000, 1),
+            "duration_ms": round(self.duration * 1000, 1),
+            **self.attrs,
+        }
+
+class RequestTrace:
+    """All spans of one chat request, in completion order."""
+    def __init__(self, request_id: Optional[str] = None):
+        self.request_id = request_id or uuid.uuid4().hex[:12]
+        self.start = time.perf_counter()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals per node, LLM tokens and retries, and cache hits/misses."""
+        with self._lock:
+            spans = list(self.spans)
+        nodes: Dict[str, float] = {}
+        llm = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "retries": 0}
+        cache: Dict[str, Dict[str, int]] = {}
+        for span in spans:
+            if span.kind == "node":
+                nodes[span.name] = round(nodes.get(span.name, 0.0) + span.duration * 1000, 1)
+            elif span.kind == "llm":
+                llm["calls"] += 1
+                llm["prompt_tokens"] += span.attrs.get("prompt_tokens", 0)
+                llm["completion_tokens"] += span.attrs.get("completion_tokens", 0)
+                llm["retries"] += span.attrs.get("retries", 0)
+            elif span.kind == "cache":
+                counts = cache.setdefault(span.name, {"hits": 0, "misses": 0})
+                counts["hits" if span.attrs.get("hit") else "misses"] += 1
+        return {"node_ms": nodes, "llm": llm, "cache": cache}
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [span.to_dict(self.start) for span in self.spans]
+        return {
+            "request_id": self.request_id,
+            "total_ms": round((time.perf_counter() - self.start) * 1000, 1),
+            "summary": self.summary(),
+            "spans": spans,
+        }
+
+    def describe(self) -> str:
+        summary = self.summary()
+        nodes = " | ".join(f"{name} {ms / 1000:.2f}s" for name, ms in summary["node_ms"].items())
+        llm = summary["llm"]
+        return f"{nodes} | LLM calls {llm['calls']} ({llm['prompt_tokens']}+{llm['completion_tokens']} tokens, {llm['retries']} retries)"
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus style). `observe` is O(log buckets)."""
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last slot: +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        """(cumulative counts per bucket incl. +Inf, sum, count)"""
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return cumulative, total, count
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the last finite bound for +Inf)."""
+        cumulative, _, count = self.snapshot()
+        if not count:
+            return 0.0
+        rank = q * count
+        for bound, seen in zip(self.buckets + (self.buckets[-1],), cumulative):
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+class TraceStats:
+    """Aggregates spans of all requests: latency histograms per (kind, name), token, retry and cache counters."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.tokens: Dict[str, Dict[str, int]] = {}
+        self.retries: Dict[str, int] = {}
+        self.cache: Dict[str, Dict[str, int]] = {}
+
+    def _histogram(self, key: Tuple[str, str]) -> Histogram:
+        histogram = self.latency.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.latency.setdefault(key, Histogram())
+        return histogram
+
+    def observe(self, span: Span):
+        # LLM calls are aggregated per graph node (which is what tells plan from generate)
+        name = (span.stage or span.name) if span.kind == "llm" else span.name
+        self._histogram((span.kind, name)).observe(span.duration)
+        if span.kind == "llm":
+            with self._lock:
+                tokens = self.tokens.setdefault(name, {"prompt": 0, "completion": 0})
+                tokens["prompt"] += span.attrs.get("prompt_tokens", 0)
+                tokens["completion"] += span.attrs.get("completion_tokens", 0)
+                self.retries[name] = self.retries.get(name, 0) + span.attrs.get("retries", 0)
+        elif span.kind == "cache":
+            with self._lock:
+                counts = self.cache.setdefault(name, {"hits": 0, "misses": 0})
+                counts["hits" if span.attrs.get("hit") else "misses"] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            latency = dict(self.latency)
+            tokens = {name: dict(counts) for name, counts in self.tokens.items()}
+            retries = dict(self.retries)
+            cache = {name: dict(counts) for name, counts in self.cache.items()}
+        stages = {}
+        for (kind, name), histogram in sorted(latency.items()):
+            _, total, count = histogram.snapshot()
+            stages[f"{kind}:{name}"] = {
+                "count": count,
+                "avg_ms": round(total / count * 1000, 1) if count else 0.0,
+                "p95_ms_le": histogram.quantile(0.95) * 1000,
+            }
+        return {"latency": stages, "llm_tokens": tokens, "llm_retries": retries, "cache": cache}
+
+@contextmanager
+def request_trace(request_id: Optional[str] = None):
+    """Collects the spans of everything run inside the block (including executor threads and graph nodes)."""
+    trace = RequestTrace(request_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+def _record(span: Span):
+    trace_stats.observe(span)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(span)
+
+@contextmanager
+def span(kind: str, name: str, **attrs):
+    """Times the block; recorded in the current request trace (if any) and the aggregated stats."""
+    current = Span(kind, name, _current_stage.get(), attrs)
+    try:
+        yield current
+    except Exception as e:
+        current.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        _record(current)
+
+def record_cache(name: str, hit: bool):
+    """A cache lookup whose cost is negligible (in-memory dict)."""
+    _record(Span("cache", name, _current_stage.get(), {"hit": hit}))
+
+def traced(kind: str, name: Optional[str] = None, stage: bool = False):
+    """
+    Decorator version of `span` for sync and async functions.
+    With `stage=True` (graph nodes) the function's spans are attributed to it.
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @contextmanager
+        def scope():
+            token = _current_stage.set(span_name) if stage else None
+            try:
+                with span(kind, span_name):
+                    yield
+            finally:
+                if token is not None:
+                    _current_stage.reset(token)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with scope():
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with scope():
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_usage(current: Span, messages: list, response: Any):
+    """Token counts of an LLM call: provider usage if reported, else a ~4 chars/token estimate."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    if usage.get("input_tokens") is not None:
+        current.set(prompt_tokens=usage["input_tokens"], completion_tokens=usage.get("output_tokens", 0))
+        return
+    prompt_chars = sum(len(m.content) for m in messages if isinstance(getattr(m, "content", None), str))
+    content = getattr(response, "content", "")
+    completion_chars = len(content) if isinstance(content, str) else 0
+    current.set(
+        prompt_tokens=-(-prompt_chars // CHARS_PER_TOKEN),
+        completion_tokens=-(-completion_chars // CHARS_PER_TOKEN),
+        estimated=True
+    )
+
+# Singleton
+trace_stats = TraceStats()
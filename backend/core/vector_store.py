@@ -2,6 +2,7 @@ import chromadb
 from chromadb.config import Settings
 import os
 from utils.timing import measure_time
+from core.tracing import traced
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -43,6 +44,11 @@ class VectorStore:
         )
         print(f"✅ Added {len(documents)} documents to ChromaDB.")
 
+    def delete_documents(self, where: dict):
+        """Deletes all documents whose metadata matches 'where'."""
+        self._get_collection().delete(where=where)
+
+    @traced("retrieval", "vector_query")
     @measure_time
     def query(self, query_text: str, n_results: int = 3, where: dict = None, where_document: dict = None):
         """
@@ -64,6 +70,10 @@ class VectorStore:
             print(f"⚠️ Vector Store Query Error: {e}")
             return None
 
+    def count(self) -> int:
+        """Number of documents in the collection."""
+        return self._get_collection().count()
+
     def get_all_documents(self):
         """
         Retrieves all documents and their IDs.
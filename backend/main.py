@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from pydantic import BaseModel
 import uvicorn
 import os
@@ -22,10 +22,28 @@ from langchain_core.messages import HumanMessage, AIMessage
 # Initialize Limiter
 limiter = Limiter(key_func=get_remote_address)
 
+from contextlib import asynccontextmanager
+from core.sessions import session_manager
+from core.scraper import scrape_client
+from core.deadline import new_deadline
+from core.admission import admission_controller
+from core.tracing import request_trace
+from core.metrics import http_metrics, render_metrics, CONTENT_TYPE
+import time
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background archival of idle sessions
+    session_manager.start_sweeper()
+    yield
+    session_manager.stop_sweeper()
+    await scrape_client.aclose()
+
 app = FastAPI(
     title="Enterprise API Assistant",
     description="Agentic RAG for API Integration",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Apply Rate Limit Exception Handler
@@ -46,20 +64,39 @@ app.include_router(session_router)
 class ChatRequest(BaseModel):
     query: str
     history: List[Dict[str, str]] = []
+    trace: bool = False # Include the per-node trace (timings, tokens, retries, cache hits) in the response
 
 from core.exceptions import AppError, ServiceUnavailableError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from api.streaming import stream_graph_events, SSE_HEADERS
 
 @app.exception_handler(AppError)
 async def app_exception_handler(request, exc: AppError):
     status_code = 500
+    headers = None
     if isinstance(exc, ServiceUnavailableError):
         status_code = 503
+        if "retry_after" in exc.details:
+            headers = {"Retry-After": str(exc.details["retry_after"])}
     return JSONResponse(
         status_code=status_code,
         content={"error": exc.message, "details": exc.details, "type": exc.__class__.__name__},
+        headers=headers,
     )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (e.g. /sessions/{session_id}) so the series stay bounded
+        route = request.scope.get("route")
+        http_metrics.observe(request.method, getattr(route, "path", "unmatched"), status, time.perf_counter() - start)
+
 @app.get("/")
 async def root():
     return {"status": "ok", "service": "Enterprise API Assistant", "version": "1.0.0"}
@@ -75,6 +112,58 @@ async def health_check(request: Request):
     except Exception as e:
         return JSONResponse(status_code=503, content={"status": "degraded", "error": str(e)})
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
+def build_chat_inputs(body: ChatRequest) -> Dict[str, Any]:
+    # Sanitization
+    sanitized_query = sanitize_html(body.query)
+    
+    # Reconstruct Chat History
+    messages = []
+    for msg in body.history:
+        if msg["role"] == "user":
+            messages.append(HumanMessage(content=sanitize_html(msg["content"])))
+        elif msg["role"] == "assistant":
+            messages.append(AIMessage(content=sanitize_html(msg["content"])))
+    
+    # Add current query
+    messages.append(HumanMessage(content=sanitized_query))
+
+    return {
+        "messages": messages,
+        "intent": "general",
+        "context": [],
+        "plan": "",
+        "generated_code": "",
+        "error": "",
+        "deadline": new_deadline(),
+        "cut_stages": None # Reset
+    }
+
+def build_chat_response(result: Dict[str, Any]) -> Dict[str, Any]:
+    # Handle Reponse Logic
+    response_content = result.get("generated_code", "")
+    plan_content = result.get("plan", "")
+    cut_stages = list(dict.fromkeys(result.get("cut_stages") or []))
+    
+    if not response_content and "STATUS: INCOMPLETE" in plan_content:
+         response_content = f"🛑 **Clarification Needed**\n\n{plan_content}"
+    elif not response_content and cut_stages:
+         response_content = f"⏱️ **Out of time** (skipped: {', '.join(cut_stages)})\n\n{plan_content or 'No plan was ready.'}"
+    elif not response_content:
+         response_content = "No code generated. Please check the Plan."
+
+    return {
+        "response": response_content,
+        "plan": plan_content,
+        "intent": result.get("intent", "code"),
+        "cut_stages": cut_stages,
+        "context": result.get("context", [])
+    }
+
 @app.post("/chat")
 @limiter.limit("20/minute") # Initial limit for chat
 async def chat(request: Request, body: ChatRequest): # Note: Body parameter must be explicit if Request is used
@@ -82,50 +171,40 @@ async def chat(request: Request, body: ChatRequest): # Note: Body parameter must
     Invokes the Agentic Mesh (RAG -> Plan -> Code).
     """
     try:
-        # Sanitization
-        sanitized_query = sanitize_html(body.query)
-        
-        # Reconstruct Chat History
-        messages = []
-        for msg in body.history:
-            if msg["role"] == "user":
-                messages.append(HumanMessage(content=sanitize_html(msg["content"])))
-            elif msg["role"] == "assistant":
-                messages.append(AIMessage(content=sanitize_html(msg["content"])))
-        
-        # Add current query
-        messages.append(HumanMessage(content=sanitized_query))
-
-        inputs = {
-            "messages": messages,
-            "intent": "general",
-            "context": [],
-            "plan": "",
-            "generated_code": "",
-            "error": ""
-        }
-        
-        # Invoke LangGraph
-        result = app_graph.invoke(inputs)
+        inputs = build_chat_inputs(body)
         
-        # Handle Reponse Logic
-        response_content = result["generated_code"]
-        plan_content = result["plan"]
+        # Invoke LangGraph (async nodes; blocking work runs on a bounded executor).
+        # Runs are admitted through a global concurrency limit with a bounded queue.
+        with request_trace() as trace:
+            async with admission_controller.slot(inputs["deadline"]):
+                result = await app_graph.ainvoke(inputs)
+        print(f"🧾 Trace {trace.request_id}: {trace.describe()}")
         
-        # ... logic continues ...
-        if not response_content and "STATUS: INCOMPLETE" in plan_content:
-             response_content = f"🛑 **Clarification Needed**\n\n{plan_content}"
-        elif not response_content:
-             response_content = "No code generated. Please check the Plan."
-
-        return {
-            "response": response_content,
-            "plan": plan_content,
-            "context": result["context"]
-        }
+        response = build_chat_response(result)
+        if body.trace:
+            response["trace"] = trace.to_dict()
+        return response
+    except AppError:
+        raise # 503 + Retry-After when overloaded (see app_exception_handler)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat/stream")
+@limiter.limit("20/minute")
+async def chat_stream(request: Request, body: ChatRequest):
+    """
+    Same as /chat, streamed as Server-Sent Events (node progress, plan/code tokens,
+    then the final `result` event with the /chat payload).
+    """
+    # Reject before the stream starts; the run itself waits for its slot inside the stream
+    admission_controller.check()
+    inputs = build_chat_inputs(body)
+    return StreamingResponse(
+        stream_graph_events(app_graph, inputs, build_chat_response, include_trace=body.trace),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
 class PostmanRequest(BaseModel):
     plan: str
     code: str
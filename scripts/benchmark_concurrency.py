@@ -0,0 +1,101 @@
+import sys
+import os
+import time
+import asyncio
+from unittest.mock import patch
+
+# Shim to run from root (backend modules use top-level imports)
+sys.path.append(os.path.join(os.getcwd(), "backend"))
+
+from dotenv import load_dotenv
+load_dotenv()
+# LLMs are replaced below, a real key is not needed
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+from langchain_core.messages import HumanMessage, AIMessage
+
+import agent.nodes as nodes
+from agent.graph import app_graph
+
+LLM_LATENCY = 0.3     # Simulated provider latency per LLM call (seconds)
+SEARCH_LATENCY = 0.1  # Simulated Chroma/BM25 time (blocking)
+CONCURRENCY = 8
+
+class FakeLLM:
+    """Answers like a slow LLM provider; `invoke` blocks, `ainvoke` awaits."""
+    def __init__(self, content):
+        self.content = content
+
+    def with_config(self, **kwargs):
+        return self
+
+    def invoke(self, messages):
+        time.sleep(LLM_LATENCY)
+        return AIMessage(content=self.content)
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(LLM_LATENCY)
+        return AIMessage(content=self.content)
+
+class FakeRetriever:
+    def search(self, query, n_results=3, **kwargs):
+        time.sleep(SEARCH_LATENCY)
+        return {"documents": [["GET /pets lists pets."]], "ids": [["1"]]}
+
+def make_inputs():
+    return {
+        "messages": [HumanMessage(content="Write python code to list pets")],
+        "intent": "general", "context": [], "plan": "", "generated_code": "", "error": ""
+    }
+
+async def measure(mode: str):
+    """
+    Runs CONCURRENCY chats on one event loop, the way FastAPI does.
+    'blocking' reproduces the old handler (app_graph.invoke inside async def),
+    'async' the new one (await app_graph.ainvoke).
+    Also records the worst event-loop stall, which is what /health would wait for.
+    """
+    max_lag = 0.0
+    done = False
+
+    async def heartbeat():
+        nonlocal max_lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            max_lag = max(max_lag, time.perf_counter() - start - 0.01)
+
+    async def one_chat():
+        if mode == "blocking":
+            app_graph.invoke(make_inputs())
+        else:
+            await app_graph.ainvoke(make_inputs())
+
+    monitor = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0) # let the monitor start
+    start = time.perf_counter()
+    await asyncio.gather(*(one_chat() for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - start
+    done = True
+    await monitor
+    return elapsed, max_lag
+
+def benchmark():
+    print(f"🚀 Benchmark: {CONCURRENCY} concurrent chats (LLM {LLM_LATENCY}s/call, search {SEARCH_LATENCY}s)")
+    with patch.object(nodes, "reasoning_llm", FakeLLM("STATUS: READY\nPLAN: list pets")), \
+         patch.object(nodes, "coding_llm", FakeLLM("PASS")), \
+         patch.object(nodes, "chat_llm", FakeLLM("summary")), \
+         patch.object(nodes, "search_query_llm", FakeLLM("list pets")), \
+         patch.object(nodes, "summary_llm", FakeLLM("summary")), \
+         patch.object(nodes, "review_llm", FakeLLM("PASS")), \
+         patch.object(nodes, "hybrid_retriever", FakeRetriever()):
+        results = {mode: asyncio.run(measure(mode)) for mode in ("blocking", "async")}
+
+    for mode, (elapsed, max_lag) in results.items():
+        print(f"   {mode:>8}: {elapsed:.2f}s total, {CONCURRENCY / elapsed:.2f} chats/s, worst loop stall {max_lag * 1000:.0f}ms")
+
+    speedup = results["blocking"][0] / results["async"][0]
+    print(f"\n📊 Throughput speedup: {speedup:.1f}x")
+
+if __name__ == "__main__":
+    benchmark()
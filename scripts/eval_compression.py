@@ -0,0 +1,44 @@
+import sys
+import os
+import json
+
+# Shim to run from root (backend modules use top-level imports)
+sys.path.append(os.path.join(os.getcwd(), "backend"))
+
+from core.parsers.openapi import OpenAPIParser
+from core.compression import compressor
+from core.context_packer import estimate_tokens
+
+# Fixed eval set: (query, facts the compressed context must still contain)
+EVAL_SET = [
+    ("List available pets, filtered by status", ["GET /pets", "status"]),
+    ("Create a new pet", ["POST /pets"]),
+    ("Delete a pet by id", ["DELETE /pets/{petId}", "petId"]),
+    ("How do I log a user in?", ["POST /users/login"]),
+    ("What is the base URL and how do I authenticate?", ["Base URLs", "Authentication Schemes"]),
+]
+
+def evaluate():
+    spec_path = os.path.join("tests", "data", "petstore.json")
+    with open(spec_path) as f:
+        chunks = OpenAPIParser().parse(json.load(f))
+
+    print(f"🧪 Compression eval: {len(EVAL_SET)} queries over {len(chunks)} chunks ({spec_path})")
+    total_before = total_after = facts_total = facts_kept = 0
+    for query, facts in EVAL_SET:
+        compressed = compressor.compress(query, chunks)
+        before = sum(estimate_tokens(c) for c in chunks)
+        after = sum(estimate_tokens(c) for c in compressed if c)
+        text = "\n".join(compressed)
+        kept = sum(fact in text for fact in facts)
+
+        total_before += before
+        total_after += after
+        facts_total += len(facts)
+        facts_kept += kept
+        print(f"   {query[:45]:<45} {before:>5} -> {after:>5} tokens, facts {kept}/{len(facts)}")
+
+    print(f"\n📊 Prompt tokens: -{(1 - total_after / total_before) * 100:.0f}% | Fact recall: {facts_kept}/{facts_total}")
+
+if __name__ == "__main__":
+    evaluate()
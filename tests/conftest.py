@@ -18,3 +18,34 @@ sys.path.append(root_path)
 @pytest.fixture(scope="session", autouse=True)
 def setup_path():
     pass
+
+@pytest.fixture(autouse=True)
+def isolated_page_cache(tmp_path, monkeypatch):
+    """Scraped pages must not leak between tests through the persistent scrape cache."""
+    from core.scraper import page_cache
+    monkeypatch.setattr(page_cache, "path", str(tmp_path / "scrape_cache.db"))
+    page_cache._init_db()
+
+@pytest.fixture(autouse=True)
+def isolated_checkpoints(tmp_path, monkeypatch):
+    """Session graph state must not leak between tests through the checkpoint database."""
+    from core.checkpointer import session_checkpointer
+    monkeypatch.setattr(session_checkpointer, "path", str(tmp_path / "checkpoints.db"))
+    session_checkpointer._init_db()
+
+@pytest.fixture(autouse=True)
+def isolated_llm_cache(tmp_path, monkeypatch):
+    """Cached LLM responses must not leak between tests (or into the real cache)."""
+    from core.llm_cache import llm_cache
+    monkeypatch.setattr(llm_cache, "path", str(tmp_path / "llm_cache.db"))
+    llm_cache._init_db()
+
+@pytest.fixture(autouse=True)
+def clear_search_caches():
+    """Mocked web search results must not be served to later tests."""
+    from core.cache import web_search_cache, search_query_cache
+    from core.semantic_cache import semantic_llm_cache
+    web_search_cache.clear()
+    search_query_cache.clear()
+    semantic_llm_cache.clear()
+    yield
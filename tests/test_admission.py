@@ -0,0 +1,91 @@
+import time
+import asyncio
+import pytest
+from unittest.mock import patch
+from core.admission import AdmissionController
+from core.exceptions import OverloadedError
+
+def test_limits_concurrency_in_fifo_order():
+    controller = AdmissionController(max_concurrent=2, max_queued=10, max_wait=100)
+    state = {"active": 0, "peak": 0}
+    admitted = []
+
+    async def run(i):
+        async with controller.slot():
+            admitted.append(i)
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(0.05)
+            state["active"] -= 1
+
+    async def main():
+        tasks = []
+        for i in range(6):
+            tasks.append(asyncio.create_task(run(i)))
+            await asyncio.sleep(0) # Arrive in order
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+
+    assert state["peak"] == 2
+    assert admitted == list(range(6))
+    stats = controller.stats()
+    assert stats["running"] == 0 and stats["queued"] == 0
+    assert stats["admitted"] == 6 and stats["rejected"] == 0
+    assert stats["wait_seconds"]["max"] > 0
+
+def test_rejects_when_queue_full_or_wait_too_long():
+    async def main():
+        controller = AdmissionController(max_concurrent=1, max_queued=1, max_wait=100)
+        await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        assert controller.stats()["queued"] == 1
+
+        with pytest.raises(OverloadedError) as exc:
+            controller.check()
+        assert exc.value.details["retry_after"] >= 1
+
+        controller.release(1.0)
+        await waiter
+        controller.release(1.0)
+        assert controller.stats()["rejected"] == 1
+
+        # Estimated wait (one run ahead at 60s each) exceeds the 30s threshold
+        slow = AdmissionController(max_concurrent=1, max_queued=10, max_wait=30)
+        slow.avg_run_seconds = 60
+        await slow.acquire()
+        with pytest.raises(OverloadedError) as exc:
+            await slow.acquire()
+        assert exc.value.details["retry_after"] == 60
+
+    asyncio.run(main())
+
+def test_deadline_while_queued_frees_the_queue():
+    async def main():
+        controller = AdmissionController(max_concurrent=1, max_queued=5, max_wait=100)
+        await controller.acquire()
+        with pytest.raises(OverloadedError):
+            await controller.acquire(deadline=time.time() + 0.05)
+        assert controller.stats()["queued"] == 0
+        controller.release()
+        assert controller.stats()["running"] == 0
+
+    asyncio.run(main())
+
+def test_chat_returns_503_with_retry_after():
+    from fastapi.testclient import TestClient
+    from main import app
+
+    busy = AdmissionController(max_concurrent=1, max_queued=0, max_wait=100)
+    busy._running = 1
+    with patch("main.admission_controller", busy), patch("main.app_graph") as mock_graph:
+        client = TestClient(app)
+        response = client.post("/chat", json={"query": "List pets"})
+        stream_response = client.post("/chat/stream", json={"query": "List pets"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "15"
+    assert response.json()["type"] == "OverloadedError"
+    assert stream_response.status_code == 503
+    mock_graph.ainvoke.assert_not_called()
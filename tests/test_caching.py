@@ -67,3 +67,89 @@ def test_semantic_cache_miss(mock_vector_store):
     
     hit = manager.get(q2)
     assert hit is None
+
+def test_coalescing_cache_shares_concurrent_calls():
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from core.cache import CoalescingTTLCache
+
+    cache = CoalescingTTLCache(maxsize=10, ttl=60)
+    calls = []
+    started = threading.Event()
+
+    def slow_search():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        first = pool.submit(cache.get_or_compute, "q", slow_search)
+        started.wait()
+        others = [pool.submit(cache.get_or_compute, "q", slow_search) for _ in range(4)]
+        results = [first.result()] + [f.result() for f in others]
+
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert cache.coalesced == 4
+    # Served from cache afterwards
+    assert cache.get_or_compute("q", slow_search) == "result"
+    assert len(calls) == 1 and cache.hits == 1
+
+def test_coalescing_cache_shares_concurrent_async_calls():
+    import asyncio
+    from core.cache import CoalescingTTLCache
+
+    cache = CoalescingTTLCache(maxsize=10, ttl=60)
+    calls = []
+
+    async def slow_rewrite():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "rewritten"
+
+    async def main():
+        return await asyncio.gather(*(cache.aget_or_compute("q", slow_rewrite) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["rewritten"] * 5
+    assert len(calls) == 1 and cache.coalesced == 4
+    assert asyncio.run(cache.aget_or_compute("q", slow_rewrite)) == "rewritten"
+    assert len(calls) == 1 and cache.hits == 1
+
+def test_coalescing_cache_does_not_cache_failures():
+    from core.cache import CoalescingTTLCache
+
+    cache = CoalescingTTLCache(maxsize=10, ttl=60)
+
+    def failing():
+        raise RuntimeError("rate limited")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("q", failing)
+    assert cache.get_or_compute("q", lambda: "ok") == "ok"
+
+def test_normalize_query():
+    from core.cache import normalize_query
+    assert normalize_query("  Stripe   API\nPagination ") == "stripe api pagination"
+
+@patch("agent.nodes.invoke_llm_safe")
+@patch("agent.nodes.hybrid_retriever")
+@patch("agent.nodes.web_search")
+def test_general_web_fallback_is_cached(mock_web_search, mock_hybrid, mock_llm):
+    """
+    A repeated question reuses both the rewritten query and the search result.
+    """
+    from agent.nodes import retrieve_node
+    from langchain_core.messages import HumanMessage, AIMessage
+
+    mock_hybrid.search.return_value = {'documents': [], 'ids': []}
+    mock_llm.return_value = AIMessage(content="stripe pagination api")
+    mock_web_search.invoke.return_value = "Use starting_after."
+
+    first = retrieve_node({"messages": [HumanMessage(content="How does Stripe paginate?")], "context": []})
+    second = retrieve_node({"messages": [HumanMessage(content="how does stripe  paginate?")], "context": []})
+
+    assert first["context"] == second["context"]
+    assert mock_llm.call_count == 1
+    mock_web_search.invoke.assert_called_once_with("stripe pagination api")
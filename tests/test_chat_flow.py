@@ -1,11 +1,11 @@
 
 from fastapi.testclient import TestClient
 from main import app
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
 client = TestClient(app)
 
-@patch("main.app_graph.invoke")
+@patch("main.app_graph.ainvoke", new_callable=AsyncMock)
 def test_chat_success_code(mock_invoke):
     # Simulate succesful code generation
     mock_result = {
@@ -23,7 +23,7 @@ def test_chat_success_code(mock_invoke):
     assert data["response"] == "print('Hello World')"
     assert data["plan"] == mock_result["plan"]
 
-@patch("main.app_graph.invoke")
+@patch("main.app_graph.ainvoke", new_callable=AsyncMock)
 def test_chat_needs_clarification(mock_invoke):
     # Simulate INCOMPLETE plan
     mock_result = {
@@ -42,3 +42,52 @@ def test_chat_needs_clarification(mock_invoke):
     # Logic in main.py: if INCOMPLETE and no code, response = plan/question
     assert "Clarification Needed" in data["response"]
     assert "Which language?" in data["response"]
+
+def fake_astream(chunks):
+    async def astream(inputs, config=None, stream_mode=None):
+        for chunk in chunks:
+            yield chunk
+    return astream
+
+def parse_sse(text):
+    import json
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+@patch("main.app_graph")
+def test_chat_stream_events(mock_graph):
+    final_state = {
+        "generated_code": "print('Hello World')",
+        "plan": "STATUS: READY\nPlan: Write code.",
+        "context": ["Context 1"]
+    }
+    mock_graph.astream = fake_astream([
+        ("updates", {"retrieve": {"context": ["Context 1"]}}),
+        ("updates", {"plan": {"plan": final_state["plan"]}}),
+        ("updates", {"validate": {"feedback": "PASS", "attempt_count": 1}}),
+        ("values", final_state),
+    ])
+    
+    response = client.post("/chat/stream", json={"query": "Write python hello world", "history": []})
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert [e for e, _ in events] == ["node", "node", "node", "result"]
+    assert events[0][1] == {"node": "retrieve", "documents": 1}
+    assert events[2][1]["passed"] is True
+    # Final event carries the same payload as /chat
+    assert events[-1][1]["response"] == "print('Hello World')"
+
+@patch("main.app_graph")
+def test_chat_stream_error_event(mock_graph):
+    async def failing_astream(inputs, config=None, stream_mode=None):
+        raise Exception("LLM down")
+        yield
+    mock_graph.astream = failing_astream
+    response = client.post("/chat/stream", json={"query": "hi", "history": []})
+    events = parse_sse(response.text)
+    assert events == [("error", {"detail": "LLM down"})]
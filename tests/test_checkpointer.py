@@ -0,0 +1,120 @@
+import re
+import zlib
+import numpy as np
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage, HumanMessage
+from main import app
+from core.sessions import session_manager
+from core.checkpointer import session_checkpointer, thread_config
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True)
+def isolated_sessions(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_manager, "persistence_file", str(tmp_path / "sessions.db"))
+    session_manager._init_db()
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    def with_config(self, **kwargs):
+        return self
+
+    async def ainvoke(self, messages):
+        self.prompts.append(messages[0].content)
+        return AIMessage(content=f"Answer {len(self.prompts)}")
+
+def fake_embedding(texts):
+    vectors = np.zeros((len(texts), 512))
+    for i, text in enumerate(texts):
+        for word in re.findall(r"[a-z]+", text.lower()):
+            vectors[i, zlib.crc32(word.encode()) % 512] += 1
+    return vectors
+
+def checkpointed_state(session_id: str) -> dict:
+    from agent.graph import session_graph
+    return session_graph.get_state(thread_config(session_id)).values
+
+@patch("core.followup.vector_store")
+@patch("agent.nodes.hybrid_retriever")
+@patch("agent.nodes.intent_router")
+def test_session_turns_resume_the_checkpoint(mock_router, mock_hybrid, mock_store):
+    mock_router.classify.return_value = ("lookup", 0.2)
+    mock_store.embedding_fn.side_effect = fake_embedding
+    llm = FakeLLM()
+    s = session_manager.create_session("resumer")
+
+    with patch("agent.nodes.chat_llm", llm), patch("agent.nodes.reasoning_llm", llm), patch("agent.nodes.coding_llm", llm):
+        mock_hybrid.search.return_value = {"documents": [["Auth: bearer tokens"]], "ids": [["1"]]}
+        assert client.post(f"/sessions/{s.id}/chat", json={"query": "What auth does it use?"}).json()["response"] == "Answer 1"
+
+        mock_hybrid.search.return_value = {"documents": [["Rate limit: 100/min"]], "ids": [["2"]]}
+        assert client.post(f"/sessions/{s.id}/chat", json={"query": "Does the same auth use a rate limit?"}).json()["response"] == "Answer 2"
+
+    state = checkpointed_state(s.id)
+    # The whole conversation is in the state, although turn 2 only sent the new messages
+    assert [m.content for m in state["messages"]] == ["What auth does it use?", "Answer 1", "Does the same auth use a rate limit?"]
+    # The follow-up kept the documents retrieved in the first turn
+    assert state["context"] == ["Auth: bearer tokens", "Rate limit: 100/min"]
+    assert "Auth: bearer tokens" in llm.prompts[1]
+    assert [m["content"] for m in session_manager.get_history(s.id)][-1] == "Answer 2"
+
+def test_only_unseen_messages_are_sent():
+    from agent.graph import session_graph
+    from api.sessions import prepare_session_chat
+
+    s = session_manager.create_session("incremental")
+    first = prepare_session_chat(s.id, "Hello")
+    assert [m.content for m in first["messages"]] == ["Hello"]
+
+    session_graph.update_state(thread_config(s.id), {"messages": first["messages"]}, as_node="classify")
+    session_manager.add_message(s.id, "user", "Hello")
+    session_manager.add_message(s.id, "assistant", "Hi there")
+
+    second = prepare_session_chat(s.id, "Write code")
+    assert [type(m) for m in second["messages"]] == [AIMessage, HumanMessage]
+    assert [m.content for m in second["messages"]] == ["Hi there", "Write code"]
+    assert "context" not in second and second["attempt_count"] == 0
+
+def test_cleared_session_starts_over():
+    from agent.graph import session_graph
+    from api.sessions import prepare_session_chat
+
+    s = session_manager.create_session("clearer")
+    session_manager.add_message(s.id, "user", "Old question")
+    session_graph.update_state(thread_config(s.id), {"messages": [HumanMessage(content="Old question")]}, as_node="classify")
+
+    session_manager.clear_session(s.id)
+
+    assert checkpointed_state(s.id) == {}
+    assert [m.content for m in prepare_session_chat(s.id, "New question")["messages"]] == ["New question"]
+
+def test_only_the_latest_checkpoint_is_kept():
+    from agent.graph import session_graph
+
+    config = thread_config("pruned")
+    for i in range(3):
+        session_graph.update_state(config, {"messages": [HumanMessage(content=f"msg {i}")]}, as_node="classify")
+
+    with session_checkpointer.cursor(transaction=False) as cur:
+        count = cur.execute("SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", ("pruned",)).fetchone()[0]
+    assert count == 1
+    assert len(checkpointed_state("pruned")["messages"]) == 3
+
+def test_archived_session_is_rebuilt_from_history():
+    from agent.graph import session_graph
+    from api.sessions import prepare_session_chat
+
+    s = session_manager.create_session("sleeper")
+    session_manager.add_message(s.id, "user", "First")
+    session_manager.add_message(s.id, "assistant", "Reply")
+    session_graph.update_state(thread_config(s.id), {"messages": [HumanMessage(content="First")]}, as_node="classify")
+
+    assert session_manager.archive_expired(ttl_seconds=1, now=10**12) == 1
+    assert checkpointed_state(s.id) == {}
+
+    inputs = prepare_session_chat(s.id, "Back again")
+    assert [m.content for m in inputs["messages"]] == ["First", "Reply", "Back again"]
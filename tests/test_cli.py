@@ -37,3 +37,11 @@ def test_reset_command(mock_store):
 
 # Parse Test requires a real file or complex mocking
 # We skip for now or verify functionality manually via script
+
+@patch("backend.cli.session_manager")
+def test_session_gc_command(mock_sessions):
+    mock_sessions.archive_expired.return_value = 2
+    result = runner.invoke(app, ["session", "gc", "--ttl-hours", "24"])
+    assert result.exit_code == 0
+    assert "Archived 2 sessions" in result.stdout
+    mock_sessions.archive_expired.assert_called_once_with(ttl_seconds=24 * 3600)
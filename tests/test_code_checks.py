@@ -0,0 +1,125 @@
+from unittest.mock import patch
+from core.code_checks import CodeChecker, ValidationStats, extract_code_blocks, llm_review_required
+
+checker = CodeChecker()
+
+CLEAN = '''```python
+import os
+import requests
+
+def list_pets(limit: int = 20):
+    response = requests.get("https://api.example.com/pets", params={"limit": limit},
+                            headers={"Authorization": f"Bearer {os.getenv('PETS_API_KEY')}"})
+    response.raise_for_status()
+    return [pet["name"] for pet in response.json()]
+```'''
+
+def test_clean_python_passes_without_llm():
+    report = checker.check(CLEAN)
+    assert report.passed
+    assert report.python_blocks == 1
+    assert not llm_review_required(report, policy="auto")
+    assert llm_review_required(report, policy="always")
+
+def test_syntax_error():
+    report = checker.check("```python\ndef broken(:\n    pass\n```")
+    assert not report.passed
+    assert "Syntax error in block 1 (python), line 1" in report.issues[0]
+
+def test_missing_import():
+    report = checker.check("```python\ndef now():\n    return json.dumps({'t': time.time()})\n```")
+    assert any("`json` is used but never imported" in i for i in report.issues)
+    assert any("`time` is used but never imported" in i for i in report.issues)
+
+def test_names_bound_in_earlier_blocks_are_not_missing_imports():
+    response = (
+        "```python\nimport requests\n\ntoken = input('Token: ')\n\n"
+        "def get_user(token):\n    return requests.get('https://api.example.com/me', headers={'Authorization': token}).json()\n```\n"
+        "Usage:\n```python\nprint(get_user(token))\n```"
+    )
+    report = checker.check(response)
+    assert report.passed and not report.warnings
+
+    # A bare stdlib name that is never bound is only suspicious; module use is a defect
+    report = checker.check("```python\nprint(queue)\n```")
+    assert report.passed and report.warnings
+
+def test_hardcoded_secrets():
+    code = '```python\nimport requests\nAPI_KEY = "q8Zx3LmP0vR7tYk2Wn5B"\nGROQ = "gsk_abcdefghijklmnopqrstuvwx"\n```'
+    report = checker.check(code)
+    assert any("line 2" in i for i in report.issues)
+    assert any("Groq API key" in i for i in report.issues)
+
+def test_placeholders_are_not_secrets():
+    code = '```python\nAPI_KEY = "your-api-key-here"\nTOKEN = "aaaaaaaaaaaaaaaa"\n```'
+    assert checker.check(code).passed
+
+def test_word_like_identifiers_are_not_secrets():
+    code = '```python\nauth_scheme = "BearerTokenAuthenticationV2x"\nTOKEN_TYPE = "refresh_token_rotation"\n```'
+    assert checker.check(code).passed
+
+def test_urls_and_endpoints_are_not_secrets():
+    code = (
+        '```python\nTOKEN_URL = "https://login.microsoftonline.com/common/oauth2/v2.0/token"\n'
+        'AUTH_ENDPOINT = "/oauth2/v2.0/authorize?prompt=consent"\nAUTH_HEADER = "X-Custom-Auth-Signature-V2"\n```'
+    )
+    assert checker.check(code).passed
+
+def test_infinite_loop():
+    looping = "```python\nimport time\nwhile True:\n    time.sleep(1)\n```"
+    polling = "```python\nimport time\nwhile True:\n    if time.time() > 0:\n        break\n```"
+    nested = "```python\nwhile True:\n    for i in range(3):\n        break\n```"
+    report = checker.check(looping)
+    assert report.passed and any("infinite loop" in w for w in report.warnings)
+    assert llm_review_required(report, policy="auto")
+    assert not checker.check(polling).warnings
+    assert checker.check(nested).warnings
+
+def test_generators_and_consumers_are_not_infinite_loops():
+    generator = "```python\ndef pages(client):\n    page = 1\n    while True:\n        yield client.get(page)\n        page += 1\n```"
+    consumer = "```python\nasync def consume(queue):\n    while True:\n        handle(await queue.get())\n```"
+    js = "```javascript\nasync function poll() {\n  while (true) {\n    await sleep(1000);\n  }\n}\n```"
+    assert not checker.check(generator).warnings
+    assert not checker.check(consumer).warnings
+    report = checker.check(js)
+    assert report.passed and not report.warnings
+
+def test_other_languages_need_llm_review():
+    report = checker.check("```csharp\nvar client = new HttpClient();\n```")
+    assert report.passed and report.other_blocks == 1
+    assert llm_review_required(report, policy="auto")
+    assert not llm_review_required(report, policy="never")
+
+def test_unknown_package_is_a_warning():
+    report = checker.check("```python\nimport acme_sdk\nacme_sdk.connect()\n```")
+    assert report.passed
+    assert report.warnings and llm_review_required(report, policy="auto")
+
+def test_unfenced_output_is_one_block():
+    assert extract_code_blocks("print('hi')") == [("", "print('hi')")]
+
+def test_validation_stats():
+    stats = ValidationStats()
+    for outcome in ["local_rejected", "local_passed", "llm_reviewed", "local_passed"]:
+        stats.record(outcome)
+    assert stats.avoided_ratio == 0.75
+    assert stats.summary() == "LLM validation avoided: 75% (3/4)"
+
+@patch("agent.nodes.invoke_llm_safe")
+def test_validate_node_skips_llm_for_clean_code(mock_llm):
+    from agent.nodes import validate_node
+
+    result = validate_node({"generated_code": CLEAN, "attempt_count": 0})
+
+    assert result == {"feedback": "PASS", "attempt_count": 1}
+    mock_llm.assert_not_called()
+
+@patch("agent.nodes.invoke_llm_safe")
+def test_validate_node_rejects_locally(mock_llm):
+    from agent.nodes import validate_node
+
+    result = validate_node({"generated_code": "```python\nprint(requests.get('x'))\n```", "attempt_count": 1})
+
+    assert "Missing import" in result["feedback"]
+    assert result["attempt_count"] == 2
+    mock_llm.assert_not_called()
@@ -0,0 +1,85 @@
+import re
+import zlib
+import numpy as np
+from unittest.mock import patch
+from core.compression import ContextCompressor
+
+def fake_embedding(texts):
+    """Bag-of-words vectors: texts sharing words are similar."""
+    vectors = np.zeros((len(texts), 256))
+    for i, text in enumerate(texts):
+        for word in re.findall(r"[a-z]+", text.lower()):
+            if len(word) > 3:
+                vectors[i, zlib.crc32(word.encode()) % 256] += 1
+    return vectors
+
+OFF_TOPIC = [
+    "Our company was founded many years ago in a small garage.",
+    "Subscribe to the newsletter for product announcements.",
+    "Cookies help us deliver a better browsing experience.",
+    "Follow us on social media for community highlights.",
+    "Careers are available across engineering and marketing teams.",
+    "The conference keynote covered platform roadmap items.",
+]
+ON_TOPIC = [
+    "Webhook signatures are verified with the signing secret.",
+    "Each webhook delivery includes a signature header.",
+]
+
+@patch("core.compression.vector_store")
+def test_keeps_query_relevant_sentences(mock_store):
+    mock_store.embedding_fn.side_effect = fake_embedding
+    page = "Source URL: https://docs.example.com/webhooks\nContent:\n" + " ".join(OFF_TOPIC[:3] + ON_TOPIC + OFF_TOPIC[3:])
+
+    [compressed] = ContextCompressor(keep_ratio=0.25).compress("How do I verify a webhook signature?", [page])
+
+    assert compressed.startswith("Source URL: https://docs.example.com/webhooks")
+    for sentence in ON_TOPIC:
+        assert sentence in compressed
+    assert sum(sentence in compressed for sentence in OFF_TOPIC) <= 1
+    assert len(compressed) < len(page) * 0.6
+    # One batched embedding call for the query and all units
+    assert mock_store.embedding_fn.call_count == 1
+
+@patch("core.compression.vector_store")
+def test_repeated_boilerplate_is_kept_once(mock_store):
+    mock_store.embedding_fn.side_effect = fake_embedding
+    global_context = "Base URLs: ['https://api.example.com/v1']\nAuthentication Schemes: {'bearer': {'type': 'http'}}"
+    chunks = [
+        f"API: Pets\nEndpoint: GET /pets\nSummary: List pets\n{global_context}",
+        f"API: Pets\nEndpoint: POST /pets\nSummary: Create a pet\n{global_context}",
+    ]
+
+    first, second = ContextCompressor().compress("create a pet", chunks)
+
+    assert "Base URLs" in first and "Base URLs" not in second
+    assert second == "API: Pets\nEndpoint: POST /pets\nSummary: Create a pet"
+    # Short documents are not sent to the embedding model
+    mock_store.embedding_fn.assert_not_called()
+
+@patch("core.compression.vector_store")
+def test_embedding_failure_leaves_documents_intact(mock_store):
+    mock_store.embedding_fn.side_effect = RuntimeError("model unavailable")
+    page = "Content:\n" + " ".join(OFF_TOPIC * 3)
+
+    assert ContextCompressor().compress("webhooks", [page]) == [page]
+
+@patch("core.compression.vector_store")
+def test_compress_node_carries_scores(mock_store):
+    from langchain_core.messages import HumanMessage
+    from agent.nodes import compress_node
+    from core.context_packer import content_hash
+
+    mock_store.embedding_fn.side_effect = fake_embedding
+    page = "Source URL: https://docs.example.com/webhooks\nContent:\n" + " ".join(OFF_TOPIC + ON_TOPIC)
+    state = {
+        "messages": [HumanMessage(content="verify webhook signature")],
+        "context": [page],
+        "context_scores": {content_hash(page): 1.0},
+    }
+
+    result = compress_node(state)
+
+    [compressed] = result["context"]
+    assert len(compressed) < len(page)
+    assert result["context_scores"] == {content_hash(compressed): 1.0}
@@ -0,0 +1,63 @@
+from unittest.mock import MagicMock
+from core.context_packer import ContextPacker, content_hash, dedupe_snippets, budget_for, estimate_tokens, CONTEXT_TOKEN_BUDGET
+
+def test_dedupe_by_content_hash():
+    snippets = ["GET /pets lists pets.", "GET  /pets lists\npets.", "POST /pets creates a pet."]
+    assert dedupe_snippets(snippets) == ["GET /pets lists pets.", "POST /pets creates a pet."]
+
+def test_pack_ranks_by_score_and_reports_dropped_tokens():
+    low = "low " * 200    # 200 tokens
+    high = "high " * 200  # 250 tokens
+    mid = "mid " * 200    # 200 tokens
+    scores = {content_hash(high): 1.0, content_hash(mid): 0.5}
+
+    packed = ContextPacker().pack([low, high, mid, high], budget_tokens=460, scores=scores)
+
+    assert packed.snippets == [high, mid]
+    assert packed.dropped_snippets == 1
+    assert packed.dropped_tokens == estimate_tokens(low)
+    assert packed.used_tokens <= 460
+
+def test_pack_truncates_snippet_that_partially_fits():
+    page = "x" * 4000 # 1000 tokens
+    packed = ContextPacker().pack([page], budget_tokens=600)
+
+    assert packed.text == "x" * 2400
+    assert packed.used_tokens == 600
+    assert packed.dropped_tokens == 400
+    assert packed.dropped_snippets == 0
+
+def test_pack_within_budget_keeps_everything():
+    packed = ContextPacker().pack(["a", "b"], budget_tokens=100)
+    assert packed.text == "a\n\nb"
+    assert packed.dropped_tokens == 0
+
+def test_budget_for_model():
+    groq = MagicMock(spec=["model_name"], model_name="unknown-model")
+    assert budget_for(groq) == CONTEXT_TOKEN_BUDGET
+    ollama = MagicMock(spec=["model"], model="llama3.2:3b")
+    assert budget_for(ollama) <= 3000
+
+def test_retrieve_scores_feed_the_packer():
+    """
+    retrieve_node records a score per snippet; linked pages outrank local hits.
+    """
+    from unittest.mock import patch
+    from langchain_core.messages import HumanMessage
+    from agent.nodes import retrieve_node, URL_DOC_SCORE
+
+    page = "<html><body>" + "Linked page content. " * 100 + "</body></html>"
+    resp = MagicMock(status_code=200, headers={})
+    resp.iter_content.return_value = [page.encode()]
+
+    with patch("agent.nodes.requests.get", return_value=resp), patch("agent.nodes.hybrid_retriever") as mock_hybrid:
+        mock_hybrid.search.return_value = {"documents": [["Local Doc"]], "ids": [["1"]], "scores": [[0.03]]}
+        result = retrieve_node({"messages": [HumanMessage(content="See https://example.com/docs")], "context": ["Local Doc"]})
+
+    assert result["context"][0] == "Local Doc" and len(result["context"]) == 2
+    scores = result["context_scores"]
+    assert scores[content_hash("Local Doc")] == 0.03
+    assert scores[content_hash(result["context"][1])] == URL_DOC_SCORE
+
+    packed = ContextPacker().pack(result["context"], budget_tokens=10000, scores=scores)
+    assert packed.snippets[0].startswith("Source URL: https://example.com/docs")
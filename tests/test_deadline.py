@@ -0,0 +1,133 @@
+import time
+import asyncio
+import pytest
+from unittest.mock import patch
+from langchain_core.messages import HumanMessage, AIMessage
+from core.resilience import with_resilience, global_circuit_breaker
+from core.exceptions import DeadlineExceededError
+from core.deadline import new_deadline, bounded
+
+@pytest.fixture(autouse=True)
+def closed_circuit():
+    global_circuit_breaker.failures = 0
+    global_circuit_breaker.state = "CLOSED"
+
+def test_retries_stop_at_deadline():
+    calls = []
+
+    @with_resilience(max_retries=3)
+    def flaky():
+        calls.append(1)
+        raise ValueError("LLM Failure")
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError) as e:
+        # The first backoff (2s) would already run past the deadline
+        flaky(deadline=time.time() + 1)
+    assert isinstance(e.value.__cause__, ValueError)
+    assert len(calls) == 1
+    assert time.monotonic() - start < 1
+
+    with pytest.raises(DeadlineExceededError):
+        flaky(deadline=time.time() - 1)
+    assert len(calls) == 1
+
+def test_async_call_cancelled_at_deadline():
+    @with_resilience(max_retries=3)
+    async def slow():
+        await asyncio.sleep(5)
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(slow(deadline=time.time() + 0.2))
+    assert time.monotonic() - start < 1
+    # Our own budget is not a provider failure
+    assert global_circuit_breaker.failures == 0
+
+def test_retries_exhausted_without_deadline_raise_the_last_error():
+    @with_resilience(max_retries=2)
+    def flaky():
+        raise ValueError("LLM Failure")
+
+    with patch("time.sleep"):
+        with pytest.raises(ValueError):
+            flaky(deadline=time.time() + 300)
+
+def test_failing_llm_past_deadline_cuts_the_stage():
+    from agent.nodes import aplan_node
+
+    class FailingLLM:
+        model_name = "failing"
+        calls = 0
+
+        def with_config(self, **kwargs):
+            return self
+
+        async def ainvoke(self, messages):
+            FailingLLM.calls += 1
+            raise ValueError("LLM Failure")
+
+    state = {"messages": [HumanMessage(content="Write code")], "context": [], "deadline": time.time() + 1}
+    with patch("agent.nodes.reasoning_llm", FailingLLM()):
+        result = asyncio.run(aplan_node(state))
+    assert FailingLLM.calls == 1
+    assert result["plan"] == ""
+    assert result["cut_stages"] == ["plan"]
+
+def test_bounded_timeouts():
+    assert bounded(15, None) == 15
+    assert bounded(15, new_deadline(100)) == 15
+    assert 4 < bounded(15, new_deadline(20), reserve=15) <= 5
+    assert bounded(15, new_deadline(5), reserve=10) == 0
+    assert new_deadline(0) is None
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    def with_config(self, **kwargs):
+        return self
+
+    async def ainvoke(self, messages):
+        self.prompts.append(messages[0].content)
+        return AIMessage(content="STATUS: READY\nPLAN:\n1. GET /pets")
+
+@patch("agent.nodes.hybrid_retriever")
+@patch("agent.nodes.intent_router")
+def test_short_deadline_returns_plan_and_reports_cuts(mock_router, mock_hybrid):
+    from agent.graph import app_graph
+    from main import build_chat_response
+
+    mock_router.classify.return_value = ("code", 0.2)
+    mock_hybrid.search.return_value = {"documents": [["GET /pets lists pets. " * 40]], "ids": [["1"]]}
+    llm = FakeLLM()
+    inputs = {
+        "messages": [HumanMessage(content="List all pets")], "context": [],
+        "deadline": new_deadline(12), "cut_stages": None
+    }
+
+    with patch("agent.nodes.reasoning_llm", llm), patch("agent.nodes.coding_llm", llm), patch("agent.nodes.chat_llm", llm):
+        result = asyncio.run(app_graph.ainvoke(inputs))
+
+    assert mock_hybrid.search.call_args.kwargs["expand"] is False
+    assert result["cut_stages"] == ["expansion", "compression", "generate"]
+    assert len(llm.prompts) == 1 # Plan only
+    response = build_chat_response(result)
+    assert response["cut_stages"] == ["expansion", "compression", "generate"]
+    assert "Out of time" in response["response"] and "GET /pets" in response["response"]
+
+def test_failed_validation_without_time_for_rewrite():
+    from agent.nodes import validate_node
+    from agent.graph import route_after_validate
+
+    code = "```python\ndef broken(:\n    pass\n```"
+    result = validate_node({"generated_code": code, "attempt_count": 0, "deadline": new_deadline(20)})
+
+    assert result["feedback"] != "PASS"
+    assert result["cut_stages"] == ["refinement"]
+    assert route_after_validate({**result, "cut_stages": result["cut_stages"]}) == "__end__"
+
+    # Plenty of time: the rewrite round runs
+    result = validate_node({"generated_code": code, "attempt_count": 0, "deadline": new_deadline(300)})
+    assert "cut_stages" not in result
+    assert route_after_validate(result) == "generate"
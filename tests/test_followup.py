@@ -0,0 +1,110 @@
+import re
+import zlib
+import numpy as np
+from unittest.mock import patch
+from langchain_core.messages import HumanMessage
+from core.followup import FollowUpDetector
+
+def fake_embedding(texts):
+    """Bag-of-words vectors: texts sharing words are similar."""
+    vectors = np.zeros((len(texts), 512))
+    for i, text in enumerate(texts):
+        for word in re.findall(r"[a-z]+", text.lower()):
+            vectors[i, zlib.crc32(word.encode()) % 512] += 1
+    return vectors
+
+PETS_DOC = "API: Petstore\nEndpoint: GET /pets lists pets. Parameters: limit, status. Auth: api_key header."
+
+@patch("core.followup.vector_store")
+def test_similar_or_referential_messages_are_follow_ups(mock_store):
+    mock_store.embedding_fn.side_effect = fake_embedding
+    detector = FollowUpDetector(min_similarity=0.6, reference_similarity=0.1)
+    topic = [detector.embed("Write python code to list pets with GET /pets")]
+
+    same_topic = detector.assess("Write python code to list pets with GET /pets and a limit", topic, [PETS_DOC])
+    assert same_topic.is_follow_up and same_topic.new_terms == ["python"]
+
+    # Low similarity, but it refers back: the language name is not new information
+    referential = detector.assess("Now do it in Go code", topic, [PETS_DOC], ignore=re.compile(r"\bin go\b"))
+    assert referential.is_follow_up and referential.new_terms == []
+
+    new_topic = detector.assess("How do I upload a file to S3?", topic, [PETS_DOC])
+    assert not new_topic.is_follow_up
+
+    # A pronoun alone does not refer back to the topic
+    pronoun = detector.assess("Now write python code to upload it to S3", topic, [PETS_DOC])
+    assert not pronoun.is_follow_up
+
+    assert detector.stats() == {"follow_up": 2, "new_topic": 2, "searched": 1, "retrieval_skipped_ratio": 0.5}
+
+def test_new_terms_match_whole_words():
+    detector = FollowUpDetector()
+    assert detector.new_terms("get the pets together", ["Group pets together"]) == ["get"]
+    assert detector.new_terms("list the pet with /pets/{id}", ["Endpoint: GET /pets/{id} lists pets"]) == []
+
+@patch("core.followup.vector_store")
+def test_topic_keeps_recent_queries(mock_store):
+    mock_store.embedding_fn.side_effect = fake_embedding
+    detector = FollowUpDetector()
+    topic = []
+    for i in range(8):
+        followup = detector.assess(f"list pets again {i}", topic, [PETS_DOC])
+        topic = detector.topic_embeddings(followup, topic)
+    assert len(topic) == 5
+
+    fresh = detector.assess("Upload a file to S3", topic, [PETS_DOC])
+    assert detector.topic_embeddings(fresh, topic) == [fresh.embedding]
+
+@patch("core.followup.vector_store")
+def test_embedding_failure_is_a_new_topic(mock_store):
+    mock_store.embedding_fn.side_effect = RuntimeError("model unavailable")
+    followup = FollowUpDetector().assess("Now do it in Go", [[1.0, 0.0]], [PETS_DOC])
+    assert not followup.is_follow_up and followup.embedding is None
+
+@patch("agent.nodes.web_search")
+@patch("agent.nodes.hybrid_retriever")
+@patch("core.followup.vector_store")
+def test_follow_up_turns_reuse_retrieval(mock_store, mock_hybrid, mock_web_search):
+    from agent.nodes import retrieve_node
+
+    mock_store.embedding_fn.side_effect = fake_embedding
+    mock_hybrid.search.return_value = {"documents": [[PETS_DOC]], "scores": [[0.9]]}
+
+    state = {"messages": [HumanMessage(content="Write python code to list pets with GET /pets")], "session_id": "s1", "deadline": None}
+    first = retrieve_node(state)
+    assert first["context"] == [PETS_DOC] and first["topic_documents"] == [PETS_DOC]
+    assert mock_hybrid.search.call_count == 1
+
+    # The compressed context of turn 1 is not what a follow-up starts from
+    state.update(first, context=["compressed"])
+    state["messages"] = [HumanMessage(content="Now write the same pets code in Go")]
+    second = retrieve_node(state)
+    assert second["context"] == [PETS_DOC]
+    assert mock_hybrid.search.call_count == 1 # Nothing new to look up
+    assert len(second["topic_embeddings"]) == 2
+
+    # A follow-up with new information searches for it, without query expansion, on top of the topic
+    mock_hybrid.search.return_value = {"documents": [["Endpoint: DELETE /pets/{id}"]], "scores": [[0.7]]}
+    state.update(second)
+    state["messages"] = [HumanMessage(content="Extend that code to delete pets with DELETE /pets/{id}")]
+    third = retrieve_node(state)
+    assert third["context"] == [PETS_DOC, "Endpoint: DELETE /pets/{id}"]
+    assert mock_hybrid.search.call_args.kwargs["expand"] is False
+    mock_web_search.invoke.assert_not_called()
+
+    # A new topic starts over
+    mock_hybrid.search.return_value = {"documents": [["S3 upload guide"]], "scores": [[0.8]]}
+    state.update(third)
+    state["messages"] = [HumanMessage(content="How do I upload a file to S3?")]
+    fourth = retrieve_node(state)
+    assert fourth["context"] == ["S3 upload guide"] and len(fourth["topic_embeddings"]) == 1
+
+@patch("agent.nodes.hybrid_retriever")
+def test_stateless_requests_skip_detection(mock_hybrid):
+    from agent.nodes import retrieve_node
+
+    mock_hybrid.search.return_value = {"documents": [[PETS_DOC]], "scores": [[0.9]]}
+    with patch("agent.nodes.followup_detector") as detector:
+        result = retrieve_node({"messages": [HumanMessage(content="List pets")], "deadline": None})
+    detector.assess.assert_not_called()
+    assert "topic_documents" not in result and result["context"] == [PETS_DOC]
@@ -0,0 +1,55 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from langchain_core.messages import HumanMessage, AIMessage
+from agent.nodes import get_smart_history
+from core.sessions import SessionManager
+
+def make_conversation(n):
+    return [
+        HumanMessage(content=f"question {i}") if i % 2 == 0 else AIMessage(content=f"answer {i}")
+        for i in range(n)
+    ]
+
+@pytest.fixture
+def store(tmp_path):
+    manager = SessionManager(persistence_file=str(tmp_path / "sessions.db"))
+    with patch("agent.nodes.session_manager", manager):
+        yield manager
+
+@patch("agent.nodes.invoke_llm_safe")
+def test_short_history_not_summarized(mock_llm, store):
+    history = get_smart_history(make_conversation(6))
+    assert "question 0" in history and "answer 5" in history
+    mock_llm.assert_not_called()
+
+@patch("agent.nodes.invoke_llm_safe")
+def test_summary_folds_only_new_messages(mock_llm, store):
+    mock_llm.return_value = MagicMock(content="Summary v1")
+    conversation = make_conversation(12)
+
+    history = get_smart_history(conversation, session_id="s1")
+    assert "Summary v1" in history
+    assert mock_llm.call_count == 1
+
+    # Same conversation again: summary reused, no LLM call
+    get_smart_history(conversation, session_id="s1")
+    assert mock_llm.call_count == 1
+
+    # Next turn: only the 2 messages that left the tail window are folded in
+    mock_llm.return_value = MagicMock(content="Summary v2")
+    history = get_smart_history(make_conversation(14), session_id="s1")
+    assert "Summary v2" in history
+    assert mock_llm.call_count == 2
+
+    prompt = mock_llm.call_args[0][1][0].content
+    assert "Summary v1" in prompt
+    assert "answer 9" in prompt and "question 10" in prompt
+    assert "question 4" not in prompt
+
+@patch("agent.nodes.invoke_llm_safe")
+def test_summary_failure_falls_back(mock_llm, store):
+    mock_llm.side_effect = Exception("LLM down")
+    history = get_smart_history(make_conversation(12))
+    assert "Error generating summary." in history
+    # Nothing cached, so the next turn retries
+    assert store.find_summary(["anything"]) is None
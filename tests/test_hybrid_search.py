@@ -83,3 +83,19 @@ def test_tokenize():
         tokens = r._tokenize("Hello, World!")
         assert "hello" in tokens
         assert "world" in tokens
+
+@patch("core.hybrid.vector_store")
+def test_sync_requests_are_batched(mock_vector_store):
+    import time
+    mock_vector_store.get_all_documents.return_value = DOC_REGISTRY_DATA
+    retriever = HybridRetriever(sync_interval=0.1)
+    generation = retriever.generation
+
+    # A burst of indexed pages: one rebuild, after the interval
+    for _ in range(5):
+        retriever.request_sync()
+    assert retriever.generation == generation
+    time.sleep(0.4)
+    assert retriever.generation == generation + 1
+    assert mock_vector_store.get_all_documents.call_count == 2
+    assert len(retriever.corpus) == 3 and len(retriever.doc_registry) == 3
@@ -0,0 +1,103 @@
+import re
+import zlib
+import asyncio
+import numpy as np
+from unittest.mock import patch
+from langchain_core.messages import HumanMessage, AIMessage
+from core.intent_router import IntentRouter
+
+def fake_embedding(texts):
+    """Bag-of-words vectors: texts sharing words are similar."""
+    vectors = np.zeros((len(texts), 512))
+    for i, text in enumerate(texts):
+        for word in re.findall(r"[a-z]+", text.lower()):
+            vectors[i, zlib.crc32(word.encode()) % 512] += 1
+    return vectors
+
+@patch("core.intent_router.vector_store")
+def test_nearest_centroid_routing(mock_store):
+    mock_store.embedding_fn.side_effect = fake_embedding
+    router = IntentRouter(min_margin=0.0)
+
+    assert router.classify("What auth does the API use?")[0] == "lookup"
+    assert router.classify("Write code to create a pet")[0] == "code"
+    assert router.classify("Explain how the authentication flow works")[0] == "explain"
+
+    stats = router.stats()
+    assert stats["total"] == 3
+    assert stats["by_intent"] == {"code": 1, "lookup": 1, "explain": 1}
+    assert abs(stats["full_pipeline_skipped_ratio"] - 2 / 3) < 1e-9
+
+@patch("core.intent_router.vector_store")
+def test_uncertain_or_failing_routes_to_code(mock_store):
+    mock_store.embedding_fn.side_effect = fake_embedding
+    assert IntentRouter(min_margin=2.0).classify("What auth does the API use?")[0] == "code"
+
+    mock_store.embedding_fn.side_effect = RuntimeError("model unavailable")
+    router = IntentRouter()
+    assert router.classify("What auth does the API use?")[0] == "code"
+    assert router.stats()["fallbacks"] == 1
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    def with_config(self, **kwargs):
+        return self
+
+    async def ainvoke(self, messages):
+        self.prompts.append(messages[0].content)
+        return AIMessage(content="The API uses bearer tokens.")
+
+@patch("agent.nodes.web_search")
+@patch("agent.nodes.hybrid_retriever")
+@patch("agent.nodes.intent_router")
+def test_lookup_skips_plan_generate_validate(mock_router, mock_hybrid, mock_web_search):
+    from agent.graph import app_graph
+
+    mock_router.classify.return_value = ("lookup", 0.2)
+    mock_hybrid.search.return_value = {"documents": [["Authentication Schemes: bearer"]], "ids": [["1"]]}
+    llm = FakeLLM()
+    inputs = {"messages": [HumanMessage(content="What auth does the petstore API use?")], "context": []}
+
+    with patch("agent.nodes.chat_llm", llm), patch("agent.nodes.reasoning_llm", llm), patch("agent.nodes.coding_llm", llm):
+        result = asyncio.run(app_graph.ainvoke(inputs))
+
+    assert result["intent"] == "lookup"
+    assert result["generated_code"] == "The API uses bearer tokens."
+    assert result.get("plan") is None
+    assert len(llm.prompts) == 1 and "API Documentation Expert" in llm.prompts[0]
+
+@patch("core.intent_router.vector_store")
+def test_language_hint_needs_a_confident_non_code_intent(mock_store):
+    mock_store.embedding_fn.side_effect = fake_embedding
+    router = IntentRouter(min_margin=0.0, code_hint_margin=2.0)
+    assert router.classify("What auth does the API use?", code_hint=True)[0] == "code"
+    assert router.classify("What auth does the API use?")[0] == "lookup"
+
+    router = IntentRouter(min_margin=0.0, code_hint_margin=0.0)
+    assert router.classify("What auth does the API use?", code_hint=True)[0] == "lookup"
+
+@patch("agent.nodes.intent_router")
+def test_language_mentions_are_hints_outside_urls(mock_router):
+    from agent.nodes import classify_node
+
+    mock_router.classify.return_value = ("code", 0.05)
+    assert classify_node({"messages": [HumanMessage(content="What would this look like in Python?")]}) == {"intent": "code"}
+    mock_router.classify.assert_called_with("What would this look like in Python?", code_hint=True)
+
+    mock_router.classify.return_value = ("explain", 0.3)
+    query = "Summarize https://docs.python.org/3/library/asyncio.html"
+    assert classify_node({"messages": [HumanMessage(content=query)]}) == {"intent": "explain"}
+    mock_router.classify.assert_called_with(query, code_hint=False)
+
+def test_stats_endpoint():
+    from fastapi.testclient import TestClient
+    from main import app
+
+    response = TestClient(app).get("/v1/stats")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert "by_intent" in body["routing"]
+    assert "llm_avoided_ratio" in body["validation"]
@@ -0,0 +1,75 @@
+import sqlite3
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration
+from core.llm_cache import LLMResponseCache, cache_key, normalize_llm_string
+
+GROQ_LLM_STRING = (
+    '{"id": ["langchain_groq", "chat_models", "ChatGroq"], "kwargs": {"groq_api_key": {"id": ["GROQ_API_KEY"], "lc": 1, "type": "secret"}, '
+    '"max_retries": 2, "model_name": "llama-3.1-8b-instant", "n": 1, "temperature": 0.1}, "lc": 1, "name": "ChatGroq", "type": "constructor"}'
+    "---[('stop', None)]"
+)
+
+def generation(text):
+    return [ChatGeneration(message=AIMessage(content=text))]
+
+def test_model_id_ignores_client_settings():
+    model_id, params = normalize_llm_string(GROQ_LLM_STRING)
+    assert model_id == "chatgroq/llama-3.1-8b-instant"
+    assert "max_retries" not in params and "GROQ_API_KEY" not in params
+
+    retried = GROQ_LLM_STRING.replace('"max_retries": 2', '"max_retries": 5')
+    assert cache_key("prompt", retried) == cache_key("prompt", GROQ_LLM_STRING)
+    hotter = GROQ_LLM_STRING.replace('"temperature": 0.1', '"temperature": 0.7')
+    assert cache_key("prompt", hotter) != cache_key("prompt", GROQ_LLM_STRING)
+
+    ollama = "[('_type', 'ollama-chat'), ('model', 'llama3.2:3b'), ('options', {'temperature': 0.7})]"
+    assert normalize_llm_string(ollama)[0] == "llama3.2:3b"
+
+def test_l1_then_sqlite_hits(tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "llm.db"))
+    assert cache.lookup("prompt", GROQ_LLM_STRING) is None
+    cache.update("prompt", GROQ_LLM_STRING, generation("cached answer"))
+
+    assert cache.lookup("prompt", GROQ_LLM_STRING)[0].message.content == "cached answer"
+    # Another worker (no in-process entry) reads the shared database
+    other = LLMResponseCache(path=str(tmp_path / "llm.db"))
+    assert other.lookup("prompt", GROQ_LLM_STRING)[0].message.content == "cached answer"
+
+    assert cache.stats()["l1_hits"] == 1 and cache.stats()["misses"] == 1
+    assert other.stats()["hits"] == 1 and other.stats()["entries"] == 1
+    with sqlite3.connect(tmp_path / "llm.db") as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+def test_expired_entries_miss_and_are_evicted(tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "llm.db"), ttl_seconds=60, l1_size=0)
+    cache.update("prompt", GROQ_LLM_STRING, generation("old"))
+    with sqlite3.connect(tmp_path / "llm.db") as conn:
+        conn.execute("UPDATE responses SET created_at = created_at - 120")
+
+    assert cache.lookup("prompt", GROQ_LLM_STRING) is None
+    assert cache.evict() == 1
+    assert cache.stats()["entries"] == 0
+
+def test_size_cap_evicts_least_recently_used(tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "llm.db"), max_bytes=10_000, l1_size=0)
+    for i in range(20):
+        cache.update(f"prompt {i}", GROQ_LLM_STRING, generation(f"answer {i} " + "x" * 500))
+    with sqlite3.connect(tmp_path / "llm.db") as conn:
+        # prompt 0 was used most recently
+        conn.execute("UPDATE responses SET accessed_at = accessed_at + 3600 WHERE key = ?", (cache_key("prompt 0", GROQ_LLM_STRING)[0],))
+
+    assert cache.evict() > 0
+    stats = cache.stats()
+    assert stats["bytes"] <= 10_000 * 0.9
+    assert cache.lookup("prompt 0", GROQ_LLM_STRING) is not None
+    assert cache.lookup("prompt 1", GROQ_LLM_STRING) is None
+
+def test_chat_model_uses_the_cache(tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "llm.db"))
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content="first"), AIMessage(content="second")]), cache=cache)
+
+    assert llm.invoke([HumanMessage(content="Hi")]).content == "first"
+    assert llm.invoke([HumanMessage(content="Hi")]).content == "first"
+    assert llm.invoke([HumanMessage(content="Hello")]).content == "second"
+    assert cache.stats()["writes"] == 2
@@ -0,0 +1,140 @@
+import asyncio
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.language_models import GenericFakeChatModel
+from core.exceptions import LLMOverloadedError
+from core.llm_cache import LLMResponseCache
+from core.llm_scheduler import LLMScheduler, SchedulerRateLimiter, Ticket, TokenBucket, parse_duration
+from core.model_router import ModelRouter, RoutedLLM, build_routes
+
+SMALL = "groq/llama-3.1-8b-instant"
+LARGE = "groq/llama-3.3-70b-versatile"
+PROMPT = [HumanMessage(content="x" * 400)] # 100 prompt tokens
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def scheduler(clock, rpm=30, tpm=6000, max_wait=20):
+    return LLMScheduler(limits={SMALL: {"rpm": rpm, "tpm": tpm}}, max_wait=max_wait, clock=clock)
+
+def test_parse_duration():
+    assert parse_duration("7.66s") == 7.66
+    assert parse_duration("2m59.56s") == pytest.approx(179.56)
+    assert parse_duration("120ms") == pytest.approx(0.12)
+    assert parse_duration("3") == 3.0
+    assert parse_duration("") is None and parse_duration("soon") is None
+
+def test_token_bucket_refills_over_the_period():
+    bucket = TokenBucket(60, period=60, now=0)
+    bucket.level = 0
+    assert bucket.wait_for(30) == 30
+    bucket.refill(10)
+    assert bucket.level == 10 and bucket.wait_for(30) == 20
+    bucket.refill(1000)
+    assert bucket.level == 60
+
+def test_calls_are_shed_when_the_budget_would_not_free_up_in_time():
+    clock = Clock()
+    scheduler_ = scheduler(clock, tpm=1200, max_wait=5)
+    scheduler_.acquire(SMALL, PROMPT, "plan") # 600 of 1200 tokens
+    scheduler_.acquire(SMALL, PROMPT, "plan")
+
+    with pytest.raises(LLMOverloadedError) as e:
+        scheduler_.acquire(SMALL, PROMPT, "plan")
+    assert e.value.details == {"retry_after": 30, "model": SMALL}
+    assert scheduler_.stats()["shed"] == 1
+
+    clock.now += 30
+    assert scheduler_.acquire(SMALL, PROMPT, "plan").model == SMALL
+
+def test_models_without_budget_are_not_scheduled():
+    scheduler_ = scheduler(Clock())
+    for _ in range(5):
+        scheduler_.acquire(LARGE, PROMPT, "plan")
+    assert scheduler_.stats()["granted"] == 0
+
+def test_low_priority_tasks_leave_a_reserve_to_planning():
+    clock = Clock()
+    scheduler_ = scheduler(clock, rpm=10, max_wait=1)
+    for _ in range(7):
+        scheduler_.acquire(SMALL, PROMPT, "summarize")
+
+    # Summaries keep 30% of the requests for higher priorities; planning may use them
+    with pytest.raises(LLMOverloadedError):
+        scheduler_.acquire(SMALL, PROMPT, "summarize")
+    for _ in range(3):
+        scheduler_.acquire(SMALL, PROMPT, "plan")
+    assert scheduler_.stats()["granted"] == 10
+
+def test_async_callers_wait_for_the_budget():
+    scheduler_ = LLMScheduler(limits={SMALL: {"rpm": 600, "tpm": 60000}}, max_wait=1)
+    scheduler_.acquire(SMALL, PROMPT, "plan")
+    scheduler_._budgets[SMALL].requests.level = 0 # Refills one request per 0.1s
+
+    ticket = asyncio.run(scheduler_.aacquire(SMALL, PROMPT, "plan"))
+    assert ticket.waited > 0.05
+    assert scheduler_.stats()["queued"] == 1
+
+def test_provider_headers_correct_the_budget():
+    clock = Clock()
+    scheduler_ = scheduler(clock, max_wait=5)
+    scheduler_.observe(SMALL, {"x-ratelimit-limit-tokens": "5000", "x-ratelimit-remaining-tokens": "1000", "x-ratelimit-remaining-requests": "12"})
+    assert scheduler_.stats()["models"][SMALL]["tokens_left"] == 1000
+    assert scheduler_.stats()["models"][SMALL]["requests_left"] == 12
+
+    scheduler_.observe(SMALL, {"retry-after": "8"}, status=429)
+    with pytest.raises(LLMOverloadedError):
+        scheduler_.acquire(SMALL, PROMPT, "plan")
+    assert scheduler_.stats()["throttled_by_provider"] == 1
+
+    # Unconfigured models are learned from their headers
+    scheduler_.observe(LARGE, {"x-ratelimit-limit-tokens": "12000", "x-ratelimit-remaining-tokens": "11000"})
+    assert scheduler_.stats()["models"][LARGE]["tokens_left"] == 11000
+
+def test_settle_uses_the_reported_usage():
+    scheduler_ = scheduler(Clock())
+    ticket = scheduler_.acquire(SMALL, PROMPT, "plan")
+    assert ticket == Ticket(model=SMALL, tokens=600, waited=ticket.waited)
+    response = AIMessage(content="ok", usage_metadata={"input_tokens": 100, "output_tokens": 50, "total_tokens": 150})
+    scheduler_.settle(ticket, response)
+    assert scheduler_.stats()["models"][SMALL]["tokens_left"] == 5850
+
+class FakeModel:
+    def __init__(self, name, scheduler_):
+        self.name = name
+        self.scheduler = scheduler_
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        self.scheduler.observe(f"groq/{self.name}", {})
+        return AIMessage(content=self.name)
+
+def test_routed_llm_moves_on_when_a_model_has_no_budget():
+    clock = Clock()
+    scheduler_ = scheduler(clock, rpm=1)
+    router = ModelRouter(routes=build_routes("groq"), clock=clock)
+    models = {"llama-3.1-8b-instant": FakeModel("llama-3.1-8b-instant", scheduler_), "llama-3.3-70b-versatile": FakeModel("llama-3.3-70b-versatile", scheduler_)}
+    llm = RoutedLLM("answer", router, lambda choice: models[choice.model], scheduler=scheduler_)
+
+    assert llm.invoke(PROMPT).content == "llama-3.1-8b-instant"
+    # The 8b model's single request per minute is used: the 70b model answers without waiting
+    assert llm.invoke(PROMPT).content == "llama-3.3-70b-versatile"
+    assert scheduler_.stats()["shed"] == 1
+
+def test_cached_prompts_do_not_take_budget(tmp_path):
+    clock = Clock()
+    scheduler_ = scheduler(clock, rpm=1)
+    router = ModelRouter(routes=build_routes("groq"), clock=clock)
+    model = GenericFakeChatModel(messages=iter([AIMessage(content="cached")]), cache=LLMResponseCache(path=str(tmp_path / "cache.db")), rate_limiter=SchedulerRateLimiter())
+    llm = RoutedLLM("answer", router, lambda choice: model, scheduler=scheduler_)
+
+    assert llm.invoke(PROMPT).content == "cached"
+    # The 8b model's single request per minute is used, but the same prompt is served by the cache
+    assert llm.invoke(PROMPT).content == "cached"
+    assert asyncio.run(llm.ainvoke(PROMPT)).content == "cached"
+    assert scheduler_.stats()["granted"] == 1 and scheduler_.stats()["shed"] == 0
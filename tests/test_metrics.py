@@ -0,0 +1,70 @@
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from main import app
+from core.metrics import HttpMetrics, render_metrics
+from core.resilience import global_circuit_breaker
+
+client = TestClient(app)
+
+def sample(text: str, line_start: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(line_start + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{line_start} not found")
+
+def test_http_histogram_is_labeled_by_route_template():
+    metrics = HttpMetrics()
+    with patch("main.http_metrics", metrics), patch("core.metrics.http_metrics", metrics):
+        client.get("/")
+        client.get("/")
+        client.get("/sessions/does-not-exist/history")
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert sample(text, 'http_request_duration_seconds_count{method="GET",route="/"}') == 2
+    assert sample(text, 'http_request_duration_seconds_bucket{method="GET",route="/",le="+Inf"}') == 2
+    # Path parameters do not create a series per id
+    assert 'route="/sessions/{session_id}/history"' in text
+    assert "does-not-exist" not in text
+    assert sample(text, 'http_responses_total{method="GET",route="/",status="200"}') == 2
+
+def test_histogram_buckets_are_cumulative():
+    metrics = HttpMetrics()
+    for seconds in (0.001, 0.2, 3.0):
+        metrics.observe("POST", "/chat", 200, seconds)
+    with patch("core.metrics.http_metrics", metrics):
+        text = render_metrics()
+
+    route = 'method="POST",route="/chat"'
+    assert sample(text, f'http_request_duration_seconds_bucket{{{route},le="0.005"}}') == 1
+    assert sample(text, f'http_request_duration_seconds_bucket{{{route},le="0.25"}}') == 2
+    assert sample(text, f'http_request_duration_seconds_bucket{{{route},le="5.0"}}') == 3
+    assert abs(sample(text, f"http_request_duration_seconds_sum{{{route}}}") - 3.201) < 1e-9
+    assert "# TYPE http_request_duration_seconds histogram" in text
+
+def test_circuit_breaker_state_gauge():
+    try:
+        global_circuit_breaker.state = "OPEN"
+        global_circuit_breaker.failures = 5
+        text = render_metrics()
+    finally:
+        global_circuit_breaker.state = "CLOSED"
+        global_circuit_breaker.failures = 0
+
+    assert sample(text, 'circuit_breaker_state{state="OPEN"}') == 1
+    assert sample(text, 'circuit_breaker_state{state="CLOSED"}') == 0
+    assert sample(text, "circuit_breaker_failures") == 5
+
+def test_stage_and_index_metrics_are_exported():
+    from core.tracing import span
+    from core.hybrid import hybrid_retriever
+
+    with span("retrieval", "hybrid_search"):
+        pass
+    text = render_metrics()
+
+    assert sample(text, 'agent_stage_duration_seconds_count{kind="retrieval",name="hybrid_search"}') >= 1
+    assert sample(text, 'index_documents{index="bm25"}') == len(hybrid_retriever.corpus)
+    assert sample(text, "index_generation") == hybrid_retriever.generation
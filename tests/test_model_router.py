@@ -0,0 +1,120 @@
+import json
+import asyncio
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from core.model_router import ModelRouter, RoutedLLM, build_routes, is_rate_limit, retry_after
+from core.context_packer import budget_for
+from core.llm_scheduler import LLMScheduler
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__("Rate limit reached for model")
+        self.response = type("Response", (), {"status_code": 429, "headers": {"retry-after": retry_after} if retry_after else {}})()
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class FakeModel:
+    def __init__(self, name, fail=None):
+        self.name = name
+        self.fail = fail
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        if self.fail:
+            raise self.fail
+        return AIMessage(content=self.name)
+
+    async def ainvoke(self, messages):
+        return self.invoke(messages)
+
+def routed(task, models, clock, routes=None):
+    router = ModelRouter(routes=routes or build_routes("groq"), clock=clock)
+    return RoutedLLM(task, router, lambda choice: models[choice.model], scheduler=LLMScheduler(limits={})), router
+
+def test_default_routes_tier_tasks():
+    routes = build_routes("groq")
+    assert [c.model for c in routes["expansion"].candidates] == ["llama-3.1-8b-instant"]
+    assert [c.model for c in routes["plan"].candidates] == ["llama-3.3-70b-versatile", "llama-3.1-8b-instant"]
+    assert routes["generate"].candidates[0].temperature == 0.1
+    assert {c.model for route in build_routes("ollama").values() for c in route.candidates} == {"llama3.2:3b"}
+
+def test_overrides_replace_tasks():
+    routes = build_routes("groq", json.dumps({
+        "coding": ["ollama/qwen2.5-coder:7b", "groq/llama-3.1-8b-instant"],
+        "summarize": {"models": ["ollama/llama3.2:3b"], "max_latency": 3},
+    }))
+    assert [c.key for c in routes["generate"].candidates] == ["ollama/qwen2.5-coder:7b", "groq/llama-3.1-8b-instant"]
+    assert routes["summarize"].max_latency == 3
+    assert [c.model for c in routes["expansion"].candidates] == ["llama-3.1-8b-instant"]
+
+    with pytest.raises(ValueError):
+        build_routes("groq", json.dumps({"poetry": ["groq/llama-3.1-8b-instant"]}))
+    with pytest.raises(ValueError):
+        build_routes("groq", json.dumps({"plan": ["llama-3.1-8b-instant"]}))
+
+def test_rate_limited_model_is_skipped_until_cooldown_ends():
+    clock = Clock()
+    large = FakeModel("large", fail=RateLimitError(retry_after="12"))
+    fast = FakeModel("fast")
+    llm, router = routed("plan", {"llama-3.3-70b-versatile": large, "llama-3.1-8b-instant": fast}, clock)
+
+    assert llm.invoke([HumanMessage(content="plan")]).content == "fast"
+    assert llm.invoke([HumanMessage(content="plan")]).content == "fast"
+    assert large.calls == 1 # Not retried while cooling down
+    assert llm.model_name == "llama-3.1-8b-instant"
+    assert router.stats()["downgrades"] == {"plan": 2}
+    assert router.stats()["cooling_down"] == {"groq/llama-3.3-70b-versatile": 12.0}
+
+    clock.now += 13
+    large.fail = None
+    assert llm.invoke([HumanMessage(content="plan")]).content == "large"
+
+def test_all_candidates_rate_limited_raises():
+    clock = Clock()
+    models = {"llama-3.1-8b-instant": FakeModel("fast", fail=RateLimitError()), "llama-3.3-70b-versatile": FakeModel("large", fail=RateLimitError())}
+    llm, router = routed("answer", models, clock)
+    with pytest.raises(RateLimitError):
+        asyncio.run(llm.ainvoke([HumanMessage(content="hi")]))
+    assert router.stats()["rate_limited"] == {"groq/llama-3.1-8b-instant": 1, "groq/llama-3.3-70b-versatile": 1}
+
+def test_other_errors_do_not_fall_back():
+    clock = Clock()
+    fast = FakeModel("fast")
+    llm, _ = routed("plan", {"llama-3.3-70b-versatile": FakeModel("large", fail=ValueError("bad request")), "llama-3.1-8b-instant": fast}, clock)
+    with pytest.raises(ValueError):
+        llm.invoke([HumanMessage(content="plan")])
+    assert fast.calls == 0
+
+def test_slow_model_is_downgraded_until_its_latency_is_stale():
+    clock = Clock()
+    router = ModelRouter(routes=build_routes("groq"), clock=clock)
+    large, fast = router.route("plan").candidates
+    router.record_success("plan", large, 25.0) # Above the 10s target
+    router.record_success("plan", fast, 1.0)
+    assert [c.key for c in router.order("plan")] == [fast.key, large.key]
+
+    # Latency is tracked per task: the large model is still first for generation
+    assert router.order("generate")[0].key == large.key
+
+    clock.now += 301
+    assert router.order("plan")[0].key == large.key
+
+def test_rate_limit_detection():
+    assert is_rate_limit(RateLimitError())
+    assert is_rate_limit(Exception("Error code: 429 - rate_limit_exceeded"))
+    assert not is_rate_limit(ValueError("invalid api key"))
+    assert retry_after(RateLimitError(retry_after="7")) == 7.0
+    assert retry_after(ValueError("x")) is None
+
+def test_context_budget_fits_every_candidate():
+    routes = build_routes("groq", json.dumps({"plan": ["groq/llama-3.3-70b-versatile", "ollama/llama3.2:3b"]}))
+    llm, _ = routed("plan", {}, Clock(), routes)
+    assert budget_for(llm) == 3000
@@ -0,0 +1,89 @@
+import asyncio
+from unittest.mock import patch, MagicMock
+from langchain_core.messages import HumanMessage, AIMessage
+from agent.nodes import requested_languages, merge_languages_node
+
+PYTHON_CODE = "```python\nimport requests\n\nprint(requests.get('https://api.example.com/pets').json())\n```"
+CSHARP_CODE = "```csharp\nvar pets = await new HttpClient().GetStringAsync(\"https://api.example.com/pets\");\n```"
+
+class FakeLLM:
+    """Generates per TARGET LANGUAGE (slowly) and reviews C# as failing once."""
+    def __init__(self, latency=0.3):
+        self.latency = latency
+        self.prompts = []
+        self.active = 0
+        self.peak = 0
+
+    def with_config(self, **kwargs):
+        return self
+
+    async def ainvoke(self, messages):
+        prompt = messages[0].content
+        self.prompts.append(prompt)
+        if "Senior Code Reviewer" in prompt:
+            reviews = sum("Senior Code Reviewer" in p for p in self.prompts)
+            return AIMessage(content="- Missing using directives" if reviews == 1 else "PASS")
+        if "Expert Software Architect" in prompt:
+            return AIMessage(content="STATUS: READY\nPLAN: list pets in Python and C#")
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(self.latency)
+        self.active -= 1
+        if "TARGET LANGUAGE: Python" in prompt:
+            return AIMessage(content=PYTHON_CODE)
+        if "TARGET LANGUAGE: C#" in prompt:
+            return AIMessage(content=CSHARP_CODE)
+        return AIMessage(content="search query")
+
+def test_requested_languages():
+    assert requested_languages("Write a client in Python and C#") == ["Python", "C#"]
+    assert requested_languages("node.js + TypeScript, then Java") == ["JavaScript", "TypeScript", "Java"]
+    assert requested_languages("Show me how to go to the pets endpoint") == []
+    assert requested_languages("Python please") == ["Python"]
+
+def test_requested_languages_ignores_urls_code_and_common_words():
+    assert requested_languages("Write a Python client for https://api.example.net/v1/pets") == ["Python"]
+    assert requested_languages("Summarize https://docs.python.org/3/library/asyncio.html") == []
+    assert requested_languages("How do swift payments work? Call `node.delete()` on the tree node") == []
+    assert requested_languages("Write it in Swift, then in Go, using ASP.NET for the server") == ["Swift", "Go", "C#"]
+    assert requested_languages("Port it to .NET") == ["C#"]
+
+def test_merge_keeps_request_order_and_reports_failures():
+    state = {
+        "messages": [HumanMessage(content="Python and C#")],
+        "language_results": [
+            {"language": "C#", "code": "cs", "feedback": "- broken", "attempts": 3},
+            {"language": "Python", "code": "py", "feedback": "PASS", "attempts": 1},
+        ],
+    }
+    merged = merge_languages_node(state)
+    assert merged["generated_code"] == "### Python\npy\n\n### C#\ncs"
+    assert merged["feedback"] == "C#:\n- broken"
+    assert merged["attempt_count"] == 3
+    assert merged["language_results"] is None
+
+@patch("agent.nodes.web_search")
+@patch("agent.nodes.hybrid_retriever")
+def test_languages_generate_in_parallel_and_retry_alone(mock_hybrid, mock_web_search):
+    from agent.graph import app_graph
+
+    mock_hybrid.search.return_value = {"documents": [], "ids": []}
+    mock_web_search.invoke.return_value = "GET /pets"
+    llm = FakeLLM()
+    inputs = {
+        "messages": [HumanMessage(content="List pets in Python and C#")],
+        "context": [], "plan": "", "generated_code": "", "error": ""
+    }
+
+    with patch("agent.nodes.reasoning_llm", llm), patch("agent.nodes.coding_llm", llm), \
+         patch("agent.nodes.search_query_llm", llm), patch("agent.nodes.review_llm", llm):
+        result = asyncio.run(app_graph.ainvoke(inputs))
+
+    assert result["feedback"] == "PASS"
+    assert result["generated_code"] == f"### Python\n{PYTHON_CODE}\n\n### C#\n{CSHARP_CODE}"
+    generations = [p for p in llm.prompts if "TARGET LANGUAGE" in p]
+    # Python passed the local checks once; only C# was regenerated
+    assert sum("TARGET LANGUAGE: Python" in p for p in generations) == 1
+    assert sum("TARGET LANGUAGE: C#" in p for p in generations) == 2
+    # Both branches were generating at the same time
+    assert llm.peak == 2
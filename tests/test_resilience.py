@@ -1,5 +1,6 @@
 
 import pytest
+from unittest.mock import patch, AsyncMock
 from tenacity import RetryError
 from backend.core.resilience import with_resilience, global_circuit_breaker
 from backend.core.exceptions import AppError, ServiceUnavailableError
@@ -59,3 +60,21 @@ def test_circuit_breaker_recovery():
     result = call_llm()
     assert result == "Recovered"
     assert global_circuit_breaker.state == "CLOSED"
+
+def test_async_retry_logic():
+    import asyncio
+    global_circuit_breaker.failures = 0
+    global_circuit_breaker.state = "CLOSED"
+    calls = []
+
+    @with_resilience(max_retries=2)
+    async def call_llm():
+        calls.append(1)
+        if len(calls) < 2:
+            raise ValueError("LLM Failure")
+        return "Recovered"
+
+    with patch("asyncio.sleep", new=AsyncMock()):
+        assert asyncio.run(call_llm()) == "Recovered"
+    assert len(calls) == 2
+    assert global_circuit_breaker.state == "CLOSED"
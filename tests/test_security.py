@@ -1,7 +1,7 @@
 
 from fastapi.testclient import TestClient
 from main import app, app_graph
-from unittest.mock import patch
+from unittest.mock import patch, AsyncMock
 import pytest
 
 client = TestClient(app)
@@ -11,7 +11,7 @@ def test_xss_sanitization():
     Verify that HTML/Script tags are stripped from input.
     """
     # Patch the graph invocation on the content object
-    with patch.object(app_graph, "invoke") as mock_invoke:
+    with patch.object(app_graph, "ainvoke", new_callable=AsyncMock) as mock_invoke:
         mock_invoke.return_value = {
             "generated_code": "print('clean')",
             "plan": "Clean Plan",
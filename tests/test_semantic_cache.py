@@ -0,0 +1,84 @@
+import re
+import zlib
+import asyncio
+import numpy as np
+from unittest.mock import patch, MagicMock
+from langchain_core.messages import AIMessage, HumanMessage
+from core.semantic_cache import SemanticLLMCache, key_terms, parse_roles
+
+def fake_embedding(texts):
+    """Bag-of-words vectors: texts sharing words are similar."""
+    vectors = np.zeros((len(texts), 512))
+    for i, text in enumerate(texts):
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            vectors[i, zlib.crc32(word.encode()) % 512] += 1
+    return vectors
+
+def test_parse_roles():
+    assert parse_roles("expansion:0.9, search_query:0.92,") == {"expansion": 0.9, "search_query": 0.92}
+    assert parse_roles("") == {}
+
+def test_key_terms():
+    assert key_terms("Auth error 401 on GET /pets/{id} with api_key in Python") == {"401", "get", "/pets/{id}", "api_key", "python"}
+    assert key_terms("how does authentication work") == frozenset()
+
+@patch("core.semantic_cache.vector_store")
+def test_near_duplicates_reuse_the_response(mock_store):
+    mock_store.embedding_fn.side_effect = fake_embedding
+    cache = SemanticLLMCache(roles={"expansion": 0.8})
+    compute = MagicMock(side_effect=["auth failure\nlogin error", "never used"])
+
+    assert cache.get_or_compute("expansion", "How does pagination work for the orders list", compute) == "auth failure\nlogin error"
+    assert cache.get_or_compute("expansion", "how does  pagination work for the orders list?", compute) == "auth failure\nlogin error"
+    assert compute.call_count == 1
+    assert cache.stats()["expansion"]["hits"] == 1
+
+@patch("core.semantic_cache.vector_store")
+def test_guards_refuse_similar_inputs_with_different_meaning(mock_store):
+    mock_store.embedding_fn.side_effect = fake_embedding
+    cache = SemanticLLMCache(roles={"search_query": 0.7})
+    cache.get_or_compute("search_query", "petstore api returns error 401 when listing pets", lambda: "petstore 401")
+
+    # Same words, different status code / negation / scope: the LLM is called again
+    assert cache.get_or_compute("search_query", "petstore api returns error 403 when listing pets", lambda: "petstore 403") == "petstore 403"
+    assert cache.get_or_compute("search_query", "petstore api returns no error when listing pets", lambda: "no error") == "no error"
+    assert cache.get_or_compute("search_query", "petstore api returns error 401 when listing pets", lambda: "other", scope="s2") == "other"
+    assert cache.stats()["search_query"]["guarded"] == 3
+
+@patch("core.semantic_cache.vector_store")
+def test_disabled_roles_and_embedding_failures_always_compute(mock_store):
+    mock_store.embedding_fn.side_effect = RuntimeError("model unavailable")
+    cache = SemanticLLMCache(roles={"expansion": 0.9})
+    assert cache.get_or_compute("expansion", "auth error", lambda: "a") == "a"
+    assert cache.get_or_compute("expansion", "auth error", lambda: "b") == "b"
+
+    mock_store.embedding_fn.side_effect = fake_embedding
+    assert cache.get_or_compute("summarize", "same text", lambda: "one") == "one"
+    assert cache.get_or_compute("summarize", "same text", lambda: "two") == "two"
+    assert "summarize" not in cache.stats()
+
+@patch("core.semantic_cache.vector_store")
+def test_expired_entries_are_not_served(mock_store):
+    mock_store.embedding_fn.side_effect = fake_embedding
+    cache = SemanticLLMCache(roles={"expansion": 0.9}, ttl_seconds=0)
+    cache.get_or_compute("expansion", "auth error", lambda: "first")
+    assert cache.get_or_compute("expansion", "auth error", lambda: "second") == "second"
+
+@patch("core.semantic_cache.vector_store")
+def test_async_search_query_rewrite_is_reused(mock_store):
+    from agent import nodes
+
+    mock_store.embedding_fn.side_effect = fake_embedding
+    cache = SemanticLLMCache(roles={"search_query": 0.8})
+
+    async def ainvoke(llm, messages, deadline=None):
+        return AIMessage(content="petstore list pets")
+
+    with patch.object(nodes, "semantic_llm_cache", cache), patch.object(nodes, "ainvoke_llm_safe", side_effect=ainvoke) as call, \
+         patch.object(nodes, "hybrid_retriever") as hybrid, patch.object(nodes, "_web_search", return_value="results"):
+        hybrid.search.return_value = {"documents": [], "ids": []}
+        for query in ("How can I list all the pets in the petstore", "how can i list all the pets in the petstore?"):
+            asyncio.run(nodes.aretrieve_node({"messages": [HumanMessage(content=query)], "deadline": None}))
+
+    assert call.call_count == 1
+    assert cache.stats()["search_query"]["hits"] == 1
@@ -1,15 +1,17 @@
 
 import pytest
+import threading
 from fastapi.testclient import TestClient
-from backend.main import app
-from backend.core.sessions import session_manager
+from main import app
+from core.sessions import session_manager
 
 client = TestClient(app)
 
 @pytest.fixture(autouse=True)
-def setup_teardown():
-    # Clear sessions before each test
-    session_manager._sessions = {}
+def setup_teardown(tmp_path, monkeypatch):
+    # Point the singleton at a fresh store for each test
+    monkeypatch.setattr(session_manager, "persistence_file", str(tmp_path / "sessions.db"))
+    session_manager._init_db()
     yield
 
 def test_create_session():
@@ -47,5 +49,175 @@ def test_session_history():
     assert history[0]["content"] == "Hello"
     assert history[1]["role"] == "assistant"
 
+def test_list_sessions_pagination():
+    created = [session_manager.create_session("pager") for _ in range(5)]
+    session_manager.create_session("someone_else")
+    session_manager.add_message(created[0].id, "user", "Hello")
+
+    response = client.get("/sessions/?user_id=pager&limit=2")
+    assert response.status_code == 200
+    page = response.json()
+    seen = [s["id"] for s in page]
+    stamps = [s["created_at"] for s in page]
+    cursor = response.headers.get("X-Next-Cursor")
+    while cursor:
+        response = client.get(f"/sessions/?user_id=pager&limit=2&cursor={cursor}")
+        page = response.json()
+        assert len(page) <= 2
+        seen.extend(s["id"] for s in page)
+        stamps.extend(s["created_at"] for s in page)
+        cursor = response.headers.get("X-Next-Cursor")
+
+    # Newest first, no duplicates or gaps, counts without bodies
+    assert sorted(seen) == sorted(s.id for s in created)
+    assert len(seen) == len(set(seen))
+    assert stamps == sorted(stamps, reverse=True)
+    counts = {s.id: s.message_count for s in session_manager.list_sessions("pager")}
+    assert counts[created[0].id] == 1
+
+def test_list_sessions_bad_cursor():
+    response = client.get("/sessions/?cursor=not-a-cursor")
+    assert response.status_code == 400
+
+def test_session_history_limit_before():
+    s = session_manager.create_session("long_chat")
+    for i in range(10):
+        session_manager.add_message(s.id, "user", f"msg {i}")
+
+    latest = client.get(f"/sessions/{s.id}/history?limit=3").json()
+    assert [m["content"] for m in latest] == ["msg 7", "msg 8", "msg 9"]
+
+    older = client.get(f"/sessions/{s.id}/history?limit=3&before={latest[0]['seq']}").json()
+    assert [m["content"] for m in older] == ["msg 4", "msg 5", "msg 6"]
+
+    assert client.get("/sessions/missing/history").status_code == 404
+
+def test_archive_expired_sessions():
+    import time
+    stale = session_manager.create_session("idle_user")
+    session_manager.add_message(stale.id, "user", "Old question")
+    fresh = session_manager.create_session("active_user")
+
+    # Pretend the stale session has been idle for two days
+    with session_manager._write() as conn:
+        conn.execute("UPDATE sessions SET updated_at = ? WHERE id = ?", (time.time() - 2 * 86400, stale.id))
+
+    assert session_manager.archive_expired(ttl_seconds=86400) == 1
+    assert session_manager.get_session(stale.id) is None
+    assert session_manager.get_session(fresh.id) is not None
+    assert list(session_manager.archive_dir.glob("*.jsonl.gz"))
+
+    # Archived history is still readable on demand
+    history = client.get(f"/sessions/{stale.id}/history").json()
+    assert [m["content"] for m in history] == ["Old question"]
+
+    # Resuming restores it to the live store
+    restored = session_manager.restore_session(stale.id)
+    assert restored is not None
+    session_manager.add_message(stale.id, "user", "Back again")
+    assert len(session_manager.get_history(stale.id)) == 2
+    assert session_manager.get_archived_session(stale.id) is None
+
+def test_archive_disabled_with_zero_ttl():
+    session_manager.create_session("someone")
+    assert session_manager.archive_expired(ttl_seconds=0) == 0
+
+def test_session_chat_stream_records_reply():
+    from unittest.mock import patch
+    s = session_manager.create_session("streamer")
+    with patch("api.sessions.session_graph") as mock_graph:
+        async def astream(inputs, config=None, stream_mode=None):
+            yield ("values", {"generated_code": "print(1)", "plan": "STATUS: READY"})
+        mock_graph.astream = astream
+        response = client.post(f"/sessions/{s.id}/chat/stream", json={"query": "Write code"})
+    assert response.status_code == 200
+    assert "event: result" in response.text
+    history = session_manager.get_history(s.id)
+    assert history == [
+        {"role": "user", "content": "Write code"},
+        {"role": "assistant", "content": "print(1)"},
+    ]
+
+def test_shed_session_chat_is_retried_without_duplicate_history():
+    from contextlib import asynccontextmanager
+    from unittest.mock import patch, AsyncMock
+    from core.admission import admission_controller
+    from core.exceptions import LLMOverloadedError, OverloadedError
+    s = session_manager.create_session("shed")
+    shed = LLMOverloadedError("groq/llama-3.3-70b-versatile rate budget exhausted; retry in 7s.", {"retry_after": 7, "model": "groq/llama-3.3-70b-versatile"})
+
+    @asynccontextmanager
+    async def queue_timeout(deadline=None):
+        raise OverloadedError("Timed out in the queue.", {"retry_after": 3})
+        yield
+
+    with patch("api.sessions.session_graph") as mock_graph:
+        mock_graph.ainvoke = AsyncMock(side_effect=[shed, {"generated_code": "ok", "plan": ""}])
+        with patch.object(admission_controller, "slot", queue_timeout):
+            assert client.post(f"/sessions/{s.id}/chat", json={"query": "Write code"}).status_code == 503
+        response = client.post(f"/sessions/{s.id}/chat", json={"query": "Write code"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "7"
+        assert session_manager.get_history(s.id) == []
+
+        # The client retries as told: the turn is stored once
+        assert client.post(f"/sessions/{s.id}/chat", json={"query": "Write code"}).status_code == 200
+    assert session_manager.get_history(s.id) == [
+        {"role": "user", "content": "Write code"},
+        {"role": "assistant", "content": "ok"},
+    ]
+
+def test_concurrent_add_message_no_lost_writes():
+    sessions = [session_manager.create_session(f"user{i}") for i in range(4)]
+    writers_per_session = 4
+    msgs_per_writer = 25
+
+    def writer(session_id, writer_idx):
+        for n in range(msgs_per_writer):
+            session_manager.add_message(session_id, "user", f"w{writer_idx}-m{n}")
+
+    threads = [
+        threading.Thread(target=writer, args=(s.id, w))
+        for s in sessions for w in range(writers_per_session)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for s in sessions:
+        history = session_manager.get_history(s.id)
+        assert len(history) == writers_per_session * msgs_per_writer
+        # Every message from every writer is present exactly once
+        contents = {m["content"] for m in history}
+        assert len(contents) == writers_per_session * msgs_per_writer
+
+def test_concurrent_writers_across_managers():
+    # Two managers on the same file behave like two processes (API + CLI)
+    from core.sessions import SessionManager
+    other = SessionManager(persistence_file=session_manager.persistence_file)
+    s = session_manager.create_session("shared")
+
+    def writer(manager, tag):
+        for n in range(30):
+            manager.add_message(s.id, "user", f"{tag}-{n}")
+
+    threads = [
+        threading.Thread(target=writer, args=(session_manager, "a")),
+        threading.Thread(target=writer, args=(other, "b")),
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(session_manager.get_history(s.id)) == 60
+
 # We skip testing the /chat endpoint fully because it invokes the real Agent Graph
 # which requires LLM keys and time. We assume integration tests cover that layer.
+
+def test_session_routes_share_the_app_singletons():
+    import main
+    import api.sessions
+    assert api.sessions.admission_controller is main.admission_controller
+    assert api.sessions.session_manager is main.session_manager
@@ -0,0 +1,75 @@
+import json
+import asyncio
+from typing import TypedDict
+from langgraph.graph import StateGraph, END
+from langchain_core.messages import HumanMessage
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from api.streaming import stream_graph_events, STREAM_TAG
+
+class State(TypedDict):
+    plan: str
+    summary: str
+
+def build_graph(llm):
+    def plan(state):
+        # Untagged call (e.g. history summary) must not leak into the stream
+        summary = llm.invoke([HumanMessage(content="summarize")]).content
+        response = llm.with_config(tags=[STREAM_TAG]).invoke([HumanMessage(content="plan")])
+        return {"plan": response.content, "summary": summary}
+
+    workflow = StateGraph(State)
+    workflow.add_node("plan", plan)
+    workflow.set_entry_point("plan")
+    workflow.add_edge("plan", END)
+    return workflow.compile()
+
+def test_stream_forwards_tagged_tokens_only():
+    llm = GenericFakeChatModel(messages=iter(["hidden summary", "step one"]))
+    graph = build_graph(llm)
+
+    async def collect():
+        return [
+            chunk async for chunk in
+            stream_graph_events(graph, {"plan": "", "summary": ""}, lambda s: {"plan": s["plan"]})
+        ]
+
+    events = []
+    for chunk in asyncio.run(collect()):
+        lines = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+
+    tokens = "".join(d["token"] for e, d in events if e == "plan_token")
+    assert tokens == "step one"
+    assert ("node", {"node": "plan"}) in events
+    assert events[-1] == ("result", {"plan": "step one"})
+
+def test_language_branch_tokens_carry_language_and_restart():
+    class BranchState(TypedDict):
+        code: str
+
+    llm = GenericFakeChatModel(messages=iter(["first try", "second try"]))
+
+    def generate_language(state):
+        tagged = llm.with_config(tags=[STREAM_TAG, "language:C#"])
+        tagged.invoke([HumanMessage(content="write")])
+        return {"code": tagged.invoke([HumanMessage(content="rewrite")]).content}
+
+    workflow = StateGraph(BranchState)
+    workflow.add_node("generate_language", generate_language)
+    workflow.set_entry_point("generate_language")
+    workflow.add_edge("generate_language", END)
+    graph = workflow.compile()
+
+    async def collect():
+        return [chunk async for chunk in stream_graph_events(graph, {"code": ""}, lambda s: {})]
+
+    tokens = []
+    for chunk in asyncio.run(collect()):
+        lines = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+        if lines["event"] == "code_token":
+            tokens.append(json.loads(lines["data"]))
+
+    assert all(t["language"] == "C#" for t in tokens)
+    restarts = [i for i, t in enumerate(tokens) if t.get("restart")]
+    assert len(restarts) == 1
+    assert "".join(t["token"] for t in tokens[restarts[0]:]) == "second try"
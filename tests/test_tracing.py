@@ -0,0 +1,87 @@
+import asyncio
+from unittest.mock import patch, AsyncMock
+from langchain_core.messages import HumanMessage, AIMessage
+from core.tracing import request_trace, span, traced, Histogram, TraceStats, trace_stats
+
+def test_histogram_buckets_and_quantile():
+    histogram = Histogram(buckets=(0.1, 1.0, 10.0))
+    for value in (0.05, 0.5, 0.5, 5.0, 50.0):
+        histogram.observe(value)
+
+    cumulative, total, count = histogram.snapshot()
+    assert cumulative == [1, 3, 4, 5]
+    assert count == 5 and abs(total - 56.05) < 1e-9
+    assert histogram.quantile(0.5) == 1.0
+    assert histogram.quantile(0.95) == 10.0 # +Inf reports the last finite bound
+
+def test_spans_are_attributed_to_the_current_node():
+    @traced("node", "plan", stage=True)
+    async def plan_node():
+        with span("llm", "llama") as llm:
+            llm.set(prompt_tokens=100, completion_tokens=20, retries=1)
+        await asyncio.sleep(0.01)
+
+    stats = TraceStats()
+    with patch("core.tracing.trace_stats", stats), request_trace() as trace:
+        asyncio.run(plan_node())
+
+    llm_span, node_span = trace.spans
+    assert llm_span.stage == "plan" and node_span.name == "plan"
+    assert node_span.duration >= 0.01
+    summary = trace.summary()
+    assert summary["llm"] == {"calls": 1, "prompt_tokens": 100, "completion_tokens": 20, "retries": 1}
+    # LLM latency and tokens are aggregated per node
+    assert stats.tokens == {"plan": {"prompt": 100, "completion": 20}}
+    assert stats.summary()["latency"]["llm:plan"]["count"] == 1
+
+class FlakyLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        if self.calls == 1:
+            raise RuntimeError("429")
+        return AIMessage(content="PASS", usage_metadata={"input_tokens": 42, "output_tokens": 1, "total_tokens": 43})
+
+def test_llm_call_records_tokens_and_retries():
+    from core.resilience import global_circuit_breaker
+    from agent import nodes
+
+    global_circuit_breaker.failures = 0
+    global_circuit_breaker.state = "CLOSED"
+    with patch.object(nodes._invoke_llm.retry, "sleep", lambda seconds: None), request_trace() as trace:
+        nodes.invoke_llm_safe(FlakyLLM(), [HumanMessage(content="Review")])
+
+    (llm_span,) = trace.spans
+    assert llm_span.kind == "llm"
+    assert llm_span.attrs == {"retries": 1, "prompt_tokens": 42, "completion_tokens": 1}
+
+def test_cache_lookups_are_traced():
+    from core.cache import CoalescingTTLCache
+
+    cache = CoalescingTTLCache(name="web_search")
+    with request_trace() as trace:
+        cache.get_or_compute("q", lambda: "result")
+        cache.get_or_compute("q", lambda: "result")
+
+    assert trace.summary()["cache"] == {"web_search": {"hits": 1, "misses": 1}}
+
+def test_chat_returns_trace_on_request():
+    from fastapi.testclient import TestClient
+    from main import app
+
+    async def fake_run(inputs):
+        with span("node", "plan"):
+            pass
+        return {"generated_code": "print('hi')", "plan": "STATUS: READY"}
+
+    with patch("main.app_graph") as mock_graph:
+        mock_graph.ainvoke = AsyncMock(side_effect=fake_run)
+        client = TestClient(app)
+        traced_response = client.post("/chat", json={"query": "List pets", "trace": True}).json()
+        plain_response = client.post("/chat", json={"query": "List pets"}).json()
+
+    assert [s["name"] for s in traced_response["trace"]["spans"]] == ["admission", "plan"]
+    assert "plan" in traced_response["trace"]["summary"]["node_ms"]
+    assert "trace" not in plain_response
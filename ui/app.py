@@ -1,9 +1,10 @@
 import chainlit as cl
-import requests
+import httpx
 import json
 
 # Backend URL
 API_URL = "http://localhost:8000/chat"
+STREAM_URL = "http://localhost:8000/chat/stream"
 
 @cl.on_chat_start
 async def start():
@@ -11,38 +12,84 @@ async def start():
         content="👋 **Enterprise API Assistant** is ready!\n\nI can help you:\n1. Find API documentation locally.\n2. Create an implementation plan.\n3. Generate Python/Node.js code."
     ).send()
 
+async def iter_sse(response):
+    """Yields (event, data) pairs from a Server-Sent Events response."""
+    event, data = "message", []
+    async for line in response.aiter_lines():
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
 @cl.on_message
 async def main(message: cl.Message):
-    # Call the Backend API
+    # Call the Backend API (streamed, so progress shows up immediately)
     try:
         payload = {"query": message.content}
         
-        # Stream "Thinking" status
         msg = cl.Message(content="")
         await msg.send()
         
-        # Send Request
-        response = requests.post(API_URL, json=payload, stream=False)
+        plan_step = cl.Step(name="Architect Plan", type="run")
+        plan_started = False
+        language_code = {}
+        result = None
         
-        if response.status_code == 200:
-            data = response.json()
-            
-            plan = data.get("plan", "No plan generated.")
-            code = data.get("response", "# No code generated.")
-            context = data.get("context", [])
-            
-            # 1. Show the Plan (Reasoning)
-            async with cl.Step(name="Architect Plan", type="run") as step:
-                step.output = plan
-            
-            # 2. Show the Sources
-            if context:
-                source_text = "\n".join([f"- {doc[:100]}..." for doc in context[:3]])
-                async with cl.Step(name="Retrieved Context", type="tool") as step:
-                    step.output = source_text
+        async with httpx.AsyncClient(timeout=None) as client:
+            async with client.stream("POST", STREAM_URL, json=payload) as response:
+                if response.status_code != 200:
+                    await cl.Message(content=f"❌ Error: Backend returned {response.status_code}").send()
+                    return
+                
+                async for event, data in iter_sse(response):
+                    if event == "node":
+                        if data["node"] == "validate" and not data.get("passed"):
+                            # The code will be rewritten; restart the live preview
+                            msg.content = ""
+                            await msg.update()
+                    elif event == "plan_token":
+                        if not plan_started:
+                            await plan_step.send()
+                            plan_started = True
+                        await plan_step.stream_token(data["token"])
+                    elif event == "code_token":
+                        language = data.get("language")
+                        if language:
+                            # Parallel per-language branches: keep one live section per language
+                            if data.get("restart"):
+                                language_code[language] = ""
+                            language_code[language] = language_code.get(language, "") + data["token"]
+                            msg.content = "\n\n".join(f"### {lang}\n{code}" for lang, code in language_code.items())
+                            await msg.update()
+                        else:
+                            await msg.stream_token(data["token"])
+                    elif event == "result":
+                        result = data
+                    elif event == "error":
+                        await cl.Message(content=f"❌ Error: {data.get('detail')}").send()
+                        return
+        
+        if plan_started:
+            await plan_step.update()
+        if result is None:
+            return
             
-            # 3. Final Code Output
-            msg.content = f"""
+        plan = result.get("plan", "No plan generated.")
+        code = result.get("response", "# No code generated.")
+        context = result.get("context", [])
+        
+        # 2. Show the Sources
+        if context:
+            source_text = "\n".join([f"- {doc[:100]}..." for doc in context[:3]])
+            async with cl.Step(name="Retrieved Context", type="tool") as step:
+                step.output = source_text
+        
+        # 3. Final Code Output (validated result replaces the live preview)
+        msg.content = f"""
 ### 🏗️ Implementation Plan
 {plan}
 
@@ -51,10 +98,7 @@ async def main(message: cl.Message):
 {code}
 ```
 """
-            await msg.update()
-            
-        else:
-            await cl.Message(content=f"❌ Error: Backend returned {response.status_code}").send()
+        await msg.update()
             
     except Exception as e:
         await cl.Message(content=f"❌ Connection Error: Is the backend running on port 8000? \nDetails: {str(e)}").send()